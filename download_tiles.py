@@ -1,11 +1,25 @@
-''' Dowload used map tiles.
+''' Dowload (prefetch) used map tiles into a tile store (see tilestore.py).
+    Tiles are fetched by a small pool of workers, with a global rate limit.
+    Tiles already in the store are skipped, so an interrupted run can be resumed.
+    Examples:
+        python download_tiles.py --max-zoom 2
+        python download_tiles.py --bbox 57.5 10.5 60.0 19.0 --min-zoom 3 --max-zoom 9
+        python download_tiles.py --route 59.3,18.1 57.7,11.9 --buffer-nm 20 --max-zoom 10
     © August Linnman, 2025, email: august@linnman.net
     MIT License (see LICENSE file)
 
 '''
-import os
 import time
-import requests
+import threading
+import argparse
+from math import pi, log, tan, cos, radians
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from types import NoneType
+
+from tilestore import MBTilesStore
 
 # Alternative tile sources
 # pylint: disable=C0301
@@ -13,7 +27,7 @@ tile_sources = {
     'stamen_terrain': 'https://stamen-tiles.a.ssl.fastly.net/terrain/{z}/{x}/{y}.png',
     'cartodb_positron': 'https://cartodb-basemaps.global.ssl.fastly.net/light_all/{z}/{x}/{y}.png',
     'opentopomap': 'https://tile.opentopomap.org/{z}/{x}/{y}.png',
-    'esri_world': 
+    'esri_world':
     'https://server.arcgisonline.com/ArcGIS/rest/services/World_Street_Map/MapServer/tile/{z}/{y}/{x}',
     'usgs':'https://basemap.nationalmap.gov/arcgis/rest/services/USGSImageryOnly/MapServer/tile/{z}/{y}/{x}'
 }
@@ -23,48 +37,261 @@ CHOSEN_TILES = 'usgs'
 # NOTE: The USGS data is *public domain* and can be freely used.
 # You are strongly advised to check legal requirements before using *any*
 # other map data source for the Celeste app.
+TILES_ATTRIBUTION = 'Map data courtesy of U.S. Geological Survey'
+
+USER_AGENT = "celestial-navigation tile prefetcher"
+
+# Web Mercator limit
+MAX_LATITUDE = 85.0511
+
+################################################
+# Tile selection
+################################################
+
+def tile_for_position (lat : float, lon : float, zoom : int) -> tuple [int, int]:
+    ''' Returns the (x, y) of the tile containing a position '''
+    n = 1 << zoom
+    lat = max (-MAX_LATITUDE, min (MAX_LATITUDE, lat))
+    x = int ((lon + 180) / 360 * n) % n
+    y = int ((1 - log (tan (radians (lat)) + 1 / cos (radians (lat))) / pi) / 2 * n)
+    return x, max (0, min (n - 1, y))
+
+def tiles_for_bbox (south : float, west : float, north : float, east : float,
+                    min_zoom : int, max_zoom : int) -> Iterable [tuple [int, int, int]]:
+    ''' Returns the tiles (z, x, y) covering a bounding box, for a range of zoom levels.
+        The box may cross the date line (west > east). '''
+    for z in range (min_zoom, max_zoom + 1):
+        x_0, y_0 = tile_for_position (north, west, z)
+        x_1, y_1 = tile_for_position (south, east, z)
+        n = 1 << z
+        x_count = (x_1 - x_0) % n + 1
+        if west > east and x_count == 1 and n > 1:
+            x_count = n
+        for i in range (x_count):
+            for y in range (y_0, y_1 + 1):
+                yield z, (x_0 + i) % n, y
+
+def tiles_for_route (waypoints : list [tuple [float, float]], buffer_nm : float,
+                     min_zoom : int, max_zoom : int) -> set [tuple [int, int, int]]:
+    ''' Returns the tiles (z, x, y) within buffer_nm of a route (a list of (lat, lon)),
+        for a range of zoom levels. Legs are interpolated in latitude/longitude
+        (the shorter way in longitude, across the date line if needed). '''
+    tiles = set [tuple [int, int, int]] ()
+    if len (waypoints) == 1:
+        waypoints = waypoints * 2
+    for (lat_0, lon_0), (lat_1, lon_1) in zip (waypoints [:-1], waypoints [1:]):
+        # The shorter way in longitude (across the date line if needed)
+        lon_diff = (lon_1 - lon_0 + 180) % 360 - 180
+        # Steps (degrees) not longer than the buffer, so the buffered boxes overlap
+        steps = max (1, int (max (abs (lat_1 - lat_0), abs (lon_diff)) * 60 /
+                             max (buffer_nm, 1)) + 1)
+        for i in range (steps + 1):
+            lat = lat_0 + (lat_1 - lat_0) * i / steps
+            lon = (lon_0 + lon_diff * i / steps + 180) % 360 - 180
+            d_lat = buffer_nm / 60
+            d_lon = d_lat / max (cos (radians (lat)), 0.01)
+            tiles.update (tiles_for_bbox (lat - d_lat, (lon - d_lon + 180) % 360 - 180,
+                                          lat + d_lat, (lon + d_lon + 180) % 360 - 180,
+                                          min_zoom, max_zoom))
+    return tiles
+
+################################################
+# Downloading
+################################################
+
+class RateLimiter:
+    ''' A token bucket limiting the request rate (shared by all workers) '''
+
+    def __init__ (self, rate_per_second : float, burst : int = 1):
+        self.__rate = rate_per_second
+        self.__burst = burst
+        self.__tokens = float (burst)
+        self.__updated = time.monotonic ()
+        self.__lock = threading.Lock ()
+
+    def acquire (self):
+        ''' Wait for the next request slot '''
+        while True:
+            with self.__lock:
+                now = time.monotonic ()
+                self.__tokens = min (self.__burst,
+                                     self.__tokens + (now - self.__updated) * self.__rate)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                delay = (1 - self.__tokens) / self.__rate
+            time.sleep (delay)
+
+#pylint: disable=R0902
+class TilePrefetcher:
+    ''' Downloads tiles into a tile store, with a bounded pool of workers and a rate limit.
+        Tiles already in the store are skipped (resume). '''
 
-def download_world_tiles(max_zoom=2,
-                         base_url=tile_sources[CHOSEN_TILES],
-                         output_dir="tiles"):
-    """Download world tiles up to specified zoom level"""
+#pylint: disable=R0913
+#pylint: disable=R0917
+    def __init__ (self, store : MBTilesStore, base_url : str = tile_sources [CHOSEN_TILES],
+                  workers : int = 4, rate_per_second : float = 2.0, timeout : float = 10,
+                  retries : int = 2, batch_size : int = 50):
+        ''' Parameters:
+                store           : the tile store (opened with read_only=False)
+                base_url        : tile URL with {z}, {x} and {y}
+                workers         : number of concurrent downloads
+                rate_per_second : maximum number of requests per second (all workers)
+                retries         : number of retries for a failed tile
+                batch_size      : number of tiles written to the store in one transaction
+        '''
+        self.__store = store
+        self.__base_url = base_url
+        self.__workers = workers
+        self.__limiter = RateLimiter (rate_per_second, burst=workers)
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__batch_size = batch_size
+        self.__stopped = threading.Event ()
+#pylint: enable=R0913
+#pylint: enable=R0917
 
-    total_size = 0
-    tile_count = 0
+    def stop (self):
+        ''' Stop a running prefetch (tiles already downloaded are kept) '''
+        self.__stopped.set ()
 
-    for zoom in range(0, max_zoom + 1):
-        max_tiles = 2 ** zoom  # Number of tiles per dimension
+    def fetch_tile (self, z : int, x : int, y : int) -> bytes | NoneType:
+        ''' Download one tile. Returns None if the tile is not available. '''
+        url = self.__base_url.format (z=z, x=x, y=y)
+        for attempt in range (self.__retries + 1):
+            self.__limiter.acquire ()
+            try:
+                with urlopen (Request (url, headers={"User-Agent" : USER_AGENT}),
+                              timeout=self.__timeout) as response:
+                    return response.read ()
+            except HTTPError as he:
+                if he.code == 404:
+                    return None
+                if attempt == self.__retries:
+                    raise he
+            except OSError as ose:
+                if attempt == self.__retries:
+                    raise ose
+            time.sleep (0.5 * 2 ** attempt)
+        return None
 
-        for x in range(max_tiles):
-            for y in range(max_tiles):
-                tile_url = base_url.format(z=zoom, x=x, y=y)
-                tile_path = f"{output_dir}/{zoom}/{x}/{y}.png"
+#pylint: disable=R0912
+#pylint: disable=R0914
+    def prefetch (self, tiles : Iterable [tuple [int, int, int]],
+                  max_bytes : int | NoneType = None,
+                  progress : Callable [[dict], None] | NoneType = None) -> dict [str, int]:
+        ''' Download the tiles (z, x, y) not already in the store.
+            Stops when max_bytes have been downloaded (if given).
+            progress is called with the statistics after each stored batch.
+            Returns the statistics (downloaded, skipped, missing, failed, bytes). '''
+        stats = {"downloaded" : 0, "skipped" : 0, "missing" : 0, "failed" : 0, "bytes" : 0}
+        self.__stopped.clear ()
+        batch = list [tuple [int, int, int, bytes]] ()
+        pending = {}
+        tile_iterator = iter (tiles)
 
-                os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+        def store_batch ():
+            self.__store.put_tiles (batch)
+            batch.clear ()
+            if progress is not None:
+                progress (dict (stats))
 
-                try:
-                    response = requests.get(tile_url, timeout=1)
-                    if response.status_code == 200:
-                        with open(tile_path, 'wb') as f:
-                            f.write(response.content)
+        with ThreadPoolExecutor (max_workers=self.__workers) as executor:
+            exhausted = False
+            while True:
+                # Keep a bounded number of downloads in flight
+                while not exhausted and not self.__stopped.is_set () and\
+                        len (pending) < 2 * self.__workers:
+                    tile = next (tile_iterator, None)
+                    if tile is None:
+                        exhausted = True
+                    elif self.__store.has_tile (*tile):
+                        stats ["skipped"] += 1
+                    else:
+                        pending [executor.submit (self.fetch_tile, *tile)] = tile
+                if len (pending) == 0:
+                    break
+                done, _ = wait (pending.keys (), return_when=FIRST_COMPLETED)
+                for future in done:
+                    z, x, y = pending.pop (future)
+                    try:
+                        data = future.result ()
+#pylint: disable=W0718
+                    except Exception as e:
+#pylint: enable=W0718
+                        print (f"Error downloading {z}/{x}/{y}: {e}")
+                        stats ["failed"] += 1
+                        continue
+                    if data is None:
+                        stats ["missing"] += 1
+                        continue
+                    batch.append ((z, x, y, data))
+                    stats ["downloaded"] += 1
+                    stats ["bytes"] += len (data)
+                    if max_bytes is not None and stats ["bytes"] >= max_bytes:
+                        self.__stopped.set ()
+                if len (batch) >= self.__batch_size:
+                    store_batch ()
+        store_batch ()
+        return stats
+#pylint: enable=R0912
+#pylint: enable=R0914
+#pylint: enable=R0902
 
-                        file_size = len(response.content)
-                        total_size += file_size
-                        tile_count += 1
+def prefetch_tiles (file_name : str, tiles : Iterable [tuple [int, int, int]],
+                    base_url : str = tile_sources [CHOSEN_TILES], **kwargs) -> dict [str, int]:
+    ''' Prefetch tiles into an MBTiles file (created if needed).
+        Other keyword arguments are passed to TilePrefetcher and prefetch. '''
+    store = MBTilesStore (file_name, read_only=False)
+    max_bytes = kwargs.pop ("max_bytes", None)
+    progress = kwargs.pop ("progress", None)
+    try:
+        stats = TilePrefetcher (store, base_url, **kwargs).prefetch\
+            (tiles, max_bytes=max_bytes, progress=progress)
+        if store.get_metadata ("name") is None:
+            store.set_metadata ("name", "Offline tiles")
+            store.set_metadata ("type", "baselayer")
+            store.set_metadata ("attribution", TILES_ATTRIBUTION)
+        store.set_metadata ("format", "png")
+    finally:
+        store.close ()
+    return stats
 
-                        print(f"Downloaded {zoom}/{x}/{y}.png ({file_size} bytes)")
+def main ():
+    ''' Command line interface '''
+    parser = argparse.ArgumentParser (description="Prefetch map tiles into a tile store")
+    parser.add_argument ("--output", default="tiles.mbtiles", help="MBTiles file")
+    parser.add_argument ("--source", default=CHOSEN_TILES, choices=tile_sources.keys ())
+    parser.add_argument ("--url", help="tile URL with {z}, {x} and {y} (overrides --source)")
+    parser.add_argument ("--bbox", nargs=4, type=float, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    parser.add_argument ("--route", nargs="+", metavar="LAT,LON", help="waypoints of a route")
+    parser.add_argument ("--buffer-nm", type=float, default=10, help="width of the route corridor")
+    parser.add_argument ("--min-zoom", type=int, default=0)
+    parser.add_argument ("--max-zoom", type=int, default=2)
+    parser.add_argument ("--workers", type=int, default=4)
+    parser.add_argument ("--rate", type=float, default=2.0, help="maximum requests per second")
+    parser.add_argument ("--max-mb", type=float, help="stop after downloading this much")
+    args = parser.parse_args ()
 
-                        if total_size > 1024 * 1024:  # 1MB limit
-                            print(f"Reached 1MB limit with {tile_count} tiles")
-                            return
+    if args.route is not None:
+        waypoints = [tuple (float (v) for v in w.split (",")) for w in args.route]
+        tiles = sorted (tiles_for_route (waypoints, args.buffer_nm, args.min_zoom, args.max_zoom))
+    elif args.bbox is not None:
+        tiles = tiles_for_bbox (*args.bbox, args.min_zoom, args.max_zoom)
+    else:
+        tiles = tiles_for_bbox (-MAX_LATITUDE, -180, MAX_LATITUDE, 180 - 10**-9,
+                                args.min_zoom, args.max_zoom)
 
-                    time.sleep(0.5)  # Be respectful
-# pylint: disable=W0718
-                except Exception as e:
-                    print(f"Error downloading {zoom}/{x}/{y}: {e}")
-# pylint: enable=W0718
+    def show_progress (stats : dict):
+        print (f"Downloaded {stats ['downloaded']} tiles ({stats ['bytes']/1024:.1f}KB), " +\
+               f"skipped {stats ['skipped']}, failed {stats ['failed']}")
 
-    print(f"Downloaded {tile_count} tiles, total size: {total_size/1024:.1f}KB")
+    stats = prefetch_tiles (args.output, tiles, args.url or tile_sources [args.source],
+                            workers=args.workers, rate_per_second=args.rate,
+                            max_bytes=int (args.max_mb * 1024 * 1024) if args.max_mb else None,
+                            progress=show_progress)
+    show_progress (stats)
 
-# Usage
-download_world_tiles(max_zoom=2)
+if __name__ == '__main__':
+    main ()
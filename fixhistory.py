@@ -0,0 +1,252 @@
+''' History of sight reductions (fixes), stored in an SQLite file.
+    Each reduction is recorded with its inputs, the fix, fitness, accuracy and timing.
+    The fixes are indexed by time (for tracks) and by a grid cell (for finding fixes
+    near a position), so queries stay fast for many years of fixes.
+    Tracks are exported (streamed, without loading all fixes) as GPX or GeoJSON.
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+import json
+import sqlite3
+import threading
+from math import cos, floor
+from datetime import datetime, timezone
+from collections.abc import Iterable, Iterator
+from types import NoneType
+from typing import NamedTuple, TextIO
+from xml.sax.saxutils import escape
+
+from starfix import LatLon, LatLonGeocentric, LatLonGeodetic, SightCollection, \
+     distance_matrix, deg_to_rad
+
+# Size (degrees) of the grid cells used for the spatial index
+CELL_SIZE = 0.5
+# Number of rows (of cells) above which a "near" query uses the latitude index instead
+MAX_CELL_ROWS = 60
+
+class FixRecord (NamedTuple):
+    ''' A recorded sight reduction. The position is None for a failed reduction. '''
+    id         : int
+    time       : datetime
+    lat        : float | NoneType
+    lon        : float | NoneType
+    fitness    : float | NoneType
+    sigma_nm   : float | NoneType
+    duration   : float | NoneType
+    iterations : int | NoneType
+    success    : bool
+    inputs     : dict | NoneType
+    message    : str
+
+def get_cell (lat : float, lon : float) -> int:
+    ''' Returns the grid cell (spatial index key) of a position '''
+    cols = round (360 / CELL_SIZE)
+    row = min (round (180 / CELL_SIZE) - 1, floor ((lat + 90) / CELL_SIZE))
+    col = floor (((lon + 180) % 360) / CELL_SIZE) % cols
+    return row * cols + col
+
+def _get_cell_ranges (lat : float, lon : float, radius_nm : float) -> \
+        list [tuple [int, int]] | NoneType:
+    ''' Returns ranges (first, last) of the grid cells within radius_nm of a position,
+        or None if a query on the cells would not be selective '''
+    rows = round (180 / CELL_SIZE)
+    cols = round (360 / CELL_SIZE)
+    dlat = radius_nm / 60
+    lat_min, lat_max = max (-90, lat - dlat), min (90, lat + dlat)
+    first_row = floor ((lat_min + 90) / CELL_SIZE)
+    last_row = min (rows - 1, floor ((lat_max + 90) / CELL_SIZE))
+    if last_row - first_row + 1 > MAX_CELL_ROWS:
+        return None
+    max_abs_lat = max (abs (lat_min), abs (lat_max))
+    if max_abs_lat >= 89.9 or dlat / cos (deg_to_rad (max_abs_lat)) >= 180:
+        first_col, col_count = 0, cols
+    else:
+        dlon = dlat / cos (deg_to_rad (max_abs_lat))
+        first_col = floor (((lon - dlon + 180) % 360) / CELL_SIZE) % cols
+        col_count = min (cols, floor (2 * dlon / CELL_SIZE) + 2)
+    ranges = []
+    for row in range (first_row, last_row + 1):
+        if first_col + col_count <= cols:
+            ranges.append ((row * cols + first_col, row * cols + first_col + col_count - 1))
+        else:
+            # Across the date line
+            ranges.append ((row * cols + first_col, row * cols + cols - 1))
+            ranges.append ((row * cols, row * cols + first_col + col_count - cols - 1))
+    return ranges
+
+def _to_timestamp (t : datetime) -> float:
+    ''' Seconds since the epoch. A time without time zone is taken as UTC '''
+    if t.tzinfo is None:
+        t = t.replace (tzinfo=timezone.utc)
+    return t.timestamp ()
+
+def get_fix_time (collection : SightCollection) -> datetime:
+    ''' Returns the time of a fix (the time of the latest sight) '''
+    return max (s.get_time () for s in collection.get_sf_list ())
+
+_COLUMNS = "id, time, lat, lon, fitness, sigma_nm, duration, iterations, success, inputs, message"
+
+def _to_record (row : tuple) -> FixRecord:
+    ''' Convert a row (see _COLUMNS) into a FixRecord '''
+    return FixRecord (row [0], datetime.fromtimestamp (row [1], timezone.utc), row [2], row [3],
+                      row [4], row [5], row [6], row [7], bool (row [8]),
+                      json.loads (row [9]) if row [9] is not None else None, row [10] or "")
+
+class FixHistory:
+    ''' The fix history (an SQLite file). Safe to use from several threads. '''
+
+    def __init__ (self, file_name : str):
+        self.__file_name = file_name
+        self.__lock = threading.Lock ()
+        self.__connection = sqlite3.connect (file_name, check_same_thread=False)
+        # Appends don't block readers, and are safe at a crash
+        self.__connection.execute ("PRAGMA journal_mode=WAL")
+        self.__connection.executescript (
+            "CREATE TABLE IF NOT EXISTS fixes (id INTEGER PRIMARY KEY, time REAL NOT NULL," +\
+            " lat REAL, lon REAL, cell INTEGER, fitness REAL, sigma_nm REAL, duration REAL," +\
+            " iterations INTEGER, success INTEGER NOT NULL, inputs TEXT, message TEXT);" +\
+            "CREATE INDEX IF NOT EXISTS fix_time ON fixes (time);" +\
+            "CREATE INDEX IF NOT EXISTS fix_cell ON fixes (cell, time);" +\
+            "CREATE INDEX IF NOT EXISTS fix_lat ON fixes (lat);")
+
+    def get_file_name (self) -> str:
+        ''' Returns the name of the SQLite file '''
+        return self.__file_name
+
+#pylint: disable=R0913
+#pylint: disable=R0917
+    def record (self, fix : LatLon | NoneType, fix_time : datetime | NoneType = None,
+                fitness : float | NoneType = None, sigma_nm : float | NoneType = None,
+                duration : float | NoneType = None, iterations : int | NoneType = None,
+                inputs : dict | NoneType = None, message : str = "") -> int:
+        ''' Record a sight reduction. Use None as fix for a failed reduction.
+            Parameters:
+                fix_time    : time of the fix (default is now)
+                fitness     : fitness of the fix (see SightCollection.get_intersections)
+                sigma_nm    : estimated accuracy (nautical miles)
+                duration    : time (seconds) used for the reduction
+                iterations  : number of iterations of the reduction
+                inputs      : the input data (such as the form data of the app)
+            Returns the id of the record. '''
+        if isinstance (fix, LatLonGeocentric):
+            fix = LatLonGeodetic (ll = fix)
+        lat = fix.get_lat () if fix is not None else None
+        lon = fix.get_lon () if fix is not None else None
+        t = _to_timestamp (fix_time) if fix_time is not None else \
+            datetime.now (timezone.utc).timestamp ()
+        with self.__lock:
+            with self.__connection:
+                cursor = self.__connection.execute (
+                    "INSERT INTO fixes (time, lat, lon, cell, fitness, sigma_nm, duration," +\
+                    " iterations, success, inputs, message)" +\
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (t, lat, lon, get_cell (lat, lon) if fix is not None else None,
+                     fitness, sigma_nm, duration, iterations, int (fix is not None),
+                     json.dumps (inputs) if inputs is not None else None, message))
+            return cursor.lastrowid
+#pylint: enable=R0913
+#pylint: enable=R0917
+
+    def __query (self, sql : str, parameters : tuple, batch_size : int) -> Iterator [FixRecord]:
+        with self.__lock:
+            cursor = self.__connection.execute (sql, parameters)
+            rows = cursor.fetchmany (batch_size)
+        while len (rows) > 0:
+            for row in rows:
+                yield _to_record (row)
+            with self.__lock:
+                rows = cursor.fetchmany (batch_size)
+
+    def get_track (self, start : datetime | NoneType = None, end : datetime | NoneType = None,
+                   include_failed : bool = False, batch_size : int = 500) -> Iterator [FixRecord]:
+        ''' Returns the fixes between start and end (included), ordered by time.
+            The fixes are read in batches while iterating. '''
+        sql = "SELECT " + _COLUMNS + " FROM fixes WHERE time >= ? AND time <= ?"
+        if not include_failed:
+            sql += " AND success = 1"
+        return self.__query (sql + " ORDER BY time, id",
+                             (_to_timestamp (start) if start is not None else float ("-inf"),
+                              _to_timestamp (end) if end is not None else float ("inf")),
+                             batch_size)
+
+    def get_fixes_near (self, position : LatLon, radius_nm : float,
+                        start : datetime | NoneType = None, end : datetime | NoneType = None) \
+                        -> list [tuple [FixRecord, float]]:
+        ''' Returns the fixes within radius_nm of a position, with the distances
+            (nautical miles), nearest first '''
+        if isinstance (position, LatLonGeocentric):
+            position = LatLonGeodetic (ll = position)
+        lat, lon = position.get_lat (), position.get_lon ()
+        ranges = _get_cell_ranges (lat, lon, radius_nm)
+        if ranges is not None:
+            where = "(" + " OR ".join (["cell BETWEEN ? AND ?"] * len (ranges)) + ")"
+            parameters = [c for r in ranges for c in r]
+        else:
+            where = "lat BETWEEN ? AND ?"
+            parameters = [lat - radius_nm / 60, lat + radius_nm / 60]
+        where += " AND success = 1 AND time >= ? AND time <= ?"
+        parameters += [_to_timestamp (start) if start is not None else float ("-inf"),
+                       _to_timestamp (end) if end is not None else float ("inf")]
+        candidates = list (self.__query ("SELECT " + _COLUMNS + " FROM fixes WHERE " + where,
+                                         tuple (parameters), 500))
+        if len (candidates) == 0:
+            return []
+        distances = distance_matrix ([LatLonGeodetic (lat, lon)],
+                                     [LatLonGeodetic (r.lat, r.lon) for r in candidates],
+                                     nautical_miles=True) [0]
+        near = [(r, d) for r, d in zip (candidates, distances) if d <= radius_nm]
+        near.sort (key=lambda x: x [1])
+        return near
+
+    def count_fixes (self) -> int:
+        ''' Returns the number of recorded reductions '''
+        with self.__lock:
+            return self.__connection.execute ("SELECT COUNT(*) FROM fixes").fetchone () [0]
+
+    def close (self):
+        ''' Close the file '''
+        with self.__lock:
+            self.__connection.close ()
+
+def __format_time (t : datetime) -> str:
+    ''' Format a time as in GPX (UTC) '''
+    return t.astimezone (timezone.utc).strftime ("%Y-%m-%dT%H:%M:%SZ")
+
+def write_gpx (records : Iterable [FixRecord], f : TextIO, name : str = "Celeste track"):
+    ''' Write fixes as a GPX track. The records are written as they are read. '''
+    f.write ('<?xml version="1.0" encoding="UTF-8"?>\n' +\
+             '<gpx version="1.1" creator="Celeste" xmlns="http://www.topografix.com/GPX/1/1">\n' +\
+             '<trk><name>' + escape (name) + '</name><trkseg>\n')
+    for r in records:
+        if r.lat is None:
+            continue
+        f.write (f'<trkpt lat="{r.lat:.6f}" lon="{r.lon:.6f}"><time>' +\
+                 __format_time (r.time) + '</time></trkpt>\n')
+    f.write ('</trkseg></trk>\n</gpx>\n')
+
+def write_geojson (records : Iterable [FixRecord], f : TextIO):
+    ''' Write fixes as a GeoJSON FeatureCollection of points (with time, fitness
+        and accuracy). The records are written as they are read. '''
+    f.write ('{"type":"FeatureCollection","features":[\n')
+    first = True
+    for r in records:
+        if r.lat is None:
+            continue
+        feature = {"type" : "Feature",
+                   "geometry" : {"type" : "Point",
+                                 "coordinates" : [round (r.lon, 6), round (r.lat, 6)]},
+                   "properties" : {"id" : r.id, "time" : __format_time (r.time),
+                                   "fitness" : r.fitness, "sigma_nm" : r.sigma_nm}}
+        f.write (("" if first else ",\n") + json.dumps (feature, separators=(",", ":")))
+        first = False
+    f.write ('\n]}\n')
+
+def export_track (history : FixHistory, file_name : str, start : datetime | NoneType = None,
+                  end : datetime | NoneType = None):
+    ''' Export the track between start and end to a GPX (.gpx) or GeoJSON file '''
+    with open (file_name, "w", encoding="utf-8") as f:
+        if file_name.lower ().endswith (".gpx"):
+            write_gpx (history.get_track (start, end), f)
+        else:
+            write_geojson (history.get_track (start, end), f)
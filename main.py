@@ -12,26 +12,34 @@
 
 import os
 os.environ['SDL_ANDROID_BLOCK_ON_PAUSE'] = '0'
+# Set CELESTE_STARTUP_PROFILE=1 for timing the startup (see startup_profiler.py)
+from startup_profiler import start_startup_profiler, startup_mark, finish_startup_profile
+start_startup_profiler ()
 from multiprocessing import freeze_support
-from queue import Queue, Empty
 import threading
 import gc
 from types import NoneType
 from typing import Literal
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
 import importlib
 import socket
 import time
+from datetime import datetime
 from starfix import LatLonGeodetic, SightCollection, Sight, \
     get_representation, IntersectError, get_folium_load_error, show_or_display_file, \
-    is_windows, kill_http_server, parse_angle_string, debug_logger, DebugLogger
+    show_map_documents, is_windows, kill_http_server, start_http_server, parse_angle_string, \
+    debug_logger, DebugLogger, \
+    start_connectivity_monitor, set_tile_store, load_folium, Almanac
+from mapoutput import render_map_documents
 import json
+from persistence import JsonPersister
+startup_mark ("Import of starfix")
 import kivy
 kivy.require('2.0.0')
 from kivy.core.audio import SoundLoader
-# Sound has to be loaded now directly
-# This seems to be due to a Kivy bug. Delaying sound loading leads to UI crashes.
-click_sound = SoundLoader.load('./sounds/mouse-click.mp3')
-error_sound = SoundLoader.load('./sounds/error.mp3')
+click_sound = None
+error_sound = None
 kivy.config.Config.set('graphics', 'resizable', False)
 from kivy.uix.widget import Widget
 from kivy.uix.boxlayout import BoxLayout
@@ -53,7 +61,8 @@ from kivy.core.window import Window
 from kivy.utils import platform
 
 from functools import partial
-from plotserver import NMEAServer
+from plotserver import plot_server
+startup_mark ("Import of kivy")
 
 # pylint: disable=W0702
 try:
@@ -85,11 +94,108 @@ DISABLE_IP_CLOCKS            = False
 ADD_EXIT_BUTTON              = True
 DO_HTTP_SERVER_RESTART       = False
 DRAW_AZIMUTHS_ON_MAP         = False
+# NMEA output for plotters: "tcp" (plotters connect to the app) or
+# "udp" (broadcast to all listeners on the network)
+NMEA_TRANSPORT               = "tcp"
+# Offline tiles from a single MBTiles file (see tilestore.py), if present
+TILE_STORE_FILE              = "tiles.mbtiles"
+# Load the sounds after the first frame is drawn (faster startup).
+# Off: delayed sound loading has caused UI crashes (a Kivy bug). Only enable this
+# after it has been verified on devices.
+DELAY_SOUND_LOADING          = False
+# Sample resource usage in the background (for finding leaks, see resource_profiler.py).
+# The samples are served at http://localhost:8000/status/resources.json
+# and written to resources.json when the app is paused.
+RESOURCE_SAMPLING            = False
+RESOURCE_SAMPLING_INTERVAL   = 10.0
+# Also record allocation sites (tracemalloc). This slows down the app.
+RESOURCE_TRACE_ALLOCATIONS   = False
+RESOURCE_SAMPLER             = None
+# Record every sight reduction (with the form data) in the fix history (see fixhistory.py).
+# Off by default: the file grows with every reduction.
+FIX_HISTORY_FILE             = "fixhistory.sqlite"
+RECORD_FIX_HISTORY           = False
+FIX_HISTORY                  = None
 DebugLogger.enable (do_enable=False, to_stdout=False)
 
+def load_sounds ():
+    ''' Load the sounds (on the Kivy thread) '''
+# pylint: disable=W0603
+    global click_sound, error_sound
+# pylint: enable=W0603
+    if click_sound is None:
+        click_sound = SoundLoader.load('./sounds/mouse-click.mp3')
+    if error_sound is None:
+        error_sound = SoundLoader.load('./sounds/error.mp3')
+
+if not DELAY_SOUND_LOADING:
+    # Sound has to be loaded now directly
+    # This seems to be due to a Kivy bug. Delaying sound loading leads to UI crashes.
+    load_sounds ()
+
+def preload_in_background ():
+    ''' Load almanacs (with pandas) and folium (if used) on a worker thread,
+        so the first sight reduction (and map) doesn't have to wait for them. '''
+
+    def preload ():
+# pylint: disable=W0718
+        try:
+            Almanac.preload ()
+            load_folium ()
+        except Exception as e:
+            # Loaded (and reported) again when needed
+            debug_logger.error (f"Preloading failed : {str(e)}")
+# pylint: enable=W0718
+
+    threading.Thread (target=preload, name="Preload", daemon=True).start ()
+
 class ResourceMonitor:
     """Monitor system resources to identify leaks"""
 
+    @staticmethod
+    def get_scheduled_count() -> int | str:
+        """Number of scheduled Kivy clock callbacks (N/A if not available)"""
+        # Clock callbacks (Kivy) - SAFE VERSION
+        try:
+            # Try different possible internal attributes
+            if hasattr(Clock, '_events'):
+#pylint: disable=W0212
+                return len(Clock._events)
+#pylint: enable=W0212
+            if hasattr(Clock, 'events'):
+                return len(Clock.events)
+            return "N/A"
+#pylint: disable=W0718
+        except Exception:
+#pylint: enable=W0718
+            return "N/A"
+
+    @staticmethod
+    def start_sampling():
+        """Start the background resource sampler (see RESOURCE_SAMPLING)"""
+#pylint: disable=W0603
+        global RESOURCE_SAMPLER
+#pylint: enable=W0603
+        if RESOURCE_SAMPLER is not None:
+            return
+#pylint: disable=C0415
+        from resource_profiler import ResourceSampler
+#pylint: enable=C0415
+        RESOURCE_SAMPLER = ResourceSampler(
+            interval=RESOURCE_SAMPLING_INTERVAL,
+            trace_allocations=RESOURCE_TRACE_ALLOCATIONS,
+            extra=lambda: {"scheduled_events": ResourceMonitor.get_scheduled_count()})
+        RESOURCE_SAMPLER.start()
+        RESOURCE_SAMPLER.serve()
+        if not is_windows():
+            start_http_server()
+
+    @staticmethod
+    def dump_samples():
+        """Write the resource samples (if sampling) to resources.json"""
+        if RESOURCE_SAMPLER is not None:
+            RESOURCE_SAMPLER.dump("resources.json")
+
     @staticmethod
     def log_resources():
         """Log current resource usage"""
@@ -106,21 +212,7 @@ class ResourceMonitor:
         # Object count
         obj_count = len(gc.get_objects())
 
-        # Clock callbacks (Kivy) - SAFE VERSION
-        try:
-            # Try different possible internal attributes
-            if hasattr(Clock, '_events'):
-#pylint: disable=W0212
-                scheduled_count = len(Clock._events)
-#pylint: enable=W0212
-            elif hasattr(Clock, 'events'):
-                scheduled_count = len(Clock.events)
-            else:
-                scheduled_count = "N/A"
-#pylint: disable=W0718
-        except Exception:
-#pylint: enable=W0718
-            scheduled_count = "N/A"
+        scheduled_count = ResourceMonitor.get_scheduled_count()
 
         debug_logger.info("=== RESOURCE SNAPSHOT ===")
         debug_logger.info(f"Threads: {thread_count} - {thread_names}")
@@ -245,6 +337,7 @@ class FontAwareConfig:
 
 # Initialize global font config
 font_config = FontAwareConfig()
+startup_mark ("Font configuration")
 
 # Set default color and sizes of the form with font awareness
 USE_KV = True
@@ -455,20 +548,25 @@ if USE_KV:
 """
 
     Builder.load_string(generate_adaptive_kv())
+startup_mark ("KV generation")
 
 FILE_NAME = None
 NUM_DICT = None
+PERSISTER = None
 
 # [Keep all the existing functions unchanged: get_starfixes, get_local_ip, etc.]
 # SIGHT REDUCTION.
 
-def get_starfixes(drp_pos: LatLonGeodetic) -> SightCollection:
-    ''' Returns a list of used star fixes (SightCollection) '''
-    assert isinstance(NUM_DICT, dict)
+def get_starfixes(drp_pos: LatLonGeodetic,
+                  num_dict : dict | NoneType = None) -> SightCollection:
+    ''' Returns a list of used star fixes (SightCollection)
+        The sight data is taken from num_dict (default is the form data, NUM_DICT) '''
+    if num_dict is None:
+        num_dict = NUM_DICT
+    assert isinstance(num_dict, dict)
 
     Sight.set_estimated_position(drp_pos)
     retval = []
-    assert isinstance(NUM_DICT, dict)
 
     def str2float_or_default (val : str, default : float | int) -> float | int:
         if len(val) == 0:
@@ -478,29 +576,29 @@ def get_starfixes(drp_pos: LatLonGeodetic) -> SightCollection:
         return retval
 
     for i in range(3):
-        if str2bool(NUM_DICT["Use"+str(i+1)]):
-            time_string = NUM_DICT["Date"+str(i+1)]+" "+\
-                          NUM_DICT["Time"+str(i+1)]+\
-                          NUM_DICT["TimeZone"+str(i+1)]
+        if str2bool(num_dict["Use"+str(i+1)]):
+            time_string = num_dict["Date"+str(i+1)]+" "+\
+                          num_dict["Time"+str(i+1)]+\
+                          num_dict["TimeZone"+str(i+1)]
             assert isinstance (time_string, str)
             time_string = time_string.strip().upper()
             retval.append(
-                Sight(object_name=NUM_DICT["ObjectName"+str(i+1)],
-                      measured_alt=NUM_DICT["Altitude"+str(i+1)],
+                Sight(object_name=num_dict["ObjectName"+str(i+1)],
+                      measured_alt=num_dict["Altitude"+str(i+1)],
                       set_time=time_string,
                       index_error_minutes=str2float_or_default(
-                          NUM_DICT["IndexError"+str(i+1)],0),
+                          num_dict["IndexError"+str(i+1)],0),
                       limb_correction=int(
-                          NUM_DICT["LimbCorrection"+str(i+1)]),
+                          num_dict["LimbCorrection"+str(i+1)]),
                       artificial_horizon=str2bool(
-                          NUM_DICT["ArtificialHorizon"+str(i+1)]),
+                          num_dict["ArtificialHorizon"+str(i+1)]),
                       observer_height=str2float_or_default(
-                          NUM_DICT["ObserverHeight"+str(i+1)],0),
+                          num_dict["ObserverHeight"+str(i+1)],0),
                       temperature=str2float_or_default(
-                          NUM_DICT["Temperature"+str(i+1)],10),
+                          num_dict["Temperature"+str(i+1)],10),
                       dt_dh=str2float_or_default(
-                          NUM_DICT["TemperatureGradient"+str(i+1)],-0.01),
-                      pressure=str2float_or_default(NUM_DICT["Pressure"+str(i+1)],101)
+                          num_dict["TemperatureGradient"+str(i+1)],-0.01),
+                      pressure=str2float_or_default(num_dict["Pressure"+str(i+1)],101)
             ))
 
     return SightCollection(retval)
@@ -528,151 +626,113 @@ def get_local_ip():
                 pass
 # pylint:enable=W0702
 
-COMM_QUEUE = None
-KILL_QUEUE = None
+def start_plotserver ():
+    ''' Start the plot server (or extend its life).
+        The server is stopped after 20 seconds without activity.
+        This is needed to avoid Androids aggressive thread management which seems
+        to cause hangups if the NMEA server is allowed to live for a longer time. '''
+    plot_server.start (NMEA_TRANSPORT)
 
-def run_plotserver():
-    ''' Running the plot server worker 
-        This thread starts the NMEA server, listens for position updates
-        and also STOP commands for killing the NMEA server.
-    '''
-# pylint: disable=W0603
-    global COMM_QUEUE
-# pylint: enable=W0603
-    server = NMEAServer(host='0.0.0.0', port=10110)
-    server_thread = None
-    try:
-        # Start NMEA server in a separate thread
-        server_thread = threading.Thread(target=server.start, daemon=True)
-        server_thread.start()
+def kill_plotserver ():
+    ''' Kill the plot server'''
+    plot_server.stop ()
 
-        while True:
-#pylint: disable=E0601
-            assert isinstance (COMM_QUEUE, Queue)
-#pylint: enable=E0601
-            try:
-                check_string = COMM_QUEUE.get (timeout=1.0)
-            except Empty:
-                continue
-            assert isinstance (check_string, str)
-            if check_string == "STOP":
-                # The plot server will now terminate
-                break
-            strs = check_string.split (";")
-            lat = float (strs[0])
-            lon = float (strs[1])
-            server.update_position (lat, lon)
+def update_plot_position (lat : float, lon : float):
+    ''' Update the plot server with new coordinates '''
+    plot_server.update_position (lat, lon)
 
-    finally:
-        server.stop()
-        if server_thread is not None:
-            server_thread.join (timeout=1.0)
-            if server_thread.is_alive ():
-                debug_logger.error ("Failed to stop plot server thread")
-        COMM_QUEUE = None
-
-def run_killserver ():
-    ''' Running a separate "kill" server responsible for removing the NMEA server 
-        This is needed to avoid Androids aggressive thread management which seems
-        to cause hangups if the NMEA server is allowed to live for a longer time. 
-    '''
-    timestamp = 0
-    has_waited = False
-    while True:
+def get_sight_time (num_dict : dict) -> datetime | NoneType:
+    ''' Returns the time of the latest used sight in num_dict (None if there is none) '''
+    sight_times = []
+    for i in range(3):
         try:
-# pylint: disable=W0603
-            global KILL_QUEUE
-# pylint: enable=W0603
-            assert KILL_QUEUE is not None
-            do_wait = False
-            # Here we wait for the kill signal
-            timestamp = KILL_QUEUE.get (block=False)
-            # We got a kill signal, with a timestamp
-            if not KILL_QUEUE.empty:
-                pass
-                # There is more data on the kill queue. Ignore this post.
-            else:
-                # No more data on the kill queue. Now we should wait
-                do_wait = True
-            if do_wait:
-                # Calculate the real time difference, and add 20 seconds
-                wait_time = timestamp - time.time() + 20
-                if wait_time < 0:
-                    wait_time = 0
-                # If we have a positive net waiting time, then waut
-                if wait_time > 0:
-                    time.sleep (wait_time)
-                else:
-                    pass
-                    # We cot an overdue kill request
-                # Now remember we have waited
-                has_waited = True
-        except Empty:
-            # We have an empty kill queue. See if it is time to actually kill the plot server.
-            if has_waited:
-                # Time to kill
-                global COMM_QUEUE
-                if COMM_QUEUE is not None:
-                    # Sending kill command
-                    COMM_QUEUE.put ("STOP")
-                    # Graceful wait for 1 sec
-                    time.sleep (1)
-                    # Clean up
-                    COMM_QUEUE = None
-                    KILL_QUEUE = None
-                    # We are done
-                    return
-            else:
-                pass
+            if str2bool(num_dict["Use"+str(i+1)]):
+                # As in get_starfixes
+                time_string = (num_dict["Date"+str(i+1)]+" "+num_dict["Time"+str(i+1)]+\
+                               num_dict["TimeZone"+str(i+1)]).strip().upper()
+                sight_times.append (datetime.fromisoformat (time_string))
+        except (KeyError, ValueError):
+            pass
+    try:
+        return max (sight_times) if len (sight_times) > 0 else None
+    except TypeError:
+        # Times with and without time zone
+        return None
 
-def start_plotserver ():
-    ''' Start the plot server'''
+# pylint: disable=R0913
+# pylint: disable=R0917
+def record_fix (num_dict : dict, start_time : float, iterations : int,
+                fix : LatLonGeodetic | NoneType = None,
+                collection : SightCollection | NoneType = None,
+                fitness : float | NoneType = None, sigma_nm : float | NoneType = None,
+                message : str = ""):
+    ''' Record a sight reduction in the fix history (see RECORD_FIX_HISTORY).
+        The time of the record is the time of the latest sight (also for a failed
+        reduction). '''
 # pylint: disable=W0603
-    global COMM_QUEUE, KILL_QUEUE
+    global FIX_HISTORY
 # pylint: enable=W0603
-    if COMM_QUEUE is None:
-        COMM_QUEUE = Queue ()
-        plot_process = threading.Thread (target = run_plotserver, args = (), daemon=True)
-        plot_process.start ()
-    if KILL_QUEUE is None:
-        KILL_QUEUE = Queue ()
-        kill_process = threading.Thread (target=run_killserver, args = (), daemon=True)
-        kill_process.start ()
+    if not RECORD_FIX_HISTORY:
+        return
+# pylint: disable=W0718
     try:
-        while True:
-            KILL_QUEUE.get(False)
-    except Empty:
-        pass
-    # KILL_QUEUE.put (20)
-    KILL_QUEUE.put (time.time())
-
-def kill_plotserver ():
-    ''' Kill the plot server'''
-    if COMM_QUEUE is not None:
-        COMM_QUEUE.put ("STOP")
+# pylint: disable=C0415
+        from fixhistory import FixHistory, get_fix_time
+# pylint: enable=C0415
+        fix_time = get_fix_time (collection) if collection is not None else\
+                   get_sight_time (num_dict)
+        if fix_time is None:
+            # Not recorded with the time of recording (the history is ordered by sight time)
+            debug_logger.info ("Fix not recorded, no sight time")
+            return
+        if FIX_HISTORY is None:
+            FIX_HISTORY = FixHistory (FIX_HISTORY_FILE)
+        FIX_HISTORY.record (fix, fix_time,
+                            fitness=fitness, sigma_nm=sigma_nm,
+                            duration=time.monotonic () - start_time, iterations=iterations,
+                            inputs=num_dict, message=message)
+    except Exception as e:
+        # The history must never stop a sight reduction
+        debug_logger.error (f"Cannot record fix : {str(e)}")
+# pylint: enable=W0718
+# pylint: enable=R0913
+# pylint: enable=R0917
 
-def update_plot_position (lat : float, lon : float):
-    ''' Update the plot server with new coordinates '''
-    if COMM_QUEUE is not None:
-        COMM_QUEUE.put (str(lat)+";"+str(lon))
+class ReductionCancelled (Exception):
+    ''' Raised when a running sight reduction has been cancelled '''
 
-def sight_reduction() -> \
+def sight_reduction(num_dict : dict | NoneType = None,
+                    check_progress : Callable [[int], None] | NoneType = None) -> \
     tuple[str, bool, LatLonGeodetic | NoneType, SightCollection | Sight | NoneType]:
-    ''' Perform a sight reduction given data entered above '''
-    assert isinstance(NUM_DICT, dict)
-    real_lat = parse_angle_string (NUM_DICT["DrpLat"])
-    real_lon = parse_angle_string (NUM_DICT["DrpLon"])
+    ''' Perform a sight reduction given data entered above
+        The data is taken from num_dict (default is the form data, NUM_DICT).
+        check_progress is called with the iteration number before each iteration,
+        and may cancel the reduction by raising ReductionCancelled. '''
+    if num_dict is None:
+        num_dict = NUM_DICT
+    assert isinstance(num_dict, dict)
+    real_lat = parse_angle_string (num_dict["DrpLat"])
+    real_lon = parse_angle_string (num_dict["DrpLon"])
     the_pos = LatLonGeodetic(lat=float(real_lat),
                              lon=float(real_lon))
 
     intersections = None
     collection = None
+    start_time = time.monotonic ()
+    iteration = 0
     try:
-        the_limit = float(NUM_DICT["DrpQuality"]) * 1.852 # Convert from nm to km
-        intersections, _, _, collection, calculated_diff =\
+        def get_starfixes_checked (drp_pos : LatLonGeodetic) -> SightCollection:
+            nonlocal iteration
+            iteration += 1
+            if check_progress is not None:
+                check_progress (iteration)
+            return get_starfixes (drp_pos, num_dict)
+
+        the_limit = float(num_dict["DrpQuality"]) * 1.852 # Convert from nm to km
+        intersections, fitness, _, collection, calculated_diff =\
             SightCollection.get_intersections_conv(return_geodetic=True,
                                                    estimated_position=the_pos,
-                                                   get_starfixes=get_starfixes,
+                                                   get_starfixes=get_starfixes_checked,
                                                    assume_good_estimated_position=True,
                                                    limit=the_limit)
 
@@ -684,11 +744,14 @@ def sight_reduction() -> \
             diff_string = " ±" + str(round(calculated_diff/km_per_nautical_mile,1)) + " nm"
         else:
             diff_string = ""
+        record_fix (num_dict, start_time, iteration, intersections, collection, fitness,
+                    calculated_diff/km_per_nautical_mile if calculated_diff > 0 else None)
         start_plotserver ()
         update_plot_position (intersections.get_lat(), intersections.get_lon())
         return repr_string + diff_string, True, intersections, collection
 
     except IntersectError as ve:
+        record_fix (num_dict, start_time, iteration, message=str (ve))
         coll_object = None
         if isinstance (ve.coll_object, SightCollection) or\
            isinstance (ve.coll_object, Sight):
@@ -700,6 +763,147 @@ def sight_reduction() -> \
     except ValueError as ve:
         return str(ve), False, None, None
 
+class ReductionService:
+    ''' Runs sight reductions on a worker thread, so the UI stays responsive
+        (also for the first reduction, which loads the almanacs).
+        Only one reduction runs at a time. A new request cancels the running reduction
+        (at its next iteration) and replaces a waiting request, so repeated button
+        presses are coalesced. Callbacks are called on the Kivy thread. '''
+
+    def __init__ (self):
+        self.__condition = threading.Condition ()
+        self.__generation = 0
+        self.__pending = None
+        self.__busy = False
+        self.__thread = None
+
+    def submit (self, num_dict : dict, on_done : Callable [[tuple], None],
+                on_progress : Callable [[int], None] | NoneType = None):
+        ''' Request a sight reduction of num_dict (a copy is used).
+            on_done is called with the result of sight_reduction,
+            on_progress with the iteration number. '''
+        with self.__condition:
+            self.__generation += 1
+            self.__pending = (self.__generation, dict (num_dict), on_done, on_progress)
+            if self.__thread is None:
+                self.__thread = threading.Thread (target=self.__run, name="SightReduction",
+                                                  daemon=True)
+                self.__thread.start ()
+            self.__condition.notify ()
+
+    def cancel (self):
+        ''' Cancel the running (and any waiting) reduction '''
+        with self.__condition:
+            self.__generation += 1
+            self.__pending = None
+
+    def is_busy (self) -> bool:
+        ''' Check if a reduction is running or waiting '''
+        with self.__condition:
+            return self.__pending is not None or self.__busy
+
+    def __is_current (self, generation : int) -> bool:
+        with self.__condition:
+            return generation == self.__generation
+
+    def __run (self):
+        while True:
+            with self.__condition:
+                self.__busy = False
+                while self.__pending is None:
+                    # Sleeps until the next request
+                    self.__condition.wait ()
+                generation, num_dict, on_done, on_progress = self.__pending
+                self.__pending = None
+                self.__busy = True
+
+            def check_progress (iteration : int):
+                if not self.__is_current (generation):
+                    raise ReductionCancelled ()
+                if on_progress is not None:
+                    Clock.schedule_once (lambda _: on_progress (iteration)
+                                         if self.__is_current (generation) else None, 0)
+
+            try:
+                result = sight_reduction (num_dict, check_progress)
+            except ReductionCancelled:
+                continue
+# pylint: disable=W0718
+            except Exception as e:
+# pylint: enable=W0718
+                result = "Failed sight reduction. " + str (e), False, None, None
+            # Only the latest request is reported
+            Clock.schedule_once (lambda _, r=result, g=generation, f=on_done: f (r)
+                                 if self.__is_current (g) else None, 0)
+
+REDUCTION_SERVICE = ReductionService ()
+
+def render_map (i : tuple | LatLonGeodetic | NoneType,
+                c : SightCollection | Sight | NoneType) -> object | NoneType:
+    ''' Render the map of a sight reduction (None if there is no map data) '''
+    if isinstance (c, SightCollection):
+        return c.render_folium (i, draw_azimuths=DRAW_AZIMUTHS_ON_MAP)
+    if isinstance (c, Sight):
+        return c.render_folium_new_map ()
+    return None
+
+class MapPrerenderCache:
+    ''' Renders the map of the latest sight reduction on a worker thread, so that
+        "Show Map!" only has to publish the (already rendered) documents.
+        Only the latest map is kept. '''
+
+    def __init__ (self):
+        self.__executor = ThreadPoolExecutor (max_workers=1, thread_name_prefix="MapPrerender")
+        self.__lock = threading.Lock ()
+        self.__key = None
+        self.__future = None
+
+    @staticmethod
+    def __render (i : tuple | LatLonGeodetic | NoneType,
+                  c : SightCollection | Sight) -> dict [str, str] | NoneType:
+        the_map = render_map (i, c)
+        return render_map_documents (the_map) if the_map is not None else None
+
+    def prerender (self, i : tuple | LatLonGeodetic | NoneType,
+                   c : SightCollection | Sight | NoneType):
+        ''' Start rendering the map for intersections i and collection c '''
+        if c is None:
+            return
+        with self.__lock:
+            if self.__future is not None:
+                # An outdated map which hasn't started yet is skipped
+                self.__future.cancel ()
+            # The objects are kept in the key, so the ids stay unique
+            self.__key = (i, c)
+            self.__future = self.__executor.submit (MapPrerenderCache.__render, i, c)
+
+    def when_rendered (self, i : tuple | LatLonGeodetic | NoneType,
+                       c : SightCollection | Sight,
+                       on_done : Callable [[dict [str, str] | NoneType,
+                                            BaseException | NoneType], None]):
+        ''' Call on_done with the rendered documents for i and c (or the error),
+            on the Kivy thread. The map is rendered now if it isn't prerendered.
+            If the rendering is replaced by a newer map the error is a CancelledError. '''
+        with self.__lock:
+            key, future = self.__key, self.__future
+        if future is None or future.cancelled () or key [0] is not i or key [1] is not c:
+            self.prerender (i, c)
+            with self.__lock:
+                future = self.__future
+        assert isinstance (future, Future)
+
+        def done (f : Future):
+            if f.cancelled ():
+                result, error = None, CancelledError ()
+            else:
+                error = f.exception ()
+                result = f.result () if error is None else None
+            Clock.schedule_once (lambda _: on_done (result, error), 0)
+
+        future.add_done_callback (done)
+
+MAP_PRERENDER_CACHE = MapPrerenderCache ()
+
 # Modified widget classes with font awareness
 class AppButton (Button):
     ''' Common base class for buttons '''
@@ -737,7 +941,22 @@ class ExecButton (AppButton):
         assert isinstance(the_form, InputForm)
 
         the_form.extract_from_widgets()
-        sr, result, intersections, coll = sight_reduction()
+        assert isinstance(NUM_DICT, dict)
+        # The reduction runs in the background (see ReductionService)
+        instance.text = "Working..."
+        REDUCTION_SERVICE.submit (NUM_DICT,
+                                  lambda r: ExecButton.reduction_done (instance, r),
+                                  lambda i: setattr (instance, "text",
+                                                     "Working... (iteration " + str (i) + ")"))
+
+    @staticmethod
+    def reduction_done(instance, reduction_result : tuple):
+        ''' Present the result of a sight reduction (called on the Kivy thread) '''
+        assert isinstance(instance, ExecButton)
+        the_form = instance.form
+        assert isinstance(the_form, InputForm)
+        instance.text = "Perform sight reduction!"
+        sr, result, intersections, coll = reduction_result
         if result:
             # Successful sight reduction
             CelesteApp.play_click_sound ()
@@ -747,6 +966,7 @@ class ExecButton (AppButton):
                    intersections is None
             # Save collection and intersections (to be used in map presentation)
             the_form.set_active_intersections(intersections, coll)
+            MAP_PRERENDER_CACHE.prerender (intersections, coll)
             the_form.extract_from_widgets()
             dump_dict(copy_to_clipboard=False)
             the_form.results.text = "Your location = " + sr
@@ -760,6 +980,7 @@ class ExecButton (AppButton):
             if coll is not None:
                 # Save the collection (without intersections) on error
                 the_form.set_active_intersections (None, coll)
+                MAP_PRERENDER_CACHE.prerender (None, coll)
                 CelesteApp.message_popup ("You have made a failed sight reduction!\n"
                                           "The circles of equal altitude don't intersect properly\n"
                                           "Use the \"Show Map!\" button for troubleshooting!",\
@@ -781,6 +1002,7 @@ class ShowMapButton (AppButton):
         super().__init__(active = False, **kwargs)
         self.form = form
         self.text = "No map data (yet)"
+        self.waiting = False
 # pylint: disable=E1101
         self.bind(on_press=self.callback)
 # pylint: enable=E1101
@@ -791,28 +1013,31 @@ class ShowMapButton (AppButton):
         the_form = instance.form
         assert isinstance(the_form, InputForm)
         i, c = the_form.get_active_intersections ()
-        if c is not None:
-            the_map = None
-            try:
-                if isinstance (c, SightCollection):
-                    the_map = c.render_folium (i, draw_azimuths=DRAW_AZIMUTHS_ON_MAP)
-                elif isinstance (c, Sight):
-                    the_map = c.render_folium_new_map ()
-                CelesteApp.play_click_sound()
-                assert the_map is not None
-                file_name = "./map.html"
-                the_map.save (file_name)
-
-                show_or_display_file (file_name, protocol="http",
-                                      kill_existing_server=DO_HTTP_SERVER_RESTART)
-
+        if c is not None and not instance.waiting:
+            # Usually already rendered in the background after the sight reduction.
+            # Otherwise the UI stays responsive while waiting.
+            instance.waiting = True
+            instance.text = "Preparing map..."
+            MAP_PRERENDER_CACHE.when_rendered (i, c, instance.map_rendered)
+
+    def map_rendered(self, documents : dict [str, str] | NoneType,
+                     error : BaseException | NoneType):
+        ''' Show the rendered map (called on the Kivy thread) '''
+        self.waiting = False
+        self.text = "Show Map!"
+        if isinstance (error, CancelledError):
+            # Replaced by the map of a newer sight reduction (shown at the next press)
+            return
 # pylint: disable=W0702
-            except:
-                CelesteApp.play_error_sound()
-                if the_map is None:
-                    instance.text = get_folium_load_error()
-                else:
-                    instance.text = "Error in map generation."
+        try:
+            if error is not None or documents is None:
+                raise ValueError ("No map")
+            CelesteApp.play_click_sound()
+            # Served from memory (no map file is written)
+            show_map_documents (documents, kill_existing_server=DO_HTTP_SERVER_RESTART)
+        except:
+            CelesteApp.play_error_sound()
+            self.text = get_folium_load_error() or "Error in map generation."
 # pylint: enable=W0702
 
 class PasteConfigButton (AppButton):
@@ -1151,7 +1376,31 @@ class CelesteApp (App):
 
     def build(self):
         """Standard Kivy build method"""
-        return self._setup_widgets ()
+        # Probe connectivity in the background, so map generation never waits for it
+        start_connectivity_monitor ()
+        if os.path.exists (TILE_STORE_FILE):
+# pylint: disable=C0415
+            from tilestore import MBTilesStore
+# pylint: enable=C0415
+            set_tile_store (MBTilesStore (TILE_STORE_FILE))
+        root = self._setup_widgets ()
+        startup_mark ("Build of widgets")
+        return root
+
+    def on_start (self):
+        ''' Heavy initialization is done after the first frame is drawn '''
+        # Scheduled (at the first frame) for the frame after that
+        Clock.schedule_once (lambda _: Clock.schedule_once (self.__after_first_frame, 0), 0)
+
+    @staticmethod
+    def __after_first_frame (_):
+        startup_mark ("First frame")
+        finish_startup_profile ()
+        if DELAY_SOUND_LOADING:
+            load_sounds ()
+        preload_in_background ()
+        if RESOURCE_SAMPLING:
+            ResourceMonitor.start_sampling ()
 
     @staticmethod
     def play_click_sound ():
@@ -1360,6 +1609,9 @@ class CelesteApp (App):
                     # form.cleanup ()
                 else:
                     debug_logger.error("InputForm not found while doing pause/save!")
+            # The app may be killed while paused
+            flush_dict()
+            ResourceMonitor.dump_samples()
 
             # Clean up background processes
             # But we don't clean up anything here. Threads are needed.
@@ -1374,6 +1626,9 @@ class CelesteApp (App):
     def on_resume(self):
         """Called when app returns from background"""
 
+        # Connectivity may have changed while paused
+        start_connectivity_monitor ().refresh ()
+
         if not DO_PAUSE_HANDLING:
             return
 
@@ -1485,8 +1740,11 @@ def initialize(fn: str, init_dict: dict):
 # pylint: disable=W0603
     global FILE_NAME
     global NUM_DICT
+    global PERSISTER
 # pylint: enable=W0603
     FILE_NAME = fn
+    # The configuration is saved in the background (see dump_dict)
+    PERSISTER = JsonPersister (fn, indent=4)
 
     try:
         # First see if we have a saved json file
@@ -1502,14 +1760,17 @@ def initialize(fn: str, init_dict: dict):
         NUM_DICT = init_dict
 
 def dump_dict(copy_to_clipboard = True):
-    ''' Dumps the contents to a json file '''
+    ''' Dumps the contents to a json file (written shortly, on a worker thread) '''
 
-    j_dump = json.dumps(NUM_DICT, indent=4)
     if copy_to_clipboard:
-        Clipboard.copy (j_dump)
-    assert isinstance(FILE_NAME, str)
-    with open(FILE_NAME, "w", encoding="utf-8") as f:
-        f.write(j_dump)
+        Clipboard.copy (json.dumps(NUM_DICT, indent=4))
+    assert isinstance(PERSISTER, JsonPersister)
+    PERSISTER.save (NUM_DICT)
+
+def flush_dict():
+    ''' Write a pending json file now '''
+    if PERSISTER is not None:
+        PERSISTER.flush ()
 
 def do_initialize ():
     ''' Initialize data from json '''
@@ -1854,6 +2115,7 @@ if __name__ == '__main__':
         if is_windows():
             freeze_support ()
         do_initialize()
+        startup_mark ("Initialization")
 
         # Show intro message with font scale info if needed
         INTRO_MSG = ("[b]Welcome to Celeste![/b]\n"+
@@ -1876,6 +2138,7 @@ if __name__ == '__main__':
         debug_logger.error(f"Unhandled exception in main : {str(exc)}")
     finally:
         debug_logger.info ("Cleaning up in finally block of main")
+        flush_dict ()
         # Kill NMEA 0138 server (if active)
         kill_plotserver ()
         # Kill HTTP server (if active)
@@ -0,0 +1,517 @@
+''' Map output: simplification and quantization of the polylines emitted to maps,
+    the grid lines of maps, the registry of documents (such as rendered maps) served
+    from memory, the HTTP request handler for map content (see starfix.MyHandler)
+    and the connectivity monitor (online or offline maps).
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+import gzip
+import http.server
+import os
+import socket
+import threading
+import time
+from math import sqrt, log2, cos, radians
+from types import NoneType
+from collections.abc import Callable
+
+################################################
+# Polyline simplification
+################################################
+
+MAP_COORDINATE_DECIMALS = 5 # About 1 meter
+MAP_VIEW_RADIUS_PIXELS = 512 # Assumed (half) size of the map view
+
+MAP_ACCURACY_PIXELS = 50 # Size of the accuracy radius, at the level of detail
+MAP_MAX_LATITUDE = 85.05 # Limit of the (Web Mercator) map
+
+def get_map_pixel_size (zoom : int | float) -> float:
+    ''' Returns the size of a pixel (in degrees, at the equator) on a map with a zoom level '''
+    return 360 / (256 * 2**zoom)
+
+def get_map_detail_zoom (the_map : object, accuracy : float | NoneType = None,
+                         max_zoom : int = 15) -> float:
+    ''' Returns the zoom level used for the level of detail when rendering on a map.
+        This is the zoom level of the map, or the zoom level where the accuracy radius
+        (nautical miles) spans MAP_ACCURACY_PIXELS pixels if that is higher. '''
+    zoom = the_map.options.get ("zoom", 11)
+    if accuracy is not None and accuracy > 0:
+        accuracy_zoom = log2 (360 * 60 * MAP_ACCURACY_PIXELS / (256 * accuracy))
+        zoom = min (max (accuracy_zoom, zoom), max (zoom, max_zoom))
+    return zoom
+
+#pylint: disable=R0914
+def simplify_polyline (points : list [list [float]], tolerance : float,
+                       center : list [float] | NoneType = None,
+                       view_radius : float | NoneType = None) -> list [list [float]]:
+    ''' Simplify a polyline (a list of [lat, lon] points) with the Douglas-Peucker algorithm.
+        Points deviating less than tolerance (degrees) from the simplified line are removed.
+        The tolerance is in degrees of longitude, as a pixel on the (Web Mercator) map.
+        Deviations are measured on the ground, against the tolerance scaled by cos(lat),
+        since the map stretches distances by 1/cos(lat).
+        If center and view_radius (degrees) are given the tolerance grows linearly with the
+        distance from center outside view_radius. These parts of the polyline are only
+        visible when zooming out, where a pixel covers a correspondingly larger distance.
+        The algorithm is iterative (no recursion), so long polylines are handled. '''
+    n = len (points)
+    if n < 3 or tolerance <= 0:
+        return list (points)
+    cosines = [cos (radians (min (abs (p[0]), MAP_MAX_LATITUDE))) for p in points]
+    if center is not None and view_radius is not None:
+        tolerances = [tolerance * c * max (1, sqrt ((p[0] - center[0])**2 + (p[1] - center[1])**2)
+                                              / view_radius) for p, c in zip (points, cosines)]
+    else:
+        tolerances = [tolerance * c for c in cosines]
+    keep = [False] * n
+    keep [0] = keep [n-1] = True
+    stack = [(0, n-1)]
+    while len (stack) > 0:
+        first, last = stack.pop ()
+        y1, x1 = points [first]
+        y2, x2 = points [last]
+        dy = y2 - y1
+        max_ratio = 0.0
+        index = first
+        for i in range (first + 1, last):
+            y, x = points [i]
+            # Longitude scaled to distance on the ground (at the latitude of the point)
+            dx = (x2 - x1) * cosines [i]
+            ex = (x - x1) * cosines [i]
+            ey = y - y1
+            seg_len_2 = dx*dx + dy*dy
+            if seg_len_2 == 0:
+                t = 0.0
+            else:
+                t = min (max ((ex*dx + ey*dy) / seg_len_2, 0), 1)
+            ratio = ((t*dx - ex)**2 + (t*dy - ey)**2) / tolerances [i]**2
+            if ratio > max_ratio:
+                max_ratio = ratio
+                index = i
+        if max_ratio > 1:
+            keep [index] = True
+            stack.append ((first, index))
+            stack.append ((index, last))
+    return [p for p, k in zip (points, keep) if k]
+#pylint: enable=R0914
+
+def quantize_coordinates (points : list [list [float]], decimals : int = MAP_COORDINATE_DECIMALS)\
+      -> list [list [float]]:
+    ''' Round the coordinates of a polyline, removing consecutive duplicate points '''
+    retval = list [list [float]] ()
+    for lat, lon in points:
+        p = [round (lat, decimals), round (lon, decimals)]
+        if len (retval) == 0 or retval [-1] != p:
+            retval.append (p)
+    return retval
+
+def prepare_polylines (segments : list [list [list [float]]], center : list [float],
+                       zoom : int | float, tolerance : float | NoneType = None,
+                       decimals : int = MAP_COORDINATE_DECIMALS) -> list [list [list [float]]]:
+    ''' Simplify and quantize a list of polyline segments, before emitting them to a map.
+        By default the tolerance is half a pixel at the zoom level (scaled by cos(lat)),
+        growing outside the view around center (see simplify_polyline) '''
+    pixel_size = get_map_pixel_size (zoom)
+    if tolerance is None:
+        tolerance = pixel_size / 2
+    return [quantize_coordinates (simplify_polyline (seg, tolerance, center,
+                                                     MAP_VIEW_RADIUS_PIXELS * pixel_size),
+                                  decimals)
+            for seg in segments]
+
+################################################
+# Grid lines
+################################################
+
+def get_map_grid (center : object = None)\
+      -> tuple [list [list [list [float]]], list [list [list [float]]], list [list [list [float]]]]:
+    ''' Returns the grid lines for a map, as lists of [[lat, lon], [lat, lon]] lines.
+        With a center (a LatLon, typically an intersection) the grid is the minute lines
+        (10 minutes in each direction) around it, otherwise the degree grid of the world.
+        Returns : (degree parallels, degree meridians, minute lines) '''
+    parallels = []
+    meridians = []
+    minute_lines = []
+    if center is None:
+        for lat in range (-90, 91):
+            parallels.append ([[lat, -180], [lat, 180]])
+        for lon in range (-180, 181):
+            meridians.append ([[-90, lon], [90, lon]])
+        return parallels, meridians, minute_lines
+
+    # Calculate lower left minute point
+    reduced_lon = int(center.get_lon () * 60) / 60
+    reduced_lat = int(center.get_lat () * 60) / 60
+    left_lon  = reduced_lon - (1/6)
+    right_lon = reduced_lon + (1/6)
+    down_lat  = reduced_lat - (1/6)
+    up_lat    = reduced_lat + (1/6)
+    for i in range (-10, 11):
+        # Horizontal and vertical lines
+        minute_lines.append ([[reduced_lat + (i/60), left_lon], [reduced_lat + (i/60), right_lon]])
+        minute_lines.append ([[down_lat, reduced_lon + (i/60)], [up_lat, reduced_lon + (i/60)]])
+    return parallels, meridians, minute_lines
+
+def get_map_grid_tooltip (line : list [list [float]], minutes : bool = False) -> str:
+    ''' Returns the tooltip of a grid line (see get_map_grid), such as "59°" for a degree
+        line or "N 59° 30'" for a minute line '''
+    if line [0][0] == line [1][0]:
+        # Parallel
+        value = line [0][0]
+        prefix_string = "S" if value < 0 else "N"
+    else:
+        value = line [0][1]
+        prefix_string = "W" if value < 0 else "E"
+    if not minutes:
+        return str(round(value)) + "°"
+    d, m = divmod (round (abs (value) * 60), 60)
+    return prefix_string + " " + str(d) + "° " + str(m) + "'"
+
+def get_map_grid_geojson (lines : list [list [list [float]]], minutes : bool = False,
+                          lon_adjustment : int | float = 0,
+                          decimals : int = MAP_COORDINATE_DECIMALS) -> dict:
+    ''' Returns grid lines (see get_map_grid) as one GeoJSON FeatureCollection,
+        with the tooltip of each line (see get_map_grid_tooltip) as its "label" property.
+        A level of the grid is then one layer on the map. '''
+    features = []
+    for line in lines:
+        points = quantize_coordinates ([[lat, lon + lon_adjustment] for lat, lon in line],
+                                       decimals)
+        features.append ({"type" : "Feature",
+                          "geometry" : {"type" : "LineString",
+                                        "coordinates" : [[lon, lat] for lat, lon in points]},
+                          "properties" : {"label" : get_map_grid_tooltip (line, minutes)}})
+    return {"type" : "FeatureCollection", "features" : features}
+
+################################################
+# Documents served from memory
+################################################
+
+class DocumentRegistry:
+    ''' Documents (such as rendered maps) served by the HTTP server from memory.
+        Each publication gets a new version (and URL). Only the latest versions are kept. '''
+
+    def __init__ (self, max_versions : int = 3):
+        self.__max_versions = max_versions
+        self.__version = 0
+        # version -> name -> [data, gzip compressed data (when requested)]
+        self.__documents = {}
+        self.__lock = threading.Lock ()
+
+    def publish (self, documents : dict [str, str | bytes]) -> int:
+        ''' Publish a set of documents (by name), returns the version '''
+        entry = {name : [content.encode ("utf-8") if isinstance (content, str) else content, None]
+                 for name, content in documents.items ()}
+        with self.__lock:
+            self.__version += 1
+            self.__documents [self.__version] = entry
+            for version in list (self.__documents.keys ()):
+                if version <= self.__version - self.__max_versions:
+                    del self.__documents [version]
+            return self.__version
+
+    def has_version (self, version : int) -> bool:
+        ''' Check if a version is published (and not evicted) '''
+        with self.__lock:
+            return version in self.__documents
+
+    def get_document (self, version : int, name : str, use_gzip : bool = False) -> bytes | NoneType:
+        ''' Returns a published document, or None if it is unknown (or evicted) '''
+        with self.__lock:
+            document = self.__documents.get (version, {}).get (name)
+            if document is None:
+                return None
+            if not use_gzip:
+                return document [0]
+            if document [1] is None:
+                document [1] = gzip.compress (document [0], 6, mtime=0)
+            return document [1]
+
+DOCUMENT_REGISTRY = DocumentRegistry ()
+
+def publish_documents (documents : dict [str, str | bytes]) -> str:
+    ''' Publish documents to be served from memory by the HTTP server.
+        Returns the URL path of the published version (/doc/<version>/).
+        Relative links between the documents work as usual. '''
+    return "/doc/" + str (DOCUMENT_REGISTRY.publish (documents)) + "/"
+
+def render_map_documents (the_map : object, name : str = "map.html") -> dict [str, str]:
+    ''' Render a (folium) map into its documents (file name -> content) '''
+    return {name : the_map.get_root ().render ()}
+
+def publish_map (the_map : object, name : str = "map.html") -> str:
+    ''' Publish a (folium) map to be served from memory, without writing any files.
+        Returns the URL path of the map page. '''
+    return publish_documents (render_map_documents (the_map, name)) + name
+
+################################################
+# Serving of map content
+################################################
+
+# Tiles may be cached by the WebView (they never change)
+TILE_CACHE_CONTROL = "public, max-age=604800"
+# Text files sent gzip compressed (if accepted by the client)
+GZIP_EXTENSIONS = (".html", ".js", ".css", ".json", ".txt")
+
+class MapRequestHandler(http.server.SimpleHTTPRequestHandler):
+    ''' HTTP request handler for map content (see send_map_content), used by starfix.MyHandler '''
+
+    # Tile store (see tilestore.py) used for /tiles/{z}/{x}/{y}.png, if set
+    tile_store = None
+
+    # Documents generated on request (such as diagnostics), path -> function returning
+    # the content (see starfix.set_dynamic_document)
+    dynamic_documents = {}
+
+    # Compressed files, path -> (modification time, size, compressed data)
+    gzip_cache = {}
+    gzip_cache_lock = threading.Lock()
+
+    def end_headers(self):
+        if self.path.startswith("/tiles/"):
+            self.send_header("Cache-Control", TILE_CACHE_CONTROL)
+        super().end_headers()
+
+    def __send_stored_tile(self) -> bool:
+        ''' Serve a tile from the tile store. Returns False if the tile is not stored '''
+        parts = self.path.split("?")[0].split("/")
+        if len(parts) != 5:
+            return False
+        y = parts[4].split(".")[0]
+        if not (parts[2].isdigit() and parts[3].isdigit() and y.isdigit()):
+            return False
+        tile = self.tile_store.get_tile(int(parts[2]), int(parts[3]), int(y))
+        if tile is None:
+            return False
+        data, etag = tile
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return True
+        self.send_response(200)
+        self.send_header("Content-Type", self.tile_store.get_content_type())
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+        return True
+
+    def __send_compressed(self) -> bool:
+        ''' Send a text file (such as map.html) gzip compressed.
+            The compressed data is kept until the file is changed.
+            Returns False if the file should be sent as is '''
+        if "gzip" not in self.headers.get("Accept-Encoding", ""):
+            return False
+        path = self.translate_path(self.path)
+        if not path.lower().endswith(GZIP_EXTENSIONS) or not os.path.isfile(path):
+            return False
+        stat = os.stat(path)
+        with MapRequestHandler.gzip_cache_lock:
+            cached = MapRequestHandler.gzip_cache.get(path)
+        if cached is None or cached[0] != stat.st_mtime or cached[1] != stat.st_size:
+            with open(path, "rb") as f:
+                cached = stat.st_mtime, stat.st_size, gzip.compress(f.read(), 6, mtime=0)
+            with MapRequestHandler.gzip_cache_lock:
+                MapRequestHandler.gzip_cache[path] = cached
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(cached[2])))
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Last-Modified", self.date_time_string(int(stat.st_mtime)))
+        self.end_headers()
+        self.wfile.write(cached[2])
+        return True
+
+    def __send_published_document(self) -> bool:
+        ''' Serve a published document (/doc/<version>/<name>) from memory.
+            Other files under a document URL (such as scripts bundled with the app)
+            are served from the directory. Returns False if not handled here '''
+        parts = self.path.split("?")[0].split("/", 3)
+        if len(parts) != 4 or not parts[2].isdigit():
+            return False
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        document = DOCUMENT_REGISTRY.get_document(int(parts[2]), parts[3], use_gzip)
+        if document is None:
+            if not DOCUMENT_REGISTRY.has_version(int(parts[2])):
+                self.send_error(404, "Document expired")
+                return True
+            self.path = "/" + parts[3]
+            return False
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(parts[3]))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(document)))
+        self.send_header("Vary", "Accept-Encoding")
+        # Published documents never change (a new version gets a new URL)
+        self.send_header("Cache-Control", "private, max-age=3600")
+        self.end_headers()
+        self.wfile.write(document)
+        return True
+
+    def __send_dynamic_document(self) -> bool:
+        ''' Serve a document generated on request. Returns False if not handled here '''
+        provider = self.dynamic_documents.get(self.path.split("?")[0])
+        if provider is None:
+            return False
+        document = provider()
+        if isinstance(document, str):
+            document = document.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(self.path.split("?")[0]))
+        self.send_header("Content-Length", str(len(document)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(document)
+        return True
+
+    def copyfile(self, source, outputfile):
+        # Zero-copy file responses (sendfile) where possible
+        if outputfile is self.wfile and hasattr(source, "fileno"):
+            self.connection.sendfile(source)
+        else:
+            super().copyfile(source, outputfile)
+
+    def send_map_content(self) -> str | NoneType:
+        ''' Send the response to a GET request for map content: documents generated on
+            request, published documents, tiles from the tile store and compressed text files.
+            Returns how the content was sent (for logging), or None if the file should be
+            served from the directory as usual '''
+        if self.__send_dynamic_document():
+            return "dynamic"
+        if self.path.startswith("/doc/") and self.__send_published_document():
+            return "published"
+        if self.tile_store is not None and self.path.startswith("/tiles/") and\
+           self.__send_stored_tile():
+            return "tile store"
+        if self.__send_compressed():
+            return "gzip"
+        return None
+
+################################################
+# Connectivity (online or offline maps)
+################################################
+
+def is_online_safe(timeout=2):
+    """
+    Check if internet is available
+    Uses dedicated socket to avoid global state mutation
+    Short timeout for reliability
+    """
+    test_socket = None
+    try:
+        test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        test_socket.settimeout(timeout)
+        test_socket.connect(("8.8.8.8", 53))
+
+        # Shutdown before close (forces immediate cleanup)
+        try:
+            test_socket.shutdown(socket.SHUT_RDWR)  # ← Force immediate shutdown
+#pylint: disable=W0702
+        except:
+            pass  # Already closed or not connected
+#pylint: enable=W0702
+
+        test_socket.close()
+        return True
+
+    except (socket.timeout, socket.error, OSError):
+        return False
+    finally:
+        if test_socket is not None:
+            try:
+                # Shutdown first (non-blocking)
+                test_socket.shutdown(socket.SHUT_RDWR)
+#pylint: disable=W0702
+            except:
+                pass  # Socket not connected or already shut down
+#pylint: enable=W0702
+            try:
+                test_socket.close()
+#pylint: disable=W0702
+            except:
+                pass
+#pylint: enable=W0702
+
+class ConnectivityMonitor:
+    ''' Monitors internet connectivity in a background thread.
+        The probe is repeated with a backoff (the interval is doubled as long as
+        the state is unchanged), and the last known state is cached, so that
+        callers (map generation) never need to wait for the network. '''
+
+    def __init__ (self, probe : Callable [[], bool] | NoneType = None,
+                  min_interval : float = 5.0, max_interval : float = 300.0,
+                  on_change : Callable [[bool], None] | NoneType = None):
+        ''' Parameters:
+                probe        : function returning True if online (default is_online_safe)
+                min_interval : seconds between probes after a change of state
+                max_interval : maximum seconds between probes
+                on_change    : function called with the new state when it changes
+        '''
+        self.__probe = probe if probe is not None else lambda : is_online_safe (timeout=1)
+        self.__on_change = on_change
+        self.__min_interval = min_interval
+        self.__max_interval = max_interval
+        self.__online = None
+        self.__last_check = None
+        self.__lock = threading.Lock ()
+        self.__wakeup = threading.Event ()
+        self.__probed = threading.Event ()
+        self.__stopped = threading.Event ()
+        self.__thread = None
+
+    def start (self):
+        ''' Start the background probing (if not already running) '''
+        with self.__lock:
+            if self.__thread is not None and self.__thread.is_alive ():
+                return
+            self.__stopped.clear ()
+            self.__thread = threading.Thread (target=self.__run, daemon=True,
+                                              name="ConnectivityMonitor")
+            self.__thread.start ()
+
+    def stop (self):
+        ''' Stop the background probing '''
+        self.__stopped.set ()
+        self.__wakeup.set ()
+
+    def refresh (self):
+        ''' Request a new probe as soon as possible (e.g. when an app is resumed) '''
+        self.__wakeup.set ()
+
+    def is_online (self) -> bool | NoneType:
+        ''' Returns the cached state. None if no probe has finished yet. '''
+        return self.__online
+
+    def get_last_check (self) -> float | NoneType:
+        ''' Returns the time (time.time) of the last finished probe '''
+        return self.__last_check
+
+    def wait_for_state (self, timeout : float) -> bool | NoneType:
+        ''' Wait (at most timeout seconds) until the first probe has finished.
+            Returns the cached state. '''
+        self.__probed.wait (timeout)
+        return self.__online
+
+    def __run (self):
+        interval = self.__min_interval
+        while not self.__stopped.is_set ():
+#pylint: disable=W0718
+            try:
+                online = bool (self.__probe ())
+            except Exception:
+                online = False
+#pylint: enable=W0718
+            if online == self.__online:
+                interval = min (interval * 2, self.__max_interval)
+            else:
+                interval = self.__min_interval
+                if self.__on_change is not None:
+                    self.__on_change (online)
+            self.__online = online
+            self.__last_check = time.time ()
+            self.__probed.set ()
+            self.__wakeup.wait (interval)
+            self.__wakeup.clear ()
@@ -12,12 +12,14 @@ from pydoc import locate
 import ipywidgets as widgets
 from ipywidgets import Layout, VBox
 from folium import Map as Folium_Map
+from persistence import JsonPersister
 from starfix import LatLonGeodetic, SightCollection, Sight, IntersectError,\
-                    get_representation, get_google_map_string
+                    get_representation, get_google_map_string, start_connectivity_monitor
 
 NUM_DICT = None
 FILE_NAME = None
 TYPE_ARRAY = None
+PERSISTER = None
 
 def get_dict () -> dict:
     ''' Return the genererated dictionary'''
@@ -38,8 +40,15 @@ def initialize (fn : str, init_dict : dict) :
 #pylint: disable=W0603
     global FILE_NAME
     global NUM_DICT
+    global PERSISTER
 #pylint: enable=W0603
     FILE_NAME = fn
+    if PERSISTER is not None:
+        PERSISTER.close ()
+    # Changes (every keystroke) are saved in the background, see dump_dict
+    PERSISTER = JsonPersister (fn)
+    # Probe connectivity in the background, so map generation never waits for it
+    start_connectivity_monitor ()
 
     try:
         with open(FILE_NAME, "r", encoding="utf-8") as f:
@@ -49,11 +58,14 @@ def initialize (fn : str, init_dict : dict) :
         NUM_DICT = init_dict
 
 def dump_dict ():
-    ''' Dumps the contents to a json file '''
-    j_dump = json.dumps (NUM_DICT)
-    assert isinstance (FILE_NAME, str)
-    with open(FILE_NAME, "w", encoding="utf-8") as f:
-        f.write(j_dump)
+    ''' Dumps the contents to a json file (written shortly, on a worker thread) '''
+    assert isinstance (PERSISTER, JsonPersister)
+    PERSISTER.save (NUM_DICT)
+
+def flush_dict ():
+    ''' Write a pending json file now (this is also done at exit) '''
+    if PERSISTER is not None:
+        PERSISTER.flush ()
 
 def handle_change (change):
     ''' Handler for widget events '''
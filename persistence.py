@@ -0,0 +1,155 @@
+''' Debounced, atomic saving of JSON state (the app and notebook configuration).
+    Rapid changes (such as typing) are coalesced into one write, done on a worker thread.
+    The file is replaced atomically, so a crash never leaves a partially written file.
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from types import NoneType
+
+def write_file_atomic (file_name : str, content : str):
+    ''' Write a text file atomically, and durably (synced to disk before the rename) '''
+    directory = os.path.dirname (os.path.abspath (file_name))
+    fd, temp_name = tempfile.mkstemp (dir=directory, prefix=os.path.basename (file_name) + ".",
+                                      suffix=".tmp")
+    try:
+        with os.fdopen (fd, "w", encoding="utf-8") as f:
+            f.write (content)
+            f.flush ()
+            os.fsync (f.fileno ())
+        os.replace (temp_name, file_name)
+    except BaseException:
+        try:
+            os.remove (temp_name)
+        except OSError:
+            pass
+        raise
+
+class JsonPersister:
+    ''' Saves a JSON document (typically a dict) to a file on a worker thread.
+        A write is done when there have been no changes for delay seconds,
+        but at least every max_delay seconds while changes keep coming.
+        Unchanged content is not written again. '''
+
+#pylint: disable=R0902
+    def __init__ (self, file_name : str, delay : float = 0.5, max_delay : float = 3.0,
+                  indent : int | NoneType = None):
+        ''' Parameters:
+                file_name   : the JSON file
+                delay       : quiet time (seconds) before a write
+                max_delay   : longest time (seconds) a change waits for its write
+                indent      : indentation of the JSON file (as for json.dumps)
+        '''
+        self.__file_name = file_name
+        self.__delay = delay
+        self.__max_delay = max_delay
+        self.__indent = indent
+        self.__condition = threading.Condition ()
+        self.__write_lock = threading.Lock ()
+        self.__pending = None
+        self.__sequence = 0
+        self.__first_change = 0.0
+        self.__last_change = 0.0
+        self.__written_sequence = 0
+        self.__written_content = None
+        self.__write_count = 0
+        self.__last_error = None
+        self.__thread = None
+        self.__closed = False
+        atexit.register (self.flush)
+#pylint: enable=R0902
+
+    def get_file_name (self) -> str:
+        ''' Returns the name of the JSON file '''
+        return self.__file_name
+
+    def get_write_count (self) -> int:
+        ''' Returns the number of writes to the file '''
+        return self.__write_count
+
+    def get_last_error (self) -> OSError | NoneType:
+        ''' Returns the error of the latest failed background write (None if none failed).
+            Errors of flush are raised to the caller. '''
+        return self.__last_error
+
+    def save (self, document : object):
+        ''' Save a document (soon). A copy is taken of a dict, so it can be changed at once. '''
+        if isinstance (document, dict):
+            document = dict (document)
+        with self.__condition:
+            if self.__closed:
+                raise ValueError ("Persister for <" + self.__file_name + "> is closed")
+            now = time.monotonic ()
+            if self.__pending is None:
+                self.__first_change = now
+            self.__last_change = now
+            self.__sequence += 1
+            self.__pending = (self.__sequence, document)
+            if self.__thread is None:
+                self.__thread = threading.Thread (target=self.__run, name="JsonPersister",
+                                                  daemon=True)
+                self.__thread.start ()
+            self.__condition.notify ()
+
+    def flush (self):
+        ''' Write a pending document now (for instance when the app is paused or exits) '''
+        with self.__condition:
+            pending = self.__pending
+            self.__pending = None
+        if pending is not None:
+            self.__write (*pending)
+
+    def close (self):
+        ''' Write a pending document and stop the worker thread '''
+        self.flush ()
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify ()
+            thread = self.__thread
+        if thread is not None:
+            thread.join ()
+        # Saved while closing
+        self.flush ()
+        atexit.unregister (self.flush)
+
+    def __write (self, sequence : int, document : object):
+        with self.__write_lock:
+            # A newer document may already have been written (by flush)
+            if sequence <= self.__written_sequence:
+                return
+            content = json.dumps (document, indent=self.__indent)
+            if content != self.__written_content:
+                write_file_atomic (self.__file_name, content)
+                self.__written_content = content
+                self.__write_count += 1
+            self.__written_sequence = sequence
+
+    def __run (self):
+        while True:
+            with self.__condition:
+                while self.__pending is None and not self.__closed:
+                    self.__condition.wait ()
+                if self.__closed:
+                    return
+                # Wait for a quiet period (but not longer than max_delay)
+                deadline = min (self.__last_change + self.__delay,
+                                self.__first_change + self.__max_delay)
+                now = time.monotonic ()
+                if now < deadline:
+                    self.__condition.wait (deadline - now)
+                    continue
+                pending = self.__pending
+                self.__pending = None
+            if pending is not None:
+                try:
+                    self.__write (*pending)
+                    self.__last_error = None
+                except OSError as e:
+                    # See get_last_error. The next change is written as usual.
+                    self.__last_error = e
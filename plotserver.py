@@ -7,10 +7,14 @@
 '''
 
 import socket
+import selectors
+import ipaddress
 import threading
 import time
 from datetime import datetime, timezone
-from typing import Optional, List, Tuple
+from functools import reduce
+from operator import xor
+from typing import Optional, List, Tuple, NamedTuple
 
 # pylint: disable=R0902
 class NMEAServer:
@@ -37,10 +41,7 @@ class NMEAServer:
 
     def calculate_checksum(self, sentence: str) -> str:
         """Calculate NMEA checksum (XOR of all characters)"""
-        checksum = 0
-        for char in sentence:
-            checksum ^= ord(char)
-        return f"{checksum:02X}"
+        return f"{reduce(xor, sentence.encode('ascii'), 0):02X}"
 
     def format_coordinate(self, coord: float, is_longitude: bool = False) -> str:
         """Convert decimal degrees to NMEA format"""
@@ -53,44 +54,35 @@ class NMEAServer:
         else:
             return f"{degrees:02d}{minutes:06.3f}"
 
-    def create_gga_sentence(self) -> str:
-        """Create NMEA GGA sentence (Global Positioning System Fix Data)"""
+    def create_gga_rmc_sentences(self) -> Tuple[str, str]:
+        """Create the NMEA GGA (Global Positioning System Fix Data) and RMC sentences,
+        with checksums and line endings, from one reading of the time and position"""
         now = datetime.now(timezone.utc)
-        time_str = now.strftime("%H%M%S.%f")[:-3]
+        time_str = f"{now.hour:02d}{now.minute:02d}{now.second:02d}.{now.microsecond//1000:03d}"
+        date_str = f"{now.day:02d}{now.month:02d}{now.year % 100:02d}"
 
         with self.position_lock:
             lat = self.latitude
             lon = self.longitude
 
-        lat_str = self.format_coordinate(abs(lat))
-        lat_dir = 'N' if lat >= 0 else 'S'
-        lon_str = self.format_coordinate(abs(lon), True)
-        lon_dir = 'E' if lon >= 0 else 'W'
+        position = f"{self.format_coordinate(abs(lat))},{'N' if lat >= 0 else 'S'}," +\
+                   f"{self.format_coordinate(abs(lon), True)},{'E' if lon >= 0 else 'W'}"
+        gga = f"GPGGA,{time_str},{position},1,08,1.0,10.0,M,0.0,M,,"
+        rmc = f"GPRMC,{time_str},A,{position},0.0,0.0,{date_str},0.0,E"
+        return f"${gga}*{self.calculate_checksum(gga)}\r\n", \
+               f"${rmc}*{self.calculate_checksum(rmc)}\r\n"
 
-        sentence = \
-        f"GPGGA,{time_str},{lat_str},{lat_dir},{lon_str},{lon_dir},1,08,1.0,10.0,M,0.0,M,,"
-        checksum = self.calculate_checksum(sentence)
-        return f"${sentence}*{checksum}\r\n"
+    def create_gga_sentence(self) -> str:
+        """Create NMEA GGA sentence (Global Positioning System Fix Data)"""
+        return self.create_gga_rmc_sentences()[0]
 
     def create_rmc_sentence(self) -> str:
         """Create NMEA RMC sentence"""
-        now = datetime.now(timezone.utc)
-        time_str = now.strftime("%H%M%S.%f")[:-3]
-        date_str = now.strftime("%d%m%y")
+        return self.create_gga_rmc_sentences()[1]
 
-        with self.position_lock:
-            lat = self.latitude
-            lon = self.longitude
-
-        lat_str = self.format_coordinate(abs(lat))
-        lat_dir = 'N' if lat >= 0 else 'S'
-        lon_str = self.format_coordinate(abs(lon), True)
-        lon_dir = 'E' if lon >= 0 else 'W'
-
-        sentence =\
-        f"GPRMC,{time_str},A,{lat_str},{lat_dir},{lon_str},{lon_dir},0.0,0.0,{date_str},0.0,E"
-        checksum = self.calculate_checksum(sentence)
-        return f"${sentence}*{checksum}\r\n"
+    def create_sentences(self) -> bytes:
+        """Create the GGA and RMC sentences, as bytes ready for sending"""
+        return "".join(self.create_gga_rmc_sentences()).encode('ascii')
 
     def update_position(self, latitude: float, longitude: float):
         """Thread-safe position update"""
@@ -140,9 +132,7 @@ class NMEAServer:
                     clients_copy = self.clients.copy()
 
                 if clients_copy:
-                    gga_sentence = self.create_gga_sentence()
-                    rmc_sentence = self.create_rmc_sentence()
-                    data = (gga_sentence + rmc_sentence).encode('ascii')
+                    data = self.create_sentences()
 
                     disconnected = []
                     for client in clients_copy:
@@ -297,10 +287,399 @@ class NMEAServer:
         print("NMEA server stopped")
 
 
+# pylint: disable=R0903
+class _NMEAClient:
+    """State of a client of the event loop server"""
+
+    def __init__(self, address: Tuple[str, int]):
+        self.address = address
+        # Data not yet accepted by the (non-blocking) socket
+        self.pending = bytearray()
+# pylint: enable=R0903
+
+
+class SelectorNMEAServer(NMEAServer):
+    """NMEA 0183 server handling accept, broadcast and disconnects for all
+    clients on a single thread (event loop using selectors).
+    Same API as NMEAServer (start, stop, update_position).
+    A position update is sent at once (and then repeated every interval).
+    Each client has a small send queue, a client that cannot keep up is dropped."""
+
+    def __init__(self, host='0.0.0.0', port=10110, interval=1.0, max_queue_bytes=4096):
+        super().__init__(host, port)
+        self.interval = interval
+        self.max_queue_bytes = max_queue_bytes
+        self.position_changed = False
+        self.selector: Optional[selectors.BaseSelector] = None
+        self.loop_thread: Optional[threading.Thread] = None
+        # Used for waking up the event loop from other threads
+        self.wake_receiver: Optional[socket.socket] = None
+        self.wake_sender: Optional[socket.socket] = None
+
+    def start(self):
+        """Start the NMEA server (returns at once, the event loop runs in a thread)"""
+        if self.running:
+            print("Server already running")
+            return
+
+        self.running = True
+        print(f"Starting NMEA server on {self.host}:{self.port}")
+
+        try:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((self.host, self.port))
+            self.server_socket.listen(128)
+            self.server_socket.setblocking(False)
+            self.port = self.server_socket.getsockname()[1]
+
+            self.wake_receiver, self.wake_sender = socket.socketpair()
+            self.wake_receiver.setblocking(False)
+
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.server_socket, selectors.EVENT_READ, "accept")
+            self.selector.register(self.wake_receiver, selectors.EVENT_READ, "wake")
+
+            self.loop_thread = threading.Thread(
+                target=self._run_loop,
+                name="NMEA-Loop",
+                daemon=True
+            )
+            self.loop_thread.start()
+            print(f"NMEA server listening on {self.host}:{self.port}")
+
+        except Exception as e:
+            print(f"Server startup error: {e}")
+            self.stop()
+            raise
+
+    def update_position(self, latitude: float, longitude: float):
+        """Thread-safe position update, sent to the clients at once"""
+        super().update_position(latitude, longitude)
+        with self.position_lock:
+            self.position_changed = True
+        self._wake()
+
+    def _wake(self):
+        """Wake up the event loop"""
+        if self.wake_sender is not None:
+            try:
+                self.wake_sender.send(b"\0")
+            except OSError:
+                pass
+
+    def _run_loop(self):
+        """The event loop"""
+        print("Event loop started")
+        assert self.selector is not None
+        next_tick = time.monotonic()
+        while self.running:
+            timeout = max(0.0, next_tick - time.monotonic())
+            for key, mask in self.selector.select(timeout):
+                if key.data == "accept":
+                    self._accept()
+                elif key.data == "wake":
+                    self._drain_wake()
+                else:
+                    if mask & selectors.EVENT_READ:
+                        self._read_client(key.fileobj)
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush_client(key.fileobj)
+            with self.position_lock:
+                position_changed = self.position_changed
+                self.position_changed = False
+            now = time.monotonic()
+            if position_changed or now >= next_tick:
+                self._broadcast()
+                next_tick = now + self.interval
+        print("Event loop stopped")
+
+    def _drain_wake(self):
+        """Empty the wake-up socket"""
+        try:
+            while self.wake_receiver is not None and self.wake_receiver.recv(256):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _accept(self):
+        """Accept a new client"""
+        assert self.server_socket is not None and self.selector is not None
+        try:
+            client_socket, address = self.server_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        client_socket.setblocking(False)
+        self.selector.register(client_socket, selectors.EVENT_READ, _NMEAClient(address))
+        with self.clients_lock:
+            self.clients.append(client_socket)
+        print(f"Client connected from {address}")
+        # A new client gets the current position at once
+        with self.position_lock:
+            has_position = self.last_update is not None
+        if has_position:
+            self._send(client_socket, self.create_sentences())
+
+    def _read_client(self, client_socket):
+        """Incoming data is ignored, but a closed connection is detected"""
+        try:
+            data = client_socket.recv(1024)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop_client(client_socket)
+
+    def _drop_client(self, client_socket: socket.socket):
+        """Remove a client"""
+        assert self.selector is not None
+        address = None
+        try:
+            address = self.selector.unregister(client_socket).data.address
+        except (KeyError, ValueError):
+            pass
+        with self.clients_lock:
+            if client_socket in self.clients:
+                self.clients.remove(client_socket)
+        try:
+            client_socket.close()
+# pylint: disable=W0702
+        except:
+            pass
+# pylint: enable=W0702
+        print(f"Client {address} disconnected")
+
+    def _send(self, client_socket: socket.socket, data: bytes):
+        """Send data to a client, queueing what the socket does not accept"""
+        assert self.selector is not None
+        try:
+            client = self.selector.get_key(client_socket).data
+        except (KeyError, ValueError):
+            return
+        if not client.pending:
+            try:
+                sent = client_socket.send(data)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError as e:
+                print(f"Error sending to client: {e}")
+                self._drop_client(client_socket)
+                return
+            if sent == len(data):
+                return
+            data = data[sent:]
+            self.selector.modify(client_socket,
+                                 selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+        if len(client.pending) + len(data) > self.max_queue_bytes:
+            print(f"Client {client.address} is too slow")
+            self._drop_client(client_socket)
+            return
+        client.pending += data
+
+    def _flush_client(self, client_socket: socket.socket):
+        """Send queued data to a client"""
+        assert self.selector is not None
+        try:
+            client = self.selector.get_key(client_socket).data
+        except (KeyError, ValueError):
+            return
+        try:
+            sent = client_socket.send(client.pending)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            print(f"Error sending to client: {e}")
+            self._drop_client(client_socket)
+            return
+        del client.pending[:sent]
+        if not client.pending:
+            self.selector.modify(client_socket, selectors.EVENT_READ, client)
+
+    def _broadcast(self):
+        """Send the position to all clients. The sentences are created once for all clients."""
+        with self.position_lock:
+            has_position = self.last_update is not None
+        with self.clients_lock:
+            clients_copy = self.clients.copy()
+        if not has_position or not clients_copy:
+            return
+        data = self.create_sentences()
+        for client in clients_copy:
+            self._send(client, data)
+
+    def stop(self):
+        """Stop the NMEA server and clean up all resources"""
+        if not self.running:
+            return
+
+        print("Stopping NMEA server...")
+        self.running = False
+        self._wake()
+
+        if self.loop_thread and self.loop_thread.is_alive():
+            self.loop_thread.join(timeout=3.0)
+            if self.loop_thread.is_alive():
+                print("Warning: Event loop didn't stop cleanly")
+
+        with self.clients_lock:
+            for client in self.clients:
+                try:
+                    client.close()
+# pylint: disable=W0702
+                except:
+                    pass
+# pylint: enable=W0702
+            self.clients.clear()
+
+        for s in (self.server_socket, self.wake_receiver, self.wake_sender):
+            if s is not None:
+                s.close()
+        self.server_socket = self.wake_receiver = self.wake_sender = None
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+
+        print("NMEA server stopped")
+
+
+def resolve_udp_address(host: str, port: int) -> Tuple[int, tuple]:
+    """Resolve a host name or address for sending UDP datagrams.
+    Returns the address family and the socket address (for sendto).
+    A name that cannot be resolved is taken as IPv4."""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+    except (socket.gaierror, UnicodeError):
+        infos = []
+    for family, _, _, _, address in infos:
+        if family in (socket.AF_INET, socket.AF_INET6):
+            return family, address
+    return socket.AF_INET, (host, port)
+
+
+class UDPNMEAServer(NMEAServer):
+    """NMEA 0183 output over UDP, from a single socket to any number of listeners.
+    The host is the destination: a broadcast address (default), a multicast group
+    or a single plotter. Same API as NMEAServer (start, stop, update_position).
+    A position update is sent at once, and then repeated every interval."""
+
+    def __init__(self, host='255.255.255.255', port=10110, interval=1.0, ttl=1):
+        super().__init__(host, port)
+        self.interval = interval
+        self.ttl = ttl
+        # The destination (socket address), resolved at start
+        self.address: Optional[tuple] = None
+        self.send_thread: Optional[threading.Thread] = None
+        self.wake_event = threading.Event()
+
+    def start(self):
+        """Start the NMEA server"""
+        if self.running:
+            print("Server already running")
+            return
+
+        self.running = True
+        print(f"Starting UDP NMEA output to {self.host}:{self.port}")
+
+        try:
+            family, self.address = resolve_udp_address(self.host, self.port)
+            self.server_socket = socket.socket(family, socket.SOCK_DGRAM)
+            try:
+                # Without the IPv6 scope (such as "%eth0")
+                is_multicast = ipaddress.ip_address(self.address[0].split('%')[0]).is_multicast
+            except ValueError:
+                is_multicast = False
+            if is_multicast and family == socket.AF_INET6:
+                self.server_socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS,
+                                              self.ttl)
+            elif is_multicast:
+                self.server_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,
+                                              self.ttl)
+            elif family == socket.AF_INET:
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+            self.wake_event.clear()
+            self.send_thread = threading.Thread(
+                target=self._send_loop,
+                name="NMEA-UDP",
+                daemon=True
+            )
+            self.send_thread.start()
+
+        except Exception as e:
+            print(f"Server startup error: {e}")
+            self.stop()
+            raise
+
+    def update_position(self, latitude: float, longitude: float):
+        """Thread-safe position update, sent at once"""
+        super().update_position(latitude, longitude)
+        self.wake_event.set()
+
+    def _send_loop(self):
+        """Send the sentences every interval, or at once after an update"""
+        print("UDP send thread started")
+        while self.running:
+            with self.position_lock:
+                has_position = self.last_update is not None
+            if has_position and self.server_socket is not None:
+                try:
+                    self.server_socket.sendto(self.create_sentences(), self.address)
+                except OSError as e:
+                    print(f"Error sending NMEA data: {e}")
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+        print("UDP send thread stopped")
+
+    def stop(self):
+        """Stop the NMEA server and clean up all resources"""
+        if not self.running:
+            return
+
+        print("Stopping NMEA server...")
+        self.running = False
+        self.wake_event.set()
+
+        if self.send_thread and self.send_thread.is_alive():
+            self.send_thread.join(timeout=3.0)
+            if self.send_thread.is_alive():
+                print("Warning: UDP send thread didn't stop cleanly")
+
+        if self.server_socket:
+            self.server_socket.close()
+            self.server_socket = None
+
+        print("NMEA server stopped")
+
+
+def create_nmea_server(transport: str = "tcp", port: int = 10110,
+                       host: Optional[str] = None) -> NMEAServer:
+    """Create an NMEA server for a transport:
+    "tcp" : plotters connect to the server (host is the address to listen on)
+    "udp" : sentences are sent to host (broadcast, multicast or a single plotter)"""
+    if transport == "tcp":
+        return SelectorNMEAServer(host=host or '0.0.0.0', port=port)
+    if transport == "udp":
+        return UDPNMEAServer(host=host or '255.255.255.255', port=port)
+    raise ValueError(f"Unknown NMEA transport <{transport}>")
+
+
+class PositionUpdate(NamedTuple):
+    """A position for the plot server (decimal degrees)"""
+    latitude: float
+    longitude: float
+
+
+# The plot server is stopped after this time (seconds) without activity
+PLOT_SERVER_IDLE_TIMEOUT = 20.0
+
+
 class PlotServerManager:
     """
     Singleton manager for NMEA plot server lifecycle.
     Ensures only one server instance runs and provides proper cleanup.
+    The server runs in one thread, waiting on a condition variable for
+    position updates, a stop request or the idle deadline (no polling).
     """
 
     _instance = None
@@ -323,95 +702,108 @@ class PlotServerManager:
         self.server: Optional[NMEAServer] = None
         self.server_thread: Optional[threading.Thread] = None
         self.is_running = False
-        self.kill_timer: Optional[threading.Timer] = None
+        self.idle_timeout = PLOT_SERVER_IDLE_TIMEOUT
+        self.port = 10110
+        self._condition = threading.Condition()
+        self._deadline = 0.0
+        self._pending: Optional[PositionUpdate] = None
+        self._stop_requested = False
         self._initialized = True
         print("PlotServerManager initialized")
 
-    def start(self):
-        """Start the plot server (idempotent - safe to call multiple times)"""
-        with self._lock:
+    def start(self, transport: str = "tcp"):
+        """Start the plot server (idempotent - safe to call multiple times)
+        transport is "tcp" or "udp" (see create_nmea_server)"""
+        with self._condition:
+            self._deadline = time.monotonic() + self.idle_timeout
             if self.is_running:
-                print("PlotServerManager: Server already running, resetting kill timer")
-                self._reset_kill_timer()
+                print("PlotServerManager: Server already running, idle deadline extended")
+                self._condition.notify()
                 return
 
             print("PlotServerManager: Starting new server")
-
-            # Create new server instance
-            self.server = NMEAServer(host='0.0.0.0', port=10110)
-            self.is_running = True  # ← Change this line
-
-            # Start server in dedicated thread
+            self.is_running = True
+            self._stop_requested = False
+            self._pending = None
+            previous_thread = self.server_thread
             self.server_thread = threading.Thread(
-                target=self.server.start,
+                target=self._run,
+                args=(transport, previous_thread),
                 name="PlotServerMain",
                 daemon=True
             )
             self.server_thread.start()
 
-            # Start automatic shutdown timer
-            self._reset_kill_timer()
-
-            print("PlotServerManager: Server started")
-
-    def _reset_kill_timer(self):
-        """Reset the automatic shutdown timer (20 seconds of inactivity)"""
-        # Cancel existing timer
-        if self.kill_timer:
-            self.kill_timer.cancel()
-
-        # Create new timer
-        self.kill_timer = threading.Timer(20.0, self._auto_shutdown)
-        self.kill_timer.daemon = True
-        self.kill_timer.start()
-
-    def _auto_shutdown(self):
-        """Automatically shutdown server after inactivity"""
-        print("PlotServerManager: Auto-shutdown triggered (20s inactivity)")
-        self.stop()
+    def _run(self, transport: str, previous_thread: Optional[threading.Thread]):
+        """Run the server until stopped, or idle for idle_timeout seconds"""
+        if previous_thread is not None:
+            # Let a server that was just stopped release its socket
+            previous_thread.join(timeout=5.0)
+        server = create_nmea_server(transport, port=self.port)
+        try:
+            server.start()
+            with self._condition:
+                self.server = server
+                # An update may have arrived during startup
+                self._condition.notify()
+            while True:
+                with self._condition:
+                    while not self._stop_requested and self._pending is None:
+                        remaining = self._deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    update = self._pending
+                    self._pending = None
+                    if update is None:
+                        # Stop requested, or idle. Later requests start a new server.
+                        self.is_running = False
+                        print("PlotServerManager: Server stopping " +\
+                              ("(stop requested)" if self._stop_requested else "(idle)"))
+                        break
+                server.update_position(update.latitude, update.longitude)
+# pylint: disable=W0718
+        except Exception as e:
+# pylint: enable=W0718
+            print(f"PlotServerManager: Server error: {e}")
+        finally:
+            server.stop()
+            with self._condition:
+                if self.server_thread is threading.current_thread():
+                    self.is_running = False
+                if self.server is server:
+                    self.server = None
+            print("PlotServerManager: Server stopped and cleaned up")
 
     def update_position(self, lat: float, lon: float):
-        """Update position and reset kill timer"""
-        with self._lock:
-            if self.server and self.is_running:
-                self.server.update_position(lat, lon)
-                self._reset_kill_timer()
-            else:
+        """Update position and extend the idle deadline"""
+        with self._condition:
+            if not self.is_running:
                 print("PlotServerManager: Server not running, cannot update position")
+                return
+            self._pending = PositionUpdate(lat, lon)
+            self._deadline = time.monotonic() + self.idle_timeout
+            self._condition.notify()
 
     def stop(self):
         """Stop the plot server and clean up resources"""
-        with self._lock:
+        with self._condition:
             if not self.is_running:
                 print("PlotServerManager: Server not running, nothing to stop")
                 return
-
             print("PlotServerManager: Stopping server")
+            self._stop_requested = True
+            self._condition.notify()
+            server_thread = self.server_thread
 
-            # Cancel kill timer
-            if self.kill_timer:
-                self.kill_timer.cancel()
-                self.kill_timer = None
-
-            # Stop server
-            if self.server:
-                self.server.stop()
-                self.server = None
-
-            # Wait for server thread
-            if self.server_thread and self.server_thread.is_alive():
-                self.server_thread.join(timeout=5.0)
-                if self.server_thread.is_alive():
-                    print("PlotServerManager: Warning - server thread didn't stop cleanly")
-
-            self.is_running = False
-            self.server_thread = None
-
-            print("PlotServerManager: Server stopped and cleaned up")
+        if server_thread is not None and server_thread is not threading.current_thread():
+            server_thread.join(timeout=5.0)
+            if server_thread.is_alive():
+                print("PlotServerManager: Warning - server thread didn't stop cleanly")
 
     def get_status(self) -> dict:
         """Get current server status (for debugging)"""
-        with self._lock:
+        with self._condition:
 
             status: dict[str, int | bool] = {
                 'is_running': self.is_running,
@@ -435,9 +827,9 @@ plot_server = PlotServerManager()
 
 
 # Convenience functions for backward compatibility
-def start_plotserver():
+def start_plotserver(transport: str = "tcp"):
     """Start the plot server"""
-    plot_server.start()
+    plot_server.start(transport)
 
 
 def kill_plotserver():
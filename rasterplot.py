@@ -0,0 +1,190 @@
+''' Headless raster/vector plotting of sight reductions (PNG, SVG etc) with matplotlib.
+    Intended for batch jobs (QA plots for many fixes), without a browser or HTML maps.
+    Plot jobs are plain data (picklable), so many fixes can be rendered in parallel
+    worker processes.
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+from math import cos, log2
+from multiprocessing import Pool
+from types import NoneType
+
+from starfix import LatLon, LatLonGeocentric, LatLonGeodetic, Sight, Circle, \
+     deg_to_rad, get_dm
+
+MATPLOTLIB_INITIALIZED = False
+MATPLOTLIB_LOAD_ERROR = ""
+try:
+#pylint: disable=W0611
+    import matplotlib
+#pylint: enable=W0611
+    matplotlib.use ("Agg")
+    MATPLOTLIB_INITIALIZED = True
+except ModuleNotFoundError as mnfe:
+    MATPLOTLIB_LOAD_ERROR = str(mnfe)
+except ImportError as ie:
+    MATPLOTLIB_LOAD_ERROR = str(ie)
+
+def check_matplotlib ():
+    ''' Check if matplotlib is installed. Otherwise abort with exception '''
+    if not MATPLOTLIB_INITIALIZED:
+        raise ValueError\
+            ("Matplotlib not available. Cannot generate plots. "+\
+            "Install matplotlib with \"pip install matplotlib\"")
+
+#pylint: disable=R0902
+#pylint: disable=R0903
+class FixPlot:
+    ''' A plot job for one fix. Only plain data (numbers and strings), so that jobs
+        can be sent to worker processes. Coordinates are (lat, lon) in degrees. '''
+
+#pylint: disable=R0913
+#pylint: disable=R0917
+    def __init__ (self, file_name : str, center : tuple [float, float],
+                  extent_nm : float = 10, title : str = "", dpi : int = 100,
+                  size_inches : tuple [float, float] = (6, 6)):
+        ''' Parameters:
+                file_name   : output file, the format is taken from the extension (png, svg...)
+                center      : center of the plot (geodetic)
+                extent_nm   : half width/height of the plot, in nautical miles
+        '''
+        self.file_name   = file_name
+        self.center      = center
+        self.extent_nm   = extent_nm
+        self.title       = title
+        self.dpi         = dpi
+        self.size_inches = size_inches
+        # (gp lat, gp lon, angle (degrees), label). The GP is geocentric.
+        self.circles  = list [tuple [float, float, float, str]] ()
+        # (lat, lon, label)
+        self.fixes    = list [tuple [float, float, str]] ()
+        # (lat, lon, semi major (nm), semi minor (nm), orientation (degrees from north))
+        self.ellipses = list [tuple [float, float, float, float, float]] ()
+#pylint: enable=R0913
+#pylint: enable=R0917
+
+    def add_sight (self, sight : Sight, label : str | NoneType = None):
+        ''' Add the circle of equal altitude of a sight '''
+        gp = sight.get_gp ()
+        self.circles.append ((gp.get_lat (), gp.get_lon (), sight.get_angle (geodetic=False),
+                              label if label is not None else sight.get_object_name ()))
+
+    def add_fix (self, position : LatLon, label : str = "Fix"):
+        ''' Add a fix (position). Geocentric positions are converted to geodetic. '''
+        if isinstance (position, LatLonGeocentric):
+            position = LatLonGeodetic (ll = position)
+        self.fixes.append ((position.get_lat (), position.get_lon (), label))
+
+#pylint: disable=R0913
+#pylint: disable=R0917
+    def add_error_ellipse (self, position : LatLon, semi_major_nm : float,
+                           semi_minor_nm : float, orientation : float):
+        ''' Add an error ellipse (see voyage.VoyageEpoch.get_error_ellipse) '''
+        if isinstance (position, LatLonGeocentric):
+            position = LatLonGeodetic (ll = position)
+        self.ellipses.append ((position.get_lat (), position.get_lon (),
+                               semi_major_nm, semi_minor_nm, orientation))
+#pylint: enable=R0913
+#pylint: enable=R0917
+
+    @staticmethod
+    def from_sights (file_name : str, sights : list [Sight], fix : LatLon,
+                     accuracy : float = 1, extent_nm : float = 10, title : str = "") -> object:
+        ''' Create a plot job for a sight reduction (a list of sights and a fix).
+            The accuracy (nm) is drawn as a circular error ellipse. '''
+        if isinstance (fix, LatLonGeocentric):
+            fix = LatLonGeodetic (ll = fix)
+        job = FixPlot (file_name, (fix.get_lat (), fix.get_lon ()),
+                       extent_nm=extent_nm, title=title)
+        for i, s in enumerate (sights):
+            job.add_sight (s, "#" + str (i + 1) + ". " + s.get_object_name ())
+        job.add_fix (fix)
+        if accuracy > 0:
+            job.add_error_ellipse (fix, accuracy, accuracy, 0)
+        return job
+#pylint: enable=R0902
+#pylint: enable=R0903
+
+def __format_angle (angle : float, positive : str, negative : str) -> str:
+    ''' Format a grid label in degrees and minutes '''
+    d, m = get_dm (abs (angle))
+    return f"{d}°{round (m):02d}'{positive if angle >= 0 else negative}"
+
+#pylint: disable=R0914
+def render_fix_plot (job : FixPlot) -> str:
+    ''' Render a plot job to its file. Returns the file name. '''
+    check_matplotlib ()
+#pylint: disable=C0415
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Ellipse
+    from matplotlib.ticker import FuncFormatter, MultipleLocator
+#pylint: enable=C0415
+
+    lat_0, lon_0 = job.center
+    cos_lat_0 = cos (deg_to_rad (lat_0))
+
+    def to_xy (lat : float, lon : float) -> tuple [float, float]:
+        # Local (equirectangular) projection in nautical miles
+        return ((lon - lon_0 + 180) % 360 - 180) * 60 * cos_lat_0, (lat - lat_0) * 60
+
+    fig = Figure (figsize=job.size_inches, dpi=job.dpi)
+    ax = fig.add_subplot ()
+    extent = job.extent_nm
+    # Level of detail for the circles (the zoom level where a pixel matches the plot)
+    pixel_degrees = 2 * extent / 60 / (job.size_inches [0] * job.dpi)
+    zoom = max (0, log2 (360 / (256 * pixel_degrees)))
+    for lat, lon, angle, label in job.circles:
+        c = Circle (LatLonGeocentric (lat, lon), angle)
+        for i, segment in enumerate (c.get_polyline (adjust_geodetic=True, zoom=zoom)):
+            xy = [to_xy (p[0], p[1]) for p in segment]
+            ax.plot ([p[0] for p in xy], [p[1] for p in xy], linewidth=1.5,
+                     label=label if i == 0 else None)
+    for lat, lon, semi_major, semi_minor, orientation in job.ellipses:
+        ax.add_patch (Ellipse (to_xy (lat, lon), 2 * semi_major, 2 * semi_minor,
+                               angle=90 - orientation, fill=False, color="black",
+                               linewidth=1))
+    for lat, lon, label in job.fixes:
+        x, y = to_xy (lat, lon)
+        ax.plot ([x], [y], marker="+", color="black", markersize=12)
+        ax.annotate (label, (x, y), textcoords="offset points", xytext=(6, 6))
+
+    # Grid lines on whole minutes (or degrees, for large plots), at most 5 in each direction
+    def grid_step (extent_minutes : float) -> int:
+        for candidate in [1, 2, 5, 10, 30, 60, 120, 300]:
+            if extent_minutes / candidate <= 5:
+                return candidate
+        return 600
+    lat_step = grid_step (extent)
+    lon_step = grid_step (extent / cos_lat_0)
+    ax.yaxis.set_major_locator (MultipleLocator (lat_step, offset=-lat_0 * 60))
+    ax.xaxis.set_major_locator (MultipleLocator (lon_step * cos_lat_0,
+                                                 offset=-lon_0 * 60 * cos_lat_0))
+    ax.yaxis.set_major_formatter (FuncFormatter (
+        lambda y, _ : __format_angle (lat_0 + y / 60, "N", "S")))
+    ax.xaxis.set_major_formatter (FuncFormatter (
+        lambda x, _ : __format_angle (lon_0 + x / 60 / cos_lat_0, "E", "W")))
+    ax.tick_params (axis="x", labelrotation=45)
+    ax.grid (True, linewidth=0.5, color="green", alpha=0.5)
+    ax.set_xlim (-extent, extent)
+    ax.set_ylim (-extent, extent)
+    ax.set_aspect ("equal")
+    if job.title != "":
+        ax.set_title (job.title)
+    if len (job.circles) > 0:
+        ax.legend (loc="lower right", fontsize="small")
+    fig.tight_layout ()
+    fig.savefig (job.file_name)
+    return job.file_name
+#pylint: enable=R0914
+
+def render_fix_plots (jobs : list [FixPlot], processes : int | NoneType = None) -> list [str]:
+    ''' Render many plot jobs, in parallel worker processes.
+        processes is the number of workers (default is the number of CPUs),
+        set to 1 to render in this process.
+        Returns the file names (in the order of the jobs). '''
+    check_matplotlib ()
+    if processes == 1 or len (jobs) <= 1:
+        return [render_fix_plot (job) for job in jobs]
+    with Pool (processes=processes) as pool:
+        return pool.map (render_fix_plot, jobs, chunksize=max (1, len (jobs) // 64))
@@ -0,0 +1,186 @@
+''' Background sampling of resource usage, for finding leaks in the field.
+    Samples (threads, file descriptors, Python objects, RSS and optionally the top
+    allocation sites from tracemalloc) are kept in a ring buffer, which can be written
+    to a file or served by the local HTTP server (see starfix.set_dynamic_document).
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+import gc
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from collections.abc import Callable
+from types import NoneType
+from typing import NamedTuple
+
+from starfix import set_dynamic_document
+
+RESOURCES_PATH = "/status/resources.json"
+
+def get_rss_kb () -> int | NoneType:
+    ''' Returns the resident set size (kB) of this process, if available (Linux, Android) '''
+    try:
+        with open ("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith ("VmRSS:"):
+                    return int (line.split () [1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def get_fd_count () -> int | NoneType:
+    ''' Returns the number of open file descriptors, if available (Linux, Android) '''
+    try:
+        return len (os.listdir ("/proc/self/fd"))
+    except OSError:
+        return None
+
+class ResourceSample (NamedTuple):
+    ''' Resource usage at one point in time '''
+    time          : float
+    threads       : int
+    thread_names  : list [str]
+    fds           : int | NoneType
+    objects       : int
+    rss_kb        : int | NoneType
+    traced_kb     : int | NoneType
+    # Allocation sites (file:line, size (kB), growth since start (kB), count),
+    # largest growth first
+    top_sites     : list [tuple [str, int, int, int]]
+    # Application specific metrics (see ResourceSampler)
+    extra         : dict
+
+#pylint: disable=R0902
+class ResourceSampler:
+    ''' Samples resource usage on a worker thread, keeping the latest samples '''
+
+#pylint: disable=R0913
+#pylint: disable=R0917
+    def __init__ (self, interval : float = 10.0, capacity : int = 360,
+                  trace_allocations : bool = False, top_count : int = 10,
+                  extra : Callable [[], dict] | NoneType = None):
+        ''' Parameters:
+                interval            : seconds between samples
+                capacity            : number of samples kept (older samples are dropped)
+                trace_allocations   : record allocation sites with tracemalloc
+                                      (this slows down the application)
+                top_count           : number of allocation sites in a sample
+                extra               : function returning application specific metrics
+        '''
+        self.__interval = interval
+        self.__samples = deque [ResourceSample] (maxlen=capacity)
+        self.__trace_allocations = trace_allocations
+        self.__top_count = top_count
+        self.__extra = extra
+        self.__lock = threading.Lock ()
+        self.__stop_event = threading.Event ()
+        self.__thread = None
+        self.__baseline = None
+        self.__started_tracing = False
+#pylint: enable=R0913
+#pylint: enable=R0917
+
+    def start (self):
+        ''' Start sampling '''
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            if self.__trace_allocations and not tracemalloc.is_tracing ():
+                tracemalloc.start ()
+                self.__started_tracing = True
+            self.__stop_event.clear ()
+            self.__thread = threading.Thread (target=self.__run, name="ResourceSampler",
+                                              daemon=True)
+            self.__thread.start ()
+
+    def stop (self):
+        ''' Stop sampling (the samples are kept) '''
+        with self.__lock:
+            thread = self.__thread
+            self.__thread = None
+        if thread is None:
+            return
+        self.__stop_event.set ()
+        thread.join ()
+        if self.__started_tracing:
+            tracemalloc.stop ()
+            self.__started_tracing = False
+            with self.__lock:
+                self.__baseline = None
+
+    def is_running (self) -> bool:
+        ''' Check if the sampler is running '''
+        with self.__lock:
+            return self.__thread is not None
+
+    def __get_top_sites (self) -> tuple [int | NoneType, list [tuple [str, int, int, int]]]:
+        if not tracemalloc.is_tracing ():
+            return None, []
+        snapshot = tracemalloc.take_snapshot ().filter_traces (
+            [tracemalloc.Filter (False, tracemalloc.__file__)])
+        # sample may also be called from other threads than the worker
+        with self.__lock:
+            if self.__baseline is None:
+                self.__baseline = snapshot
+            baseline = self.__baseline
+        top_sites = []
+        for stat in snapshot.compare_to (baseline, "lineno") [:self.__top_count]:
+            frame = stat.traceback [0]
+            top_sites.append ((frame.filename + ":" + str (frame.lineno), stat.size // 1024,
+                               stat.size_diff // 1024, stat.count))
+        return tracemalloc.get_traced_memory () [0] // 1024, top_sites
+
+    def sample (self) -> ResourceSample:
+        ''' Take a sample now (it is also added to the buffer) '''
+        traced_kb, top_sites = self.__get_top_sites ()
+        extra = {}
+        if self.__extra is not None:
+# pylint: disable=W0718
+            try:
+                extra = self.__extra ()
+            except Exception as e:
+                extra = {"error" : str (e)}
+# pylint: enable=W0718
+        s = ResourceSample (time=time.time (),
+                            threads=threading.active_count (),
+                            thread_names=[t.name for t in threading.enumerate ()],
+                            fds=get_fd_count (),
+                            objects=len (gc.get_objects ()),
+                            rss_kb=get_rss_kb (),
+                            traced_kb=traced_kb,
+                            top_sites=top_sites,
+                            extra=extra)
+        with self.__lock:
+            self.__samples.append (s)
+        return s
+
+    def get_samples (self) -> list [ResourceSample]:
+        ''' Returns the samples in the buffer (oldest first) '''
+        with self.__lock:
+            return list (self.__samples)
+
+    def to_json (self) -> str:
+        ''' Returns the samples as JSON '''
+        return json.dumps ({"interval" : self.__interval,
+                            "samples" : [s._asdict () for s in self.get_samples ()]},
+                           indent=1)
+
+    def dump (self, file_name : str):
+        ''' Write the samples to a JSON file '''
+        content = self.to_json ()
+        with open (file_name, "w", encoding="utf-8") as f:
+            f.write (content)
+
+    def serve (self, path : str = RESOURCES_PATH):
+        ''' Serve the samples (as JSON) with the local HTTP server at path '''
+        set_dynamic_document (path, self.to_json)
+
+    def __run (self):
+        while not self.__stop_event.is_set ():
+            self.sample ()
+            self.__stop_event.wait (self.__interval)
+#pylint: enable=R0902
@@ -9,20 +9,23 @@ from math import  pi, sin, cos, acos, sqrt, tan, atan2
 from random import gauss
 from datetime import datetime, date, timedelta, timezone
 from types import NoneType
-from typing import Optional
 from collections.abc import Callable
 import pathlib
 import os
+from importlib.util import find_spec
 import socket
 import time
 
-import http.server
 import socketserver
 
 from threading import Thread
-import webbrowser
 from configparser import ConfigParser
 
+from mapoutput import MAP_COORDINATE_DECIMALS, get_map_detail_zoom, quantize_coordinates,\
+     prepare_polylines, get_map_grid, get_map_grid_geojson,\
+     publish_documents, render_map_documents, MapRequestHandler, ConnectivityMonitor,\
+     is_online_safe
+
 ################################################
 # Testing switches
 ################################################
@@ -113,41 +116,49 @@ debug_logger = DebugLogger()
 # Metadata and file access
 ################################################
 
-PANDAS_INITIALIZED = False
-try:
-#pylint: disable=W0611
-    import pandas
-#pylint: enable=W0611
-    PANDAS_INITIALIZED = True
-except ModuleNotFoundError:
-    pass
+# Pandas and folium are slow to import (most of the import time of this module),
+# so they are imported when first needed. Pandas is only checked for here.
+PANDAS_INITIALIZED = find_spec ("pandas") is not None
 
 FOLIUM_INITIALIZED = False
 FOLIUM_LOAD_ERROR = ""
-try:
+FOLIUM_LOADED = False
+
+def load_folium () -> bool:
+    ''' Import folium (once). Returns True if folium is available. '''
+#pylint: disable=W0603
+    global FOLIUM_INITIALIZED, FOLIUM_LOAD_ERROR, FOLIUM_LOADED
+#pylint: enable=W0603
+    if not FOLIUM_LOADED:
+        try:
 #pylint: disable=W0611
-    import folium
+#pylint: disable=C0415
+            import folium
 #pylint: enable=W0611
-    FOLIUM_INITIALIZED = True
-except ModuleNotFoundError as mnfe:
-    FOLIUM_LOAD_ERROR = str(mnfe)
-except ImportError as ie:
-    FOLIUM_LOAD_ERROR = str(ie)
+#pylint: enable=C0415
+            FOLIUM_INITIALIZED = True
+        except ModuleNotFoundError as mnfe:
+            FOLIUM_LOAD_ERROR = str(mnfe)
+        except ImportError as ie:
+            FOLIUM_LOAD_ERROR = str(ie)
+        FOLIUM_LOADED = True
+    return FOLIUM_INITIALIZED
 
 def get_folium_load_error ():
     ''' Check for possible errors loading folium (mainly for the Android setup) '''
+    load_folium ()
     return FOLIUM_LOAD_ERROR
 
 def check_folium ():
     ''' Check if folium is installed. Otherwise abort with exception '''
-    if not FOLIUM_INITIALIZED:
+    if not load_folium ():
         raise ValueError\
             ("Folium not available. Cannot generate maps. "+\
             "Install folium with \"pip install folium\"")
 
 def folium_initialized () -> bool:
     ''' Can be used to check if folium is initialized '''
-    return FOLIUM_INITIALIZED
+    return load_folium ()
 
 def __version_warning (min_major_ver : int, min_minor_ver : int):
     ''' Check compatible Python version '''
@@ -174,24 +185,36 @@ __version_warning (3, 11)
 import threading
 #pylint: enable=C0413
 
-class MyTCPServer(socketserver.TCPServer):
-    ''' A modified tcp server with correct connection parameters'''
+class MyTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    ''' A modified tcp server with correct connection parameters.
+        Each connection is handled in its own thread, so a map page can load
+        its tiles and scripts in parallel. '''
+    daemon_threads = True
+    block_on_close = False
+
     def server_bind(self):
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.bind(self.server_address)
+        self.server_address = self.socket.getsockname()
 
 server_address = ('', 8000)
 
 MASTER_HTTPD = None
 
 #pylint: disable=C0103
-class MyHandler(http.server.SimpleHTTPRequestHandler):
+
+class MyHandler(MapRequestHandler):
     ''' A modified handler able to handle shutdown requests '''
 
     # Track the last time ANY activity happened
     last_activity_time = None  # Change from time.time() to None
     # last_activity_time = time.time()
 
+    # Keep connections open between requests (HTTP/1.1).
+    # Idle connections are closed after the timeout (seconds).
+    protocol_version = "HTTP/1.1"
+    timeout = 15
+
     def do_GET(self):
         # ANY request counts as activity
         # old_time = MyHandler.last_activity_time
@@ -252,6 +275,12 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
                     break
             if not matched:
                 self.send_error(404, "Document not accessible")
+                return
+
+            sent = self.send_map_content()
+            if sent is not None:
+                debug_logger.info("GET " + self.path + " - OK (" + sent + ")")
+                return
 
             super().do_GET()
             debug_logger.info("GET " + self.path + " - OK")
@@ -313,35 +342,12 @@ def __run_http_server ():
 #pylint: enable=W0603
             MASTER_HTTPD = httpd
             debug_logger.info("HTTP server started on port 8000")
-#pylint: disable=C0415
-            import select
-#pylint: enable=C0415
-
-            # In __run_http_server():
-            # Set socket to non-blocking mode
-            httpd.socket.setblocking(False)
-            # httpd.socket.settimeout (0.5)
 
-            # Manual polling loop with select
-            while MASTER_HTTPD is not None:
-                try:
-                    # Use select to wait for incoming connection with timeout
-                    readable, _, _ = select.select([httpd.socket], [], [], 0.5)
-
-                    if readable:
-                        debug_logger.info("Before handling a request")
-                        httpd.handle_request()
-                        debug_logger.info("After having handled a request")
-                    else:
-                        # No request pending - loop continues and checks MASTER_HTTPD
-                        debug_logger.debug("Select timeout - checking shutdown flag")
-#pylint: disable=W0718
-                except Exception as e:
-#pylint: enable=W0718
-                    debug_logger.error(f"HTTP request error: {e}")
+            # Requests are handled at once (in threads), the poll interval
+            # is only used for checking for shutdown requests
+            httpd.serve_forever(poll_interval=0.5)
 
             debug_logger.info("HTTP server loop exited")
-            httpd.shutdown () # TODO Review
     except OSError as ose:
         if ose.errno != 98:
             raise ose
@@ -359,69 +365,45 @@ def __run_http_server ():
         running_http_server = None
         debug_logger.info("HTTP server thread terminated - running_http_server set to None")
 
-def __run_http_server_2 ():
-    port = 8000
-
-    Handler = MyHandler
-
-    try:
-        host_name = "127.0.0.1"
-        with MyTCPServer((host_name, port), Handler) as httpd:
-#pylint: disable=W0603
-            global MASTER_HTTPD
-#pylint: enable=W0603
-            MASTER_HTTPD = httpd
-            debug_logger.info("HTTP server started on port 8000")
-
-            # Start the inactivity watchdog thread
-            #watchdog = threading.Thread(target=inactivity_watchdog, daemon=True)
-            #watchdog.start()
-            #debug_logger.info(f"Watchdog thread started: {watchdog}, daemon={watchdog.daemon}")
-
-            # httpd.serve_forever (poll_interval=0.5)
-
-            # Set socket timeout
-            httpd.socket.settimeout(0.5)
+def set_tile_store (store : object):
+    ''' Serve offline map tiles from a tile store (tilestore.MBTilesStore) instead of
+        the tiles directory. Tiles missing in the store are still looked up in the directory.
+        Use None to only use the directory. '''
+    MyHandler.tile_store = store
+
+def set_dynamic_document (path : str, provider : Callable [[], str | bytes] | NoneType):
+    ''' Serve a document generated on each request (for instance diagnostics) at path,
+        such as "/status/resources.json". The file extension gives the content type.
+        Use None to remove the document. '''
+    if provider is None:
+        MyHandler.dynamic_documents.pop (path, None)
+    else:
+        MyHandler.dynamic_documents [path] = provider
 
-            debug_logger.info("HTTP server started on port 8000")
+def __open_url (url : str):
+    ''' Open an URL in the web browser (webbrowser is imported when first needed) '''
+#pylint: disable=C0415
+    import webbrowser
+#pylint: enable=C0415
+    webbrowser.open (url)
 
-            # Manual polling loop instead of serve_forever
-            while MASTER_HTTPD is not None:
-                try:
-                    debug_logger.info ("Before handling a request")
-                    # Set socket timeout, again. TODO Review
-                    httpd.socket.settimeout(0.5)
-                    httpd.handle_request()
-                    if MASTER_HTTPD is None:
-                        debug_logger.info ("HTTP server got kill request")
-                    else:
-                        debug_logger.info ("After having handled a request")
-                except socket.timeout:
-                    debug_logger.debug ("Socket timeout in polling loop")
-                    continue
-#pylint: disable=W0718
-                except Exception as e:
-#pylint: enable=W0718
-                    debug_logger.error(f"HTTP request error: {e}")
+def show_map_documents (documents : dict [str, str], name : str = "map.html",
+                        kill_existing_server : bool = False):
+    ''' Show rendered map documents (see render_map_documents) in the web browser.
+        The documents are served from memory if possible, otherwise written to files. '''
+    if is_windows ():
+        for file_name, content in documents.items ():
+            with open (file_name, "w", encoding="utf-8") as f:
+                f.write (content)
+        show_or_display_file ("./" + name)
+        return
+    start_http_server (kill_existing=kill_existing_server)
+    __open_url ("http://localhost:8000" + publish_documents (documents) + name)
 
-            # debug_logger.info("serve_forever() exited")
-            debug_logger.info("HTTP server loop exited")
-    except OSError as ose:
-        if ose.errno != 98:
-            raise ose
-        debug_logger.error(f"OSError: {ose}")
-#pylint: disable=W0718
-    except Exception as e:
-#pylint: enable=W0718
-        debug_logger.error(f"Unexpected error in HTTP server: {e}")
-    finally:
-        debug_logger.info("HTTP server cleanup starting")
-        MASTER_HTTPD = None
-#pylint: disable=W0603
-        global running_http_server
-#pylint: enable=W0603
-        running_http_server = None
-        debug_logger.info("HTTP server thread terminated - running_http_server set to None")
+def show_map (the_map : object, kill_existing_server : bool = False):
+    ''' Show a map in the web browser. The map is served from memory
+        (see publish_map) if possible, otherwise written to map.html. '''
+    show_map_documents (render_map_documents (the_map), kill_existing_server=kill_existing_server)
 
 def is_windows ():
     ''' Simple check for running under MS Windows '''
@@ -442,9 +424,9 @@ def show_or_display_file (filename : str, protocol : str = "file",
         start_http_server (kill_existing=kill_existing_server)
         debug_logger.debug ("After start_http_server")
         # start_http_server () TODO Review
-        webbrowser.open ("http://localhost:8000/"+filename)
+        __open_url ("http://localhost:8000/"+filename)
     elif protocol == "file":
-        webbrowser.open (filename)
+        __open_url (filename)
     else:
         raise ValueError ("Incorrect protocol <" + protocol + ">")
 
@@ -458,12 +440,17 @@ def __kill_http_server_if_running():
             debug_logger.info ("HTTP server is already dead")
             return
         debug_logger.info("Stopping HTTP server")
+        # The server thread clears running_http_server when it exits
+        server_thread = running_http_server
+        httpd = MASTER_HTTPD
         MASTER_HTTPD = None
+        if httpd is not None:
+            # Stops serve_forever (waits at most one poll interval)
+            httpd.shutdown ()
 
-        running_http_server.join(timeout=3.0)
-        if running_http_server is not None:
-            if running_http_server.is_alive():
-                debug_logger.error("HTTP server thread still alive")
+        server_thread.join(timeout=3.0)
+        if server_thread.is_alive():
+            debug_logger.error("HTTP server thread still alive")
 
         running_http_server = None
     else:
@@ -537,46 +524,14 @@ def is_online(timeout=3):
         socket.setdefaulttimeout(None)  # Reset to default
 
 
-def is_online_safe(timeout=2):
-    """
-    Check if internet is available
-    Uses dedicated socket to avoid global state mutation
-    Short timeout for reliability
-    """
-    test_socket = None
-    try:
-        test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        test_socket.settimeout(timeout)
-        test_socket.connect(("8.8.8.8", 53))
-
-        # Shutdown before close (forces immediate cleanup)
-        try:
-            test_socket.shutdown(socket.SHUT_RDWR)  # ← Force immediate shutdown
-#pylint: disable=W0702
-        except:
-            pass  # Already closed or not connected
-#pylint: enable=W0702
-
-        test_socket.close()
-        return True
+CONNECTIVITY_MONITOR = ConnectivityMonitor (on_change=lambda online : debug_logger.info\
+                                            (f"Connectivity state changed: online = {online}"))
 
-    except (socket.timeout, socket.error, OSError):
-        return False
-    finally:
-        if test_socket is not None:
-            try:
-                # Shutdown first (non-blocking)
-                test_socket.shutdown(socket.SHUT_RDWR)
-#pylint: disable=W0702
-            except:
-                pass  # Socket not connected or already shut down
-#pylint: enable=W0702
-            try:
-                test_socket.close()
-#pylint: disable=W0702
-            except:
-                pass
-#pylint: enable=W0702
+def start_connectivity_monitor () -> ConnectivityMonitor:
+    ''' Start the (shared) connectivity monitor, and return it.
+        Applications should call this early, so the state is known when maps are made. '''
+    CONNECTIVITY_MONITOR.start ()
+    return CONNECTIVITY_MONITOR
 
 ################################################
 # Basic generation of folium maps and tile handling
@@ -588,34 +543,23 @@ def get_folium_map_safe (location : list | tuple,
                     max_zoom : int = 15) -> object:
     ''' 
     Generate a map object
-    Tries online first for detail, falls back to offline for reliability
+    Uses an online map if the connectivity monitor says we are online,
+    falls back to offline for reliability.
+    The network is never probed here. Only the very first call may wait (briefly)
+    for the first background probe to finish.
     '''
 # pylint: disable=C0415
     from folium import raster_layers, Map
 # pylint: enable=C0415
 
-    # Try online first (with timeout on entire operation)
-    result: list[Optional[object]] = [None]   # Use list for mutability in closure
-
-    def try_online_map():
-        try:
-            if is_online_safe(timeout=1):
-                the_map = Map(location=location,
-                              zoom_start=zoom_start_online,
-                              max_zoom=max_zoom)
-                result[0] = the_map
-#pylint: disable=W0702
-        except:
-            pass
-#pylint: enable=W0702
-
-    # Run with timeout (prevent Folium from hanging)
-    online_thread = threading.Thread(target=try_online_map, daemon=True)
-    online_thread.start()
-    online_thread.join(timeout=3.0)  # Max 3 seconds for online map
-
-    if result[0] is not None:
-        return result[0]  # Online map succeeded!
+    monitor = start_connectivity_monitor ()
+    online = monitor.is_online ()
+    if online is None:
+        online = monitor.wait_for_state (timeout=1.5)
+    if online:
+        return Map(location=location,
+                   zoom_start=zoom_start_online,
+                   max_zoom=max_zoom)
 
     # Offline map (reliable fallback)
     base_url = "http://localhost:8000/tiles"
@@ -895,6 +839,56 @@ def spherical_distance (latlon1 : LatLon, latlon2 : LatLon) -> float:
     distance = EARTH_RADIUS * angle
     return distance
 
+def __prepare_haversine (latlons : list [LatLon]) -> list [tuple [float, float, float]]:
+    ''' Precompute latitude, longitude and cos(latitude) (in radians) for a set of points '''
+    retval = []
+    for ll in latlons:
+        phi = deg_to_rad (ll.get_lat())
+        retval.append ((phi, deg_to_rad (ll.get_lon()), cos (phi)))
+    return retval
+
+def __haversine_angle (p1 : tuple [float, float, float], p2 : tuple [float, float, float])\
+      -> float:
+    ''' Angle (in radians) between two prepared points. Using the haversine/atan2 form,
+        which is numerically stable for small as well as antipodal distances '''
+    h = sin ((p2[0] - p1[0]) / 2)**2 + p1[2] * p2[2] * sin ((p2[1] - p1[1]) / 2)**2
+    h = squeeze (h, 0, 1)
+    return 2 * atan2 (sqrt (h), sqrt (1 - h))
+
+def distance_matrix (latlons1 : list [LatLon], latlons2 : list [LatLon] | NoneType = None,
+                     nautical_miles : bool = False) -> list [list [float]]:
+    ''' Calculate the matrix of great circle distances between two sets of points.
+        If latlons2 is omitted the (symmetric) matrix within latlons1 is returned.
+        Returns : Distances in km (or nautical miles if nautical_miles is set) '''
+    factor = EARTH_RADIUS
+    if nautical_miles:
+        factor = km_to_nm (EARTH_RADIUS)
+    prep1 = __prepare_haversine (latlons1)
+    if latlons2 is None:
+        n = len (prep1)
+        retval = [[0.0] * n for _ in range (n)]
+        for i in range (n):
+            row = retval [i]
+            for j in range (i+1, n):
+                d = factor * __haversine_angle (prep1[i], prep1[j])
+                row [j] = d
+                retval [j][i] = d
+        return retval
+    prep2 = __prepare_haversine (latlons2)
+    return [[factor * __haversine_angle (p1, p2) for p2 in prep2] for p1 in prep1]
+
+def paired_distances (latlons1 : list [LatLon], latlons2 : list [LatLon],
+                      nautical_miles : bool = False) -> list [float]:
+    ''' Calculate the great circle distances between pairs of points (row-wise).
+        Returns : Distances in km (or nautical miles if nautical_miles is set) '''
+    if len (latlons1) != len (latlons2):
+        raise ValueError ("Point lists must have the same length")
+    factor = EARTH_RADIUS
+    if nautical_miles:
+        factor = km_to_nm (EARTH_RADIUS)
+    return [factor * __haversine_angle (p1, p2) for p1, p2 in\
+            zip (__prepare_haversine (latlons1), __prepare_haversine (latlons2))]
+
 def km_to_nm (km : int | float) -> float:
     ''' Convert from kilometers to nautical miles '''
     return (km / EARTH_CIRCUMFERENCE)*360*60
@@ -1039,31 +1033,100 @@ class Circle:
         str(self.__latlon) + "]; ANGLE = " + str(round(self.__angle,4))
 
 #pylint: disable=R0914
+    def get_polyline (self, adjust_geodetic : bool = True,
+                      steps_per_degree : int | float | NoneType = None,
+                      zoom : int | float = 11, lon_adjustment : int | float = 0)\
+          -> list [list [list [float]]]:
+        ''' Returns the outline of this circle as a list of polyline segments
+            (each a list of [lat, lon] points).
+            Longitudes are aligned around the center point, and the outline is split
+            where it wraps around (i.e. passes the date line seen from the center).
+            If steps_per_degree is not set the number of points is selected from the
+            radius of the circle and the map zoom level, keeping the deviation (sagitta)
+            between the drawn chords and the true circle below half a pixel.
+        '''
+        c_latlon = self.get_latlon ()
+        b = to_rectangular (c_latlon)
+        north_pole = [0.0, 0.0, 1.0] # to_rectangular (LatLon (90, 0))
+        if c_latlon.get_lat() in (90, -90):
+            east_tangent = [0.0, 1.0, 0.0]
+        else:
+            east_tangent = normalize_vect (cross_product (north_pole, b))
+        north_tangent = normalize_vect (cross_product (b, east_tangent))
+
+        angle = deg_to_rad (self.get_angle())
+        if steps_per_degree is None:
+            # Sagitta of a chord spanning d radians of the circle is rho*d^2/8
+            rho = sin (angle) * self.__circumference / (2 * pi)
+            tolerance = EARTH_CIRCUMFERENCE_EQUATORIAL / (256 * 2**zoom) / 2
+            steps = 3600
+            if rho > 0:
+                steps = int (squeeze (2 * pi / sqrt (8 * tolerance / rho), 72, 3600))
+        else:
+            steps = int (360 * steps_per_degree)
+
+        # Rodrigues rotation of b around the (unit, orthogonal) tangent vector
+        # cos(theta)*(-east) + sin(theta)*north, in closed form
+        cos_a = cos (angle)
+        sin_a = sin (angle)
+        e_b = cross_product (east_tangent, b)
+        n_b = cross_product (north_tangent, b)
+        lat_factor = 1.0
+        if adjust_geodetic and not Testing.disable_geodetics:
+            # Geodetic latitude of a point on the ellipsoid surface
+            lat_factor = (1 - EARTH_FLATTENING)**2
+        c_lon = c_latlon.get_lon()
+        segments = list [list [list [float]]] ()
+        sub_coord = list [list [float]] ()
+        last_lat = 0.0
+        last_lon = None
+        for i in range (steps + 1):
+            theta = 2 * pi * i / steps
+            f_e = -cos (theta) * sin_a
+            f_n = sin (theta) * sin_a
+            x = b[0] * cos_a + e_b[0] * f_e + n_b[0] * f_n
+            y = b[1] * cos_a + e_b[1] * f_e + n_b[1] * f_n
+            z = b[2] * cos_a + e_b[2] * f_e + n_b[2] * f_n
+            this_lat = rad_to_deg (atan2 (z, lat_factor * sqrt (x*x + y*y)))
+            # Align the longitude around the center point
+            this_lon = c_lon + (rad_to_deg (atan2 (y, x)) - c_lon + 180) % 360 - 180
+            if last_lon is not None and abs (this_lon - last_lon) > 180:
+                # Wrapping around. End this segment (and start the next one) on the edge.
+                edge = c_lon + 180 if last_lon > c_lon else c_lon - 180
+                unwrapped_lon = this_lon - 360 if this_lon > last_lon else this_lon + 360
+                edge_lat = last_lat + (this_lat - last_lat) *\
+                           (edge - last_lon) / (unwrapped_lon - last_lon)
+                sub_coord.append ([edge_lat, edge + lon_adjustment])
+                segments.append (sub_coord)
+                sub_coord = [[edge_lat, 2 * c_lon - edge + lon_adjustment]]
+            sub_coord.append ([this_lat, this_lon + lon_adjustment])
+            last_lat = this_lat
+            last_lon = this_lon
+        if len (segments) > 0:
+            # The outline is closed, so the last segment continues into the first one
+            segments [0] = sub_coord + segments [0][1:]
+        else:
+            segments.append (sub_coord)
+        return segments
+#pylint: enable=R0914
+
 #pylint: disable=R0913
 #pylint: disable=R0917
     def render_folium (self, the_map : object, color : str = "#FF0000",
                        adjust_geodetic : bool = True, dashed = False,
-                       steps_per_degree = 10,
-                       popup = "Circle", lon_adjustment : int = 0):
+                       steps_per_degree = None,
+                       popup = "Circle", lon_adjustment : int = 0,
+                       zoom : int | float | NoneType = None,
+                       tolerance : float | NoneType = None,
+                       decimals : int = MAP_COORDINATE_DECIMALS):
         ''' Renders a circle on a folium map 
-            The circle is drawn in several consecutive steps.
-            The steps_per_degree parameter is used to get the needed accuracy.
-            A high value for this parameter will get a very accurate drawing, 
-            at the expense of some execution time and a large HTML rendering. 
+            The circle is drawn as one (multi-segment) PolyLine, see get_polyline.
+            The steps_per_degree parameter can be used to force a fixed accuracy.
+            By default the accuracy is adapted to the radius and the zoom level
+            (by default the zoom level of the map, see get_map_detail_zoom).
+            The outline is then simplified (tolerance in degrees, see prepare_polylines)
+            and rounded to the given number of decimals.
         '''
-
-        def adapt_lon (input_lon : float, center_lon : float) -> float:
-            ''' This is a helper routine used for aligning the circle around the 
-                center point (avoids cutting the circle around the date lines)
-            '''
-            diff = input_lon - center_lon
-            if abs(diff) >= 180:
-                if center_lon > 0:
-                    diff = diff + 360
-                else:
-                    diff = diff - 360
-            return center_lon + diff
-
         check_folium ()
 
         if dashed:
@@ -1071,63 +1134,18 @@ class Circle:
         else:
             dash_argument = False
 
-        coordinates = list [list[float]]()
-        sub_coord = []
-
 #pylint: disable=C0415
         from folium import PolyLine, Map
 #pylint: enable=C0415
         assert isinstance (the_map, Map)
 
-        b = to_rectangular (self.get_latlon ())
-        north_pole = [0.0, 0.0, 1.0] # to_rectangular (LatLon (90, 0))
-        east_tangent = normalize_vect(cross_product (north_pole, b))
-        north_tangent = normalize_vect (cross_product (b, east_tangent))
-        c_latlon = self.get_latlon ()
-        degrees_step = 0
-        last_lon = None
-
-        while degrees_step <= 360 * steps_per_degree:
-
-            angle = degrees_step / float (steps_per_degree)
-            degrees_step += 1
-            real_tangent =\
-                add_vecs (\
-                            mult_scalar_vect (-cos(deg_to_rad(angle)), east_tangent),
-                            mult_scalar_vect (sin(deg_to_rad(angle)), north_tangent)
-                            )
-            y = rotate_vector_2 (b, real_tangent, deg_to_rad(self.get_angle()))
-
-            y_latlon = to_latlon (y)
-            if adjust_geodetic:
-                y_geodetic = LatLonGeodetic (ll = y_latlon)
-                y_target = y_geodetic
-            else:
-                y_target = y_latlon
-            this_lon = adapt_lon(y_target.get_lon(), c_latlon.get_lon())
-            # Avoid jagged lines
-            if last_lon is not None and\
-                abs (this_lon - last_lon) > 10 and\
-                len(sub_coord) > 0:
-                coordinates.append (sub_coord)
-                # Flush out current PolyLine
-                PolyLine(
-                    locations=coordinates,
-                    color=color,
-                    weight=5,
-                    popup=popup,
-                    dash_array=dash_argument
-                ).add_to(the_map)
-                # Reset variables
-                coordinates = list [list[float]]()
-                sub_coord = []
-                last_lon = None
-            else:
-                sub_coord.append\
-                        ([y_target.get_lat(), this_lon + lon_adjustment])
-            last_lon = this_lon
-        coordinates.append (sub_coord)
-        if (len(coordinates[0])) >= 1:
+        if zoom is None:
+            zoom = get_map_detail_zoom (the_map)
+        coordinates = self.get_polyline (adjust_geodetic=adjust_geodetic,
+                                         steps_per_degree=steps_per_degree,
+                                         zoom=zoom, lon_adjustment=lon_adjustment)
+        coordinates = prepare_polylines (coordinates, the_map.location, zoom, tolerance, decimals)
+        if len (coordinates[0]) >= 1:
             PolyLine(
                 locations=coordinates,
                 color=color,
@@ -1135,7 +1153,6 @@ class Circle:
                 popup=popup,
                 dash_array = dash_argument
             ).add_to(the_map)
-#pylint: enable=R0914
 #pylint: enable=R0913
 #pylint: enable=R0917
 
@@ -1157,7 +1174,7 @@ class CircleCollection:
     def render_folium (self, center_pos : LatLon,
                        colors : list[str] | NoneType = None,
                        adjust_geodetic : bool = True,
-                       steps_per_degree = 10) -> object :
+                       steps_per_degree = None) -> object :
         ''' Render this circle collection in Folium '''
         check_folium ()
         the_map = get_folium_map_safe (location=[center_pos.get_lat(), center_pos.get_lon()])
@@ -1497,57 +1514,133 @@ def get_azimuth (to_pos: LatLon, from_pos: LatLon) -> float:
         The azimuth angle in degrees (0-360), measured geodetically
     '''
 
-    # Special cases at poles
-    if from_pos.get_lat() == 90:
-        # return (-to_pos.get_lon()) % 360
-        return 180
-    if from_pos.get_lat() == -90:
-        # return to_pos.get_lon() % 360
-        return 0
-
-    # Convert observer to geocentric for vector operations
-    if isinstance (from_pos, LatLonGeodetic):
-        from_pos_gc = from_pos.get_latlon()
-    else:
-        from_pos_gc = from_pos
+    return ObserverFrame (from_pos).get_azimuth (to_pos)
 
-    # Check for antipodes and same position
-    if (to_pos.get_lat() == -from_pos_gc.get_lat()) and \
-       (((to_pos.get_lon() - from_pos_gc.get_lon()) % 180) == 0):
-        return 0
-    if (to_pos.get_lat() == from_pos_gc.get_lat()) and \
-       (to_pos.get_lon() == from_pos_gc.get_lon()):
-        return 0
-
-    # Get vectors
-    a = to_rectangular(to_pos)
-    b_gc = to_rectangular(from_pos_gc)
-
-    # Calculate geodetic north and east at observer position
-    # The key difference: use geodetic latitude for the tangent plane
-    phi_gd = deg_to_rad(from_pos.get_lat())  # Geodetic latitude
-    lam = deg_to_rad(from_pos.get_lon())
-
-    # Geodetic north tangent (in ECEF coordinates)
-    # This is tangent to the meridian at the geodetic latitude
-    north_tangent = normalize_vect([
-        -sin(phi_gd) * cos(lam),
-        -sin(phi_gd) * sin(lam),
-        cos(phi_gd)
-    ])
+class ObserverFrame:
+    ''' The local tangent frame (geodetic north/east and zenith) of an observer.
+        The frame is computed once and can then be used for calculating
+        azimuths and altitudes of any number of GPs.
+    '''
 
-    # East tangent (same in both systems - perpendicular to meridian plane)
-    north_pole = [0.0, 0.0, 1.0]
-    east_tangent = normalize_vect(cross_product(north_pole, b_gc))
+    def __init__ (self, from_pos : LatLon):
+        ''' Parameters:
+                from_pos : LatLonGeodetic (or LatLonGeocentric) of the observer position
+        '''
+        self.__from_pos = from_pos
+        # Convert observer to geocentric for vector operations
+        if isinstance (from_pos, LatLonGeodetic):
+            self.__from_pos_gc = from_pos.get_latlon()
+        else:
+            self.__from_pos_gc = from_pos
+        self.__b_gc = to_rectangular (self.__from_pos_gc)
+
+        # The zenith, and the geodetic north tangent (in ECEF coordinates)
+        # This is tangent to the meridian at the geodetic latitude
+        phi_gd = deg_to_rad(from_pos.get_lat())
+        lam = deg_to_rad(from_pos.get_lon())
+        self.__zenith = [cos(phi_gd) * cos(lam), cos(phi_gd) * sin(lam), sin(phi_gd)]
+        self.__north_tangent = [-sin(phi_gd) * cos(lam), -sin(phi_gd) * sin(lam), cos(phi_gd)]
+
+        # East tangent (same in both systems - perpendicular to meridian plane)
+        # This is undefined at the poles.
+        self.__east_tangent = None
+        if from_pos.get_lat() not in (90, -90):
+            north_pole = [0.0, 0.0, 1.0]
+            self.__east_tangent = normalize_vect(cross_product(north_pole, self.__b_gc))
+
+    def get_observer (self) -> LatLon:
+        ''' Return the observer position of this frame '''
+        return self.__from_pos
+
+    def get_azimuth (self, to_pos : LatLon) -> float:
+        ''' Return the geodetic azimuth of to_pos (in degrees, 0-360) '''
+        # Special cases at poles
+        if self.__from_pos.get_lat() == 90:
+            return 180
+        if self.__from_pos.get_lat() == -90:
+            return 0
+
+        # Check for antipodes and same position
+        from_pos_gc = self.__from_pos_gc
+        if (to_pos.get_lat() == -from_pos_gc.get_lat()) and \
+           (((to_pos.get_lon() - from_pos_gc.get_lon()) % 180) == 0):
+            return 0
+        if (to_pos.get_lat() == from_pos_gc.get_lat()) and \
+           (to_pos.get_lon() == from_pos_gc.get_lon()):
+            return 0
+
+        # Project direction vector onto tangent plane
+        assert self.__east_tangent is not None
+        a = to_rectangular (to_pos)
+        direction = subtract_vecs (a, self.__b_gc)
+        fac_north = dot_product (direction, self.__north_tangent)
+        fac_east = dot_product (direction, self.__east_tangent)
+
+        azimuth = rad_to_deg(atan2(fac_east, fac_north))
+        return azimuth % 360
+
+    def get_altitude (self, to_pos : LatLon) -> float:
+        ''' Return the altitude (in degrees) of to_pos above the (geodetic) horizon '''
+        dp = dot_product (to_rectangular (to_pos), self.__zenith)
+        return 90 - rad_to_deg (acos (squeeze (dp, -1, 1)))
+
+    def __get_batch (self, to_pos_list : list [LatLon], azimuths : bool, altitudes : bool) \
+          -> tuple [list [float], list [float]]:
+        ''' Azimuths and/or altitudes of many positions in one pass. The positions are
+            converted to unit vectors directly (as to_rectangular), and the projections of
+            the observer on the frame are computed once. '''
+        from_lat = self.__from_pos.get_lat ()
+        from_lat_gc = self.__from_pos_gc.get_lat ()
+        from_lon_gc = self.__from_pos_gc.get_lon ()
+        zx, zy, zz = self.__zenith
+        nx, ny, nz = self.__north_tangent
+        b = self.__b_gc
+        ex = ey = ez = north_b = east_b = 0.0
+        if azimuths and self.__east_tangent is not None:
+            ex, ey, ez = self.__east_tangent
+            north_b = nx * b[0] + ny * b[1] + nz * b[2]
+            east_b = ex * b[0] + ey * b[1] + ez * b[2]
+        az_list = list [float] ()
+        alt_list = list [float] ()
+        for p in to_pos_list:
+            lat, lon = p.get_lat (), p.get_lon ()
+            phi = deg_to_rad (lat)
+            lam = deg_to_rad (lon)
+            cos_phi = cos (phi)
+            x, y, z = cos_phi * cos (lam), cos_phi * sin (lam), sin (phi)
+            if altitudes:
+                dp = x * zx + y * zy + z * zz
+                alt_list.append (90 - rad_to_deg (acos (squeeze (dp, -1, 1))))
+            if not azimuths:
+                continue
+            # Special cases at poles, and for antipodes and the same position
+            if from_lat == 90:
+                az_list.append (180)
+            elif from_lat == -90:
+                az_list.append (0)
+            elif (lat == -from_lat_gc and ((lon - from_lon_gc) % 180) == 0) or \
+                 (lat == from_lat_gc and lon == from_lon_gc):
+                az_list.append (0)
+            else:
+                # Projection of the direction (p - observer) onto the tangent plane
+                fac_north = x * nx + y * ny + z * nz - north_b
+                fac_east = x * ex + y * ey + z * ez - east_b
+                az_list.append (rad_to_deg (atan2 (fac_east, fac_north)) % 360)
+        return az_list, alt_list
 
-    # Project direction vector onto tangent plane
-    direction = normalize_vect(subtract_vecs(a, b_gc))
+    def get_azimuths (self, to_pos_list : list [LatLon]) -> list [float]:
+        ''' Return the azimuths of a list of positions (typically GPs) '''
+        return self.__get_batch (to_pos_list, True, False) [0]
 
-    fac_north = dot_product(direction, north_tangent)
-    fac_east = dot_product(direction, east_tangent)
+    def get_altitudes (self, to_pos_list : list [LatLon]) -> list [float]:
+        ''' Return the altitudes of a list of positions (typically GPs) '''
+        return self.__get_batch (to_pos_list, False, True) [1]
 
-    azimuth = rad_to_deg(atan2(fac_east, fac_north))
-    return azimuth % 360
+    def get_azimuths_altitudes (self, to_pos_list : list [LatLon]) \
+          -> list [tuple [float, float]]:
+        ''' Return (azimuth, altitude) pairs for a list of positions (typically GPs) '''
+        az_list, alt_list = self.__get_batch (to_pos_list, True, True)
+        return list (zip (az_list, alt_list))
 
 
 ################################################
@@ -2067,6 +2160,9 @@ class Almanac:
 
     active_almanacs = dict [str, object] ()
 
+    almanac_names = ["planets", "sun-moon", "sun-moon-sd", "venus-mars-hp", "stars"]
+    lock = threading.Lock ()
+
     range_from = None
     range_to = None
     @staticmethod
@@ -2078,22 +2174,37 @@ class Almanac:
         Almanac.range_from = config.get('Limits', 'From')
         Almanac.range_to   = config.get('Limits', 'To')
 
+    @staticmethod
+    def get_range () -> tuple [str, str]:
+        ''' Return the range (from, to) of the almanac. Read when first needed. '''
+        if Almanac.range_from is None:
+            Almanac.init_ranges (Almanac.data_path)
+        return Almanac.range_from, Almanac.range_to
+
     @staticmethod
     def get_almanac (fn : str) -> object:
         ''' Return an almanac object. Use cache if possible '''
-        try:
-            return Almanac.active_almanacs [fn]
-        except KeyError:
-            return Almanac (fn)
-#pylint: enable=R0903
+        with Almanac.lock:
+            try:
+                return Almanac.active_almanacs [fn]
+            except KeyError:
+                return Almanac (fn)
 
-Almanac.init_ranges (Almanac.data_path)
+    @staticmethod
+    def preload ():
+        ''' Load the almanacs (and pandas) in advance, for instance on a background thread,
+            so the first sight reduction doesn't have to wait for them.
+            Missing almanac files are skipped. '''
+        Almanac.get_range ()
+        for fn in Almanac.almanac_names:
+            if os.path.exists (Almanac.data_path + fn + ".csv"):
+                Almanac.get_almanac (fn)
+#pylint: enable=R0903
 
 class AlmanacRangeException (ValueError):
     ''' Represents an exception where the range of the nautical almanac has been exceeded '''
     def __init__ (self, description : str):
-        self.from_date = Almanac.range_from
-        self.to_date = Almanac.range_to
+        self.from_date, self.to_date = Almanac.get_range ()
         self.description = description
         super().__init__ (self, description)
 
@@ -2556,8 +2667,10 @@ class Sight :
         return get_azimuth (self.get_gp(), from_pos)
 
     def render_folium (self, the_map : object, draw_markers : bool = True, lon_adjustment = 0,\
-                       sight_num : int | NoneType = None):
-        ''' Render this Sight object on a Folium Map object'''
+                       sight_num : int | NoneType = None, zoom : int | float | NoneType = None,
+                       decimals : int = MAP_COORDINATE_DECIMALS):
+        ''' Render this Sight object on a Folium Map object
+            zoom and decimals control the level of detail (see Circle.render_folium) '''
 
         check_folium ()
 
@@ -2586,7 +2699,8 @@ class Sight :
                 icon = Icon(icon="star"),
             ).add_to(the_map)
         label_string = num_string + the_object_name
-        c.render_folium (the_map, lon_adjustment = lon_adjustment, popup = label_string)
+        c.render_folium (the_map, lon_adjustment = lon_adjustment, popup = label_string,
+                         zoom = zoom, decimals = decimals)
 
     def render_folium_new_map (self, draw_markers : bool = True, zoom_start = 2) -> object:
         ''' Render this Sight object on a newly created Folium Map object'''
@@ -2734,6 +2848,7 @@ class SightCollection:
             for i in range (nr_of_coords):
                 diag_output += "|----"
             diag_output += "|\n"
+        dist_matrix = distance_matrix ([c[0] for c in coords])
         for i in range (nr_of_coords):
             if diag_output:
                 diag_output += "|**" + str(i) + "**"
@@ -2741,7 +2856,7 @@ class SightCollection:
                     diag_output += "|-"
             for j in range (i, nr_of_coords):
                 if i != j:
-                    dist = spherical_distance (coords[i][0], coords[j][0])
+                    dist = dist_matrix [i][j]
                     dists [i,j] = dist
                     if diagnostics:
                         diag_output += "|" + str(round(dist,1)) + " km"
@@ -2804,9 +2919,8 @@ class SightCollection:
         ret_latlon = to_latlon (summation_vec)
         calculated_diff = 0
         diff_sum_2 = 0
-        for cp in chosen_points:
-            selected_coord = coords [cp][0]
-            distance_diff = spherical_distance (ret_latlon, selected_coord)
+        for distance_diff in distance_matrix\
+                ([ret_latlon], [coords [cp][0] for cp in chosen_points])[0]:
             diff_sum_2 += distance_diff**2
         calculated_diff = sqrt (diff_sum_2)
         if return_geodetic:
@@ -2878,8 +2992,7 @@ class SightCollection:
                                         lon=intersections.get_lon())
 
         square_sum = 0.0
-        for c in int_coll:
-            sd = spherical_distance (intersections, c)
+        for sd in distance_matrix ([intersections], int_coll)[0]:
             sd = sd*sd
             square_sum += sd
         square_sum /= found_intersections
@@ -2953,14 +3066,18 @@ class SightCollection:
           (self, intersections : tuple [LatLon, LatLon] | LatLon | NoneType = None,\
            accuracy : float = 1, label_text = "Intersection",
            draw_grid = True, draw_markers = True,
-           draw_azimuths = False, azimuths_in_marker = True) -> object:
-        ''' Renders a folium object (Map) to be used for map plotting'''
+           draw_azimuths = False, azimuths_in_marker = True,
+           decimals : int = MAP_COORDINATE_DECIMALS) -> object:
+        ''' Renders a folium object (Map) to be used for map plotting
+            Lines are simplified, keeping the detail needed for the accuracy (nm)
+            (see get_map_detail_zoom), and coordinates are rounded to decimals.'''
 
         check_folium ()
         the_sf_list = self.__sf_list
 
 #pylint: disable=C0415
-        from folium import Map, Circle as Folium_Circle, PolyLine, Marker, Icon
+        from folium import Map, Circle as Folium_Circle, PolyLine, Marker, Icon, GeoJson,\
+             GeoJsonTooltip
 #pylint: enable=C0415
 
 
@@ -3015,13 +3132,14 @@ class SightCollection:
                 if azimuths_in_marker:
                     popup_text += "\nAzimuths:\n"
                     counter = 0
+                    frame = ObserverFrame (int_geodetic)
                     for s in the_sf_list:
                         counter += 1
                         popup_text += "("
                         popup_text += "[#" + str(counter) + "]"
                         popup_text += str(s.get_object_name())
                         popup_text += "=" +\
-                            str(round(get_azimuth (s.get_gp(), int_geodetic),1))
+                            str(round(frame.get_azimuth (s.get_gp()),1))
                         popup_text += ")"
                         popup_text += "\n"
 
@@ -3039,6 +3157,7 @@ class SightCollection:
                                       zoom_start_online=2)
             assert isinstance (the_map, Map)
 
+        detail_zoom = get_map_detail_zoom (the_map, accuracy)
         if draw_azimuths:
             for s in the_sf_list:
                 gp = s.get_gp()
@@ -3050,7 +3169,8 @@ class SightCollection:
                         int2 = intersections.get_latlon()
                     assert isinstance (int2, LatLonGeocentric)
                     gcr = get_great_circle_route (gp, int2)
-                    gcr.render_folium (the_map, color='#AAAAFF', dashed=True)
+                    gcr.render_folium (the_map, color='#AAAAFF', dashed=True,
+                                       zoom=detail_zoom, decimals=decimals)
 
         if map_center_lon is not None:
             base_lon = map_center_lon
@@ -3068,87 +3188,21 @@ class SightCollection:
             sight_num += 1
             s.render_folium (the_map, draw_markers=draw_markers,\
                              lon_adjustment=this_s_lon_adjustment,\
-                             sight_num=sight_num)
+                             sight_num=sight_num, zoom=detail_zoom, decimals=decimals)
 
         if draw_grid:
-
-            lat_interval = 1
-            lon_interval = 1
-            spread = 1
-
-            # Draw degree square(s)
-
-            if isinstance (intersections, LatLon):
-                left_lon = int(intersections.get_lon() - spread + 1)
-                right_lon = int(intersections.get_lon() + spread)
-                down_lat = max(int(intersections.get_lat() - spread + 1),-90)
-                up_lat = min(int(intersections.get_lat() + spread),90)
-                draw_degrees = False
-            else:
-                left_lon = -180
-                right_lon = 180
-                down_lat = -90
-                up_lat = 90
-                draw_degrees = True
-
-            if draw_degrees:
-                for lat in range(down_lat, up_lat+1, lat_interval):
-                    PolyLine([[lat, left_lon  + lon_adjustment],\
-                              [lat, right_lon + lon_adjustment]], weight=0.5,\
-                        tooltip=str(lat) + "°").\
-                        add_to(the_map)
-
-                for lon in range(left_lon, right_lon+1, lon_interval):
-                    PolyLine([[down_lat, lon + lon_adjustment],\
-                              [up_lat,   lon + lon_adjustment]], weight=0.7,\
-                        tooltip=str(lon)+"°").\
-                        add_to(the_map)
-
-            # Draw minute lines
-
-            if isinstance (intersections, LatLon):
-                #Calculate lower left minute point
-                the_lon = intersections.get_lon ()
-                reduced_lon = int(the_lon * 60) / 60
-                the_lat = intersections.get_lat ()
-                reduced_lat = int(the_lat * 60) / 60
-
-                this_left_lon = reduced_lon  - (1/6)
-                this_right_lon = reduced_lon + (1/6)
-                this_down_lat = reduced_lat  - (1/6)
-                this_up_lat = reduced_lat    + (1/6)
-
-                # Horizontal lines
-                for y in range (-10, 11):
-                    this_draw_lat = reduced_lat + (y/60)
-                    d,m = get_dm (this_draw_lat)
-                    m = abs(int(round(m,0)))-1
-                    if d < 0:
-                        prefix_string = "S"
-                    else:
-                        prefix_string = "N"
-                    tooltip_string = prefix_string + " " + str(abs(d)) + "° " + str(m+1) + "'"
-                    PolyLine([[this_draw_lat, this_left_lon  + lon_adjustment],\
-                              [this_draw_lat, this_right_lon + lon_adjustment]],\
-                              weight=0.5, color="green",\
-                              tooltip=tooltip_string).\
-                        add_to(the_map)
-
-                # Vertical lines
-                for x in range(-10,11):
-                    this_draw_lon = reduced_lon + (x/60)
-                    d,m = get_dm (this_draw_lon)
-                    m = abs(int(round(m,0)))
-                    if d < 0:
-                        prefix_string = "W"
-                    else:
-                        prefix_string = "E"
-                    tooltip_string = prefix_string + " " + str(abs(d)) + "° " + str(m) + "'"
-                    PolyLine([[this_down_lat, this_draw_lon + lon_adjustment],\
-                              [this_up_lat, this_draw_lon + lon_adjustment]],\
-                              weight=0.5, color="green",\
-                              tooltip=tooltip_string).\
-                        add_to(the_map)
+            parallels, meridians, minute_lines = get_map_grid\
+                (intersections if isinstance (intersections, LatLon) else None)
+            # One layer per level of the grid, with the coordinate of each line as tooltip
+            for lines, weight, color, minutes in\
+                    [(parallels,    0.5, "#3388ff", False),
+                     (meridians,    0.7, "#3388ff", False),
+                     (minute_lines, 0.5, "green",   True)]:
+                if len (lines) == 0:
+                    continue
+                GeoJson (get_map_grid_geojson (lines, minutes, lon_adjustment, decimals),
+                         style_function=lambda _, w=weight, c=color: {"color" : c, "weight" : w},
+                         tooltip=GeoJsonTooltip (fields=["label"], labels=False)).add_to(the_map)
 
         return the_map
 #pylint: enable=R0912
@@ -3190,18 +3244,124 @@ class SightTrip:
         self.time_hours = calculate_time_hours (dt1, dt2)
 
     def __calculate_distance_to_target (self, angle : int | float,
-                                        a_vec : list [float], b_vec : list [float])\
-          -> tuple [float, LatLonGeocentric, LatLonGeocentric]:
-        rotation_angle = deg_to_rad (angle)
-        rotated_vec = rotate_vector_2 (b_vec, a_vec, rotation_angle)
+                                        a_vec : list [float], b_vec : list [float],
+                                        end_vec : list [float], end_radius : float)\
+          -> tuple [float, float, LatLonGeocentric, LatLonGeocentric]:
+        ''' Rotate b_vec (angle in radians) around a_vec, apply the trip movement and return
+            the distance to the end circle, together with its analytic derivative '''
+        rotated_vec = rotate_vector_2 (b_vec, a_vec, angle)
         rotated_latlon = to_latlon (rotated_vec)
         taken_out = takeout_course (rotated_latlon, self.__course_degrees,\
                                     self.__speed_knots, self.time_hours)
 
-        dbp = spherical_distance\
-              (taken_out, self.__sight_end.get_gp())\
-                  - self.__sight_end.get_circle(geodetic=False).get_radius()
-        return dbp, taken_out, rotated_latlon
+        # Derivative of the rotated vector (Rodrigues): d/dangle = a x rotated
+        x, y, z = normalize_vect (rotated_vec)
+        dx, dy, dz = cross_product (a_vec, [x, y, z])
+        cos_lat_2 = x*x + y*y
+        d_lat = dz / sqrt (cos_lat_2)
+        d_lon = (x*dy - y*dx) / cos_lat_2
+        # Derivative of the (simplified) trip movement, see takeout_course
+        phi = deg_to_rad (rotated_latlon.get_lat())
+        distance_radians = deg_to_rad (self.__speed_knots * self.time_hours / 60)
+        d_lon += sin (deg_to_rad (self.__course_degrees)) * distance_radians *\
+                 sin (phi) / (cos (phi)**2) * d_lat
+        # Derivative of the great circle distance to the end GP
+        phi_2 = deg_to_rad (taken_out.get_lat())
+        lam_2 = deg_to_rad (taken_out.get_lon())
+        u_vec = [cos (phi_2) * cos (lam_2), cos (phi_2) * sin (lam_2), sin (phi_2)]
+        du_lat = [-sin (phi_2) * cos (lam_2), -sin (phi_2) * sin (lam_2), cos (phi_2)]
+        du_lon = [-cos (phi_2) * sin (lam_2), cos (phi_2) * cos (lam_2), 0.0]
+        dp = dot_product (u_vec, end_vec)
+        sin_angle = length_of_vect (cross_product (u_vec, end_vec))
+        if sin_angle == 0:
+            raise IntersectError ("Cannot calculate a trip vector")
+        derivative = -EARTH_RADIUS / sin_angle *\
+            (dot_product (du_lat, end_vec) * d_lat + dot_product (du_lon, end_vec) * d_lon)
+
+        dbp = EARTH_RADIUS * atan2 (sin_angle, dp) - end_radius
+        return dbp, derivative, taken_out, rotated_latlon
+
+#pylint: disable=R0912
+#pylint: disable=R0914
+    @staticmethod
+    def get_intersections_batch (trips : list, return_geodetic : bool,
+                                 diagnostics : bool = False) ->\
+            list [tuple[LatLon | tuple[LatLon, LatLon], float, str] | ValueError | ArithmeticError]:
+        ''' Get the intersections for a list of SightTrip objects (legs).
+            Sight-to-sight legs are solved together with Newton's method
+            (using an analytic derivative) until all legs have converged.
+            Returns a list with one get_intersections result per leg. A leg which
+            cannot be solved gets its error (such as IntersectError) instead of a result,
+            and the other legs are still solved. '''
+        results = list [tuple | ValueError | ArithmeticError | NoneType] ([None] * len (trips))
+        legs = []
+        for i, trip in enumerate (trips):
+            assert isinstance (trip, SightTrip)
+            try:
+                if not isinstance (trip.__sight_start, Sight):
+                    results [i] = trip.get_intersections (return_geodetic=return_geodetic,
+                                                          diagnostics=diagnostics)
+                    continue
+                # Calculate intersections
+                pair = SightPair (trip.__sight_start, trip.__sight_end)
+                best_intersection, fitness, diag_output = pair.get_intersections\
+                    (return_geodetic=False,
+                     estimated_position = trip.__estimated_starting_point,\
+                     diagnostics = diagnostics)
+            except (ValueError, ArithmeticError) as e:
+                results [i] = e
+                continue
+            # Determine angle of the intersection point on sight_start small circle
+            assert isinstance (best_intersection, LatLonGeocentric)
+            legs.append ({"index"      : i,
+                          "trip"       : trip,
+                          "a_vec"      : to_rectangular (trip.__sight_start.get_gp()),
+                          "b_vec"      : to_rectangular (best_intersection),
+                          "end_vec"    : to_rectangular (trip.__sight_end.get_gp()),
+                          "end_radius" : trip.__sight_end.get_circle(geodetic=False).get_radius(),
+                          "rotation"   : 0.0,
+                          "fitness"    : fitness,
+                          "diag"       : diag_output})
+
+        # Apply Newtons method to find the locations
+        limit = 0.001
+        iter_limit = 100
+        iter_count = 0
+        while len (legs) > 0:
+            if iter_count >= iter_limit:
+                for leg in legs:
+                    results [leg ["index"]] = IntersectError ("Cannot calculate a trip vector")
+                break
+            remaining = []
+            for leg in legs:
+                trip = leg ["trip"]
+                try:
+                    distance_result, derivative, taken_out, rotated =\
+                        trip.__calculate_distance_to_target (leg ["rotation"], leg ["a_vec"],
+                                                             leg ["b_vec"], leg ["end_vec"],
+                                                             leg ["end_radius"])
+                except (ValueError, ArithmeticError) as e:
+                    results [leg ["index"]] = e
+                    continue
+                if abs (distance_result) < limit:
+                    trip.__start_pos = rotated
+                    trip.__end_pos   = taken_out
+                    if return_geodetic:
+                        taken_out = LatLonGeodetic (ll=taken_out)
+                        rotated   = LatLonGeodetic (ll=rotated)
+                    results [leg ["index"]] = (taken_out, rotated), leg ["fitness"], leg ["diag"]
+                    continue
+                if derivative == 0:
+                    results [leg ["index"]] = IntersectError ("Cannot calculate a trip vector")
+                    continue
+                # Safeguard: never rotate more than a quarter turn in one step
+                leg ["rotation"] -= squeeze (distance_result/derivative, -pi/2, pi/2)
+                remaining.append (leg)
+            legs = remaining
+            iter_count += 1
+        return results
+#pylint: enable=R0912
+#pylint: enable=R0914
 
 #pylint: disable=R0914
     def get_intersections (self, return_geodetic : bool, diagnostics : bool = False) ->\
@@ -3210,46 +3370,11 @@ class SightTrip:
 
         ### Calculate a trip from Sight to Sight
         if isinstance (self.__sight_start, Sight):
-
-            # Calculate intersections
-            pair = SightPair (self.__sight_start, self.__sight_end)
-            best_intersection, fitness, diag_output = pair.get_intersections\
-                (return_geodetic=False,
-                 estimated_position = self.__estimated_starting_point,\
-                 diagnostics = diagnostics)
-            # Determine angle of the intersection point on sight_start small circle
-            a_vec = to_rectangular (self.__sight_start.get_gp())
-            assert isinstance (best_intersection, LatLonGeocentric)
-            b_vec = to_rectangular (best_intersection)
-
-            # Apply Newtons method to find the location
-            current_rotation = 0
-            delta = 0.0001
-            limit = 0.001
-            iter_limit = 100
-            iter_count = 0
-            taken_out = None
-            rotated  = None
-            while iter_count < iter_limit:
-                distance_result, taken_out, rotated =\
-                    self.__calculate_distance_to_target (current_rotation, a_vec, b_vec)
-                if abs (distance_result) < limit:
-                    break
-                distance_result2, taken_out, rotated =\
-                    self.__calculate_distance_to_target (current_rotation+delta, a_vec, b_vec)
-                derivative = (distance_result2 - distance_result) / delta
-                current_rotation = current_rotation - (distance_result)/derivative
-                iter_count += 1
-            if iter_count >= iter_limit:
-                raise IntersectError ("Cannot calculate a trip vector")
-            assert taken_out is not None
-            assert rotated is not None
-            self.__start_pos = rotated
-            self.__end_pos   = taken_out
-            if return_geodetic:
-                taken_out = LatLonGeodetic (ll=taken_out)
-                rotated   = LatLonGeodetic (ll=rotated)
-            return (taken_out, rotated), fitness, diag_output
+            result = SightTrip.get_intersections_batch ([self], return_geodetic=return_geodetic,
+                                                        diagnostics=diagnostics) [0]
+            if isinstance (result, BaseException):
+                raise result
+            return result
 
         ### Calculate a trip from a timestamp (with estimated position) to Sight
         taken_out = takeout_course (self.__estimated_starting_point,\
@@ -3278,8 +3403,10 @@ class SightTrip:
 
 #pylint: disable=R0914
     def render_folium (self, intersections : tuple [LatLon, LatLon] | LatLon,\
-                       accuracy : float = 1, draw_grid = True, draw_markers = True):
-        ''' Renders this object as a Folium Map object '''
+                       accuracy : float = 1, draw_grid = True, draw_markers = True,
+                       decimals : int = MAP_COORDINATE_DECIMALS):
+        ''' Renders this object as a Folium Map object
+            (see SightCollection.render_folium for accuracy and decimals) '''
 
         check_folium ()
 
@@ -3289,8 +3416,9 @@ class SightTrip:
 
         def draw_arrow (m : Map, from_point : LatLon, to_point : LatLon):
             PolyLine (
-                locations=[[from_point.get_lat(), from_point.get_lon()],
-                           [to_point.get_lat(),   to_point.get_lon()]]
+                locations=quantize_coordinates ([[from_point.get_lat(), from_point.get_lon()],
+                                                 [to_point.get_lat(),   to_point.get_lon()]],
+                                                decimals)
             ).add_to(m)
 
         if isinstance (self.__sight_start, Sight):
@@ -3299,7 +3427,8 @@ class SightTrip:
             retval = s_c.render_folium (intersections=intersections[0],\
                                         accuracy=accuracy,\
                                         label_text="Target",\
-                                        draw_grid=draw_grid)
+                                        draw_grid=draw_grid,\
+                                        decimals=decimals)
             assert isinstance (retval, Map)
             if draw_markers:
                 Marker (icon=Icon(color='lightgray', icon='home', prefix='fa'),
@@ -3317,7 +3446,8 @@ class SightTrip:
         draw_map = get_folium_map_safe (location = [end_pos_d.get_lat(),\
                                     end_pos_d.get_lon()])
         assert isinstance (draw_map, Map)
-        self.__sight_end.render_folium (draw_map)
+        self.__sight_end.render_folium (draw_map, zoom=get_map_detail_zoom (draw_map, accuracy),
+                                        decimals=decimals)
 
 
         # Handle/plot markers
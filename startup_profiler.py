@@ -0,0 +1,122 @@
+''' Startup timing for the app (cold start profiling).
+    Enabled with the environment variable CELESTE_STARTUP_PROFILE, set to 1 for a report
+    on stdout, or to a file name. Records the time of each import (done on the main thread)
+    and of the startup phases (see startup_mark).
+    Import this module and call start_startup_profiler before anything else.
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+import builtins
+import os
+import sys
+import threading
+import time
+from types import NoneType
+
+STARTUP_PROFILE_VARIABLE = "CELESTE_STARTUP_PROFILE"
+
+class StartupProfiler:
+    ''' Records import times (with nesting) and the durations of named phases '''
+
+    def __init__ (self):
+        self.__start_time = time.perf_counter ()
+        self.__last_mark = self.__start_time
+        # (module name, nesting depth, duration in seconds), in import order
+        self.__imports = list [tuple [str, int, float]] ()
+        # (phase name, duration in seconds)
+        self.__phases = list [tuple [str, float]] ()
+        self.__depth = 0
+        self.__original_import = None
+        self.__thread_id = threading.get_ident ()
+
+    def start (self):
+        ''' Start timing imports '''
+        if self.__original_import is not None:
+            return
+        original_import = builtins.__import__
+        self.__original_import = original_import
+
+        def timed_import (name, globals_=None, locals_=None, fromlist=(), level=0):
+            # Only new (absolute) imports on the main thread are timed
+            if level != 0 or name in sys.modules or\
+               threading.get_ident () != self.__thread_id:
+                return original_import (name, globals_, locals_, fromlist, level)
+            index = len (self.__imports)
+            self.__imports.append ((name, self.__depth, 0.0))
+            self.__depth += 1
+            t = time.perf_counter ()
+            try:
+                return original_import (name, globals_, locals_, fromlist, level)
+            finally:
+                self.__depth -= 1
+                self.__imports [index] = (name, self.__depth, time.perf_counter () - t)
+
+        builtins.__import__ = timed_import
+
+    def stop (self):
+        ''' Stop timing imports '''
+        if self.__original_import is not None:
+            builtins.__import__ = self.__original_import
+            self.__original_import = None
+
+    def mark (self, phase : str):
+        ''' Record the end of a phase (which started at the previous mark) '''
+        t = time.perf_counter ()
+        self.__phases.append ((phase, t - self.__last_mark))
+        self.__last_mark = t
+
+    def get_imports (self) -> list [tuple [str, int, float]]:
+        ''' Returns the timed imports (name, depth, seconds) '''
+        return list (self.__imports)
+
+    def get_phases (self) -> list [tuple [str, float]]:
+        ''' Returns the phases (name, seconds) '''
+        return list (self.__phases)
+
+    def report (self, min_ms : float = 5.0) -> str:
+        ''' Returns a report of the phases and of imports slower than min_ms '''
+        lines = ["=== Startup profile ===",
+                 f"Total: {(self.__last_mark - self.__start_time) * 1000:.0f} ms", "Phases:"]
+        for phase, duration in self.__phases:
+            lines.append (f"  {duration * 1000:8.1f} ms  {phase}")
+        lines.append (f"Imports (at least {min_ms} ms, including nested imports):")
+        for name, depth, duration in self.__imports:
+            if duration * 1000 >= min_ms:
+                lines.append (f"  {duration * 1000:8.1f} ms  " + "  " * depth + name)
+        return "\n".join (lines)
+
+STARTUP_PROFILER : StartupProfiler | NoneType = None
+
+def start_startup_profiler () -> StartupProfiler | NoneType:
+    ''' Start profiling if enabled (see STARTUP_PROFILE_VARIABLE) '''
+#pylint: disable=W0603
+    global STARTUP_PROFILER
+#pylint: enable=W0603
+    if STARTUP_PROFILER is None and os.environ.get (STARTUP_PROFILE_VARIABLE, "") not in ("", "0"):
+        STARTUP_PROFILER = StartupProfiler ()
+        STARTUP_PROFILER.start ()
+    return STARTUP_PROFILER
+
+def startup_mark (phase : str):
+    ''' Record the end of a startup phase (does nothing if profiling is disabled) '''
+    if STARTUP_PROFILER is not None:
+        STARTUP_PROFILER.mark (phase)
+
+def finish_startup_profile ():
+    ''' Stop profiling and output the report (to stdout, or to the file given by
+        STARTUP_PROFILE_VARIABLE) '''
+#pylint: disable=W0603
+    global STARTUP_PROFILER
+#pylint: enable=W0603
+    if STARTUP_PROFILER is None:
+        return
+    STARTUP_PROFILER.stop ()
+    report = STARTUP_PROFILER.report ()
+    STARTUP_PROFILER = None
+    target = os.environ.get (STARTUP_PROFILE_VARIABLE, "")
+    if target == "1":
+        print (report)
+    else:
+        with open (target, "w", encoding="utf-8") as f:
+            f.write (report + "\n")
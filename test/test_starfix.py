@@ -1,6 +1,22 @@
 ''' Test suite for the toolkit '''
 # pylint: disable=C0413
 import unittest
+import json
+import sqlite3
+import socket
+import threading
+import http.server
+import http.client
+import gzip
+from functools import partial
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+import os
+import tempfile
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from math import sin, cos, atan2
 
 import sys
 from pathlib import Path
@@ -20,7 +36,28 @@ from starfixdata_sea_4       import main as main_sea_4
 from starfixdata_sea_5       import main as main_sea_5
 from terrestrial             import main as main_terrestrial
 from starfix                 import LatLonGeocentric, LatLonGeodetic, spherical_distance,\
-                                    to_rectangular, to_latlon
+                                    to_rectangular, to_latlon, get_azimuth, ObserverFrame,\
+                                    angle_b_points, rad_to_deg, distance_matrix,\
+                                    deg_to_rad, normalize_vect, cross_product,\
+                                    subtract_vecs, dot_product,\
+                                    paired_distances, Sight, SightTrip, takeout_course,\
+                                    SightCollection, Circle, IntersectError,\
+                                    MyHandler, MyTCPServer, set_tile_store, set_dynamic_document
+from mapoutput               import simplify_polyline, quantize_coordinates, get_map_grid,\
+                                    get_map_grid_tooltip, get_map_grid_geojson, publish_map,\
+                                    render_map_documents, publish_documents, ConnectivityMonitor
+from voyage                  import Voyage, CourseSegment
+from tracker                 import PositionTracker
+from folium                  import Map as FoliumMap
+from tilestore               import MBTilesStore, convert_tile_directory
+from download_tiles          import prefetch_tiles, tiles_for_bbox, tiles_for_route
+from plotserver              import SelectorNMEAServer, create_nmea_server, PlotServerManager,\
+                                    resolve_udp_address
+from rasterplot              import FixPlot, render_fix_plots, MATPLOTLIB_INITIALIZED
+from startup_profiler        import StartupProfiler
+from persistence             import JsonPersister
+from resource_profiler       import ResourceSampler
+from fixhistory              import FixHistory, export_track
 #pylint: enable=E0401
 
 
@@ -29,6 +66,14 @@ try:
 except ValueError:
     pass
 
+def synthetic_sight (gp : LatLonGeocentric, true_pos : LatLonGeocentric, set_time : str) -> Sight:
+    ''' Create an exact (observed altitude) sight of a GP, as seen from a known position '''
+    alt = 90 - rad_to_deg (angle_b_points (gp, true_pos))
+    gha = str ((-gp.get_lon()) % 360)
+    return Sight (object_name="Sun", set_time=set_time, measured_alt=str(alt),
+                  gha_time_0=gha, gha_time_1=gha, decl_time_0=str(gp.get_lat()),
+                  estimated_position=true_pos, ho_obs=True)
+
 class TestStringMethods(unittest.TestCase):
     ''' Test class'''
 
@@ -124,5 +169,574 @@ class TestStringMethods(unittest.TestCase):
         z = to_latlon (y)
         assert (abs(z.get_lat() - x.get_lat()) < 0.00000000000001)
         assert (abs(z.get_lon() - x.get_lon()) < 0.00000000000001)
-        
 
+    def test_observer_frame (self):
+        ''' Check the observer frame against the direct (unbatched) azimuth formula,
+            and against known values '''
+
+        def reference_azimuth (to_pos, from_pos):
+            # The formula of get_azimuth before the observer frame was introduced
+            from_pos_gc = from_pos.get_latlon ()
+            a = to_rectangular (to_pos)
+            b_gc = to_rectangular (from_pos_gc)
+            phi_gd = deg_to_rad (from_pos.get_lat ())
+            lam = deg_to_rad (from_pos.get_lon ())
+            north_tangent = normalize_vect ([-sin (phi_gd) * cos (lam),
+                                             -sin (phi_gd) * sin (lam), cos (phi_gd)])
+            east_tangent = normalize_vect (cross_product ([0.0, 0.0, 1.0], b_gc))
+            direction = normalize_vect (subtract_vecs (a, b_gc))
+            return rad_to_deg (atan2 (dot_product (direction, east_tangent),
+                                      dot_product (direction, north_tangent))) % 360
+
+        observer = LatLonGeodetic (57.5, 18.3)
+        frame = ObserverFrame (observer)
+        gps = [LatLonGeocentric (lat, lon) for lat in range (-80, 81, 20)\
+                                           for lon in range (-170, 171, 40)]
+        azimuths_altitudes = frame.get_azimuths_altitudes (gps)
+        assert [a for a, _ in azimuths_altitudes] == frame.get_azimuths (gps)
+        assert [a for _, a in azimuths_altitudes] == frame.get_altitudes (gps)
+        for gp, (az, alt) in zip (gps, azimuths_altitudes):
+            assert abs (az - reference_azimuth (gp, observer)) < 1e-9
+            assert abs (az - get_azimuth (gp, observer)) < 1e-9
+            assert -90 <= alt <= 90
+
+        # Known values for an observer on the equator (geocentric = geodetic)
+        frame = ObserverFrame (LatLonGeodetic (0, 0))
+        known = frame.get_azimuths_altitudes ([LatLonGeocentric (0, 10), LatLonGeocentric (10, 0),
+                                               LatLonGeocentric (0, -30),
+                                               LatLonGeocentric (-45, 0)])
+        for (az, alt), (az_0, alt_0) in zip (known, [(90, 80), (0, 80), (270, 60), (180, 45)]):
+            assert abs (az - az_0) < 1e-9 and abs (alt - alt_0) < 1e-9
+
+        # For a geocentric observer the altitude is the complement of the angle to the GP
+        observer_gc = LatLonGeocentric (10, 20)
+        gp = LatLonGeocentric (30, 40)
+        alt = ObserverFrame (observer_gc).get_altitude (gp)
+        assert abs (alt - (90 - rad_to_deg (angle_b_points (gp, observer_gc)))) < 1e-9
+        assert abs (ObserverFrame (observer_gc).get_azimuth (LatLonGeocentric (10, 30)) - 90) < 2
+
+    def test_distance_matrix (self):
+        ''' Check the batched great circle distance kernels '''
+        points = [LatLonGeocentric (lat, lon) for lat in range (-90, 91, 30)\
+                                              for lon in range (-180, 180, 45)]
+        matrix = distance_matrix (points)
+        for i, p1 in enumerate (points):
+            assert matrix [i][i] == 0
+            for j, p2 in enumerate (points):
+                assert abs (matrix [i][j] - spherical_distance (p1, p2)) < 1e-6
+                assert matrix [i][j] == matrix [j][i]
+
+        # One arc minute along a meridian is one nautical mile
+        a = [LatLonGeocentric (10, 10), LatLonGeocentric (-45, 100)]
+        b = [LatLonGeocentric (10 + 1/60, 10), LatLonGeocentric (-45 - 1/60, 100)]
+        for d in paired_distances (a, b, nautical_miles=True):
+            assert abs (d - 1) < 1e-9
+        assert distance_matrix (a, b) [0][1] > 0
+        # Small distances are resolved (the acos formulation returns 0 here)
+        tiny = distance_matrix ([LatLonGeocentric (10, 10)], [LatLonGeocentric (10, 10.0000001)])
+        assert 1e-5 < tiny [0][0] < 2e-5
+
+    def test_sight_trip_batch (self):
+        ''' Check the running fix solver, for single and batched legs '''
+        trips = []
+        expected = []
+        for course, speed in [(175, 20), (45, 8), (280, 12)]:
+            start = LatLonGeocentric (59.1, 18.2)
+            end = takeout_course (start, course, speed, 1.0)
+            s1 = synthetic_sight (LatLonGeocentric (23, 60), start, "2024-06-20 06:00:00+00:00")
+            s2 = synthetic_sight (LatLonGeocentric (23, 30), end, "2024-06-20 07:00:00+00:00")
+            trips.append (SightTrip (s1, s2, LatLonGeodetic (59, 18), course, speed))
+            expected.append ((end, start))
+        results = SightTrip.get_intersections_batch (trips, return_geodetic=False)
+        for trip, result, (end, start) in zip (trips, results, expected):
+            (end_pos, start_pos), _, _ = result
+            assert spherical_distance (end_pos, end) < 0.01
+            assert spherical_distance (start_pos, start) < 0.01
+            (end_pos_2, _), _, _ = trip.get_intersections (return_geodetic=False)
+            assert spherical_distance (end_pos, end_pos_2) < 0.001
+        # A leg which cannot be solved doesn't stop the other legs
+        s1 = synthetic_sight (LatLonGeocentric (0, 0), LatLonGeocentric (0, 5),
+                              "2024-06-20 06:00:00+00:00")
+        s2 = synthetic_sight (LatLonGeocentric (0, 40), LatLonGeocentric (0, 35),
+                              "2024-06-20 07:00:00+00:00")
+        bad_trip = SightTrip (s1, s2, LatLonGeodetic (0, 5), 90, 10)
+        results = SightTrip.get_intersections_batch ([trips [0], bad_trip, trips [1]],
+                                                     return_geodetic=False)
+        assert isinstance (results [1], IntersectError)
+        assert spherical_distance (results [0][0][0], expected [0][0]) < 0.01
+        assert spherical_distance (results [2][0][0], expected [1][0]) < 0.01
+        with self.assertRaises (IntersectError):
+            bad_trip.get_intersections (return_geodetic=False)
+
+    def test_voyage (self):
+        ''' Check the voyage solver on an exact (synthetic) passage with two course segments '''
+        t0 = datetime (2024, 6, 20, 6, tzinfo=timezone.utc)
+        switch = t0 + timedelta (minutes=200)
+        segments = [CourseSegment (t0, 175, 8), CourseSegment (switch, 220, 6)]
+        position = LatLonGeocentric (40.1, -30.2)
+        truth = []
+        sights = []
+        for i in range (10):
+            t = t0 + timedelta (minutes=40*i)
+            if i > 0:
+                seg = segments [1] if truth [-1][0] >= switch else segments [0]
+                position = takeout_course (position, seg.course_degrees, seg.speed_knots, 40/60)
+            truth.append ((t, position))
+            gp = LatLonGeocentric (10 + (i % 3) * 5, -60 + (i % 2) * 50)
+            sights.append (synthetic_sight (gp, position, t.strftime ("%Y-%m-%d %H:%M:%S+00:00")))
+        epochs = Voyage (sights, segments, LatLonGeodetic (40, -30)).solve (return_geodetic=False)
+        assert len (epochs) == len (truth)
+        for epoch, (t, p) in zip (epochs, truth):
+            assert epoch.get_time () == t
+            assert spherical_distance (epoch.get_position (), p) < 0.1
+            major, minor, _ = epoch.get_error_ellipse ()
+            assert 0 < minor <= major < 5
+
+    def test_position_tracker (self):
+        ''' Check that the tracker follows a vessel, and recovers course and speed '''
+        t0 = datetime (2024, 6, 20, 6, tzinfo=timezone.utc)
+        tracker = PositionTracker (t0, LatLonGeodetic (40, -30), 170, 7, estimate_velocity=True)
+        updates = []
+        tracker.add_listener (lambda t, p : updates.append (p))
+        position = LatLonGeocentric (40.1, -30.2)
+        for i in range (1, 40):
+            position = takeout_course (position, 175, 8, 0.5)
+            t = t0 + timedelta (minutes=30*i)
+            gp = LatLonGeocentric (10 + (i % 3) * 5, -60 + (i % 2) * 50)
+            tracker.update (synthetic_sight (gp, position, t.strftime ("%Y-%m-%d %H:%M:%S+00:00")))
+        assert len (updates) == 39
+        assert distance_matrix ([tracker.get_position (return_geodetic=False)],\
+                                [position])[0][0] < 0.1
+        course, speed = tracker.get_course_speed ()
+        assert abs (course - 175) < 0.1
+        assert abs (speed - 8) < 0.1
+        assert tracker.get_sigma_nm () < 2
+        with self.assertRaises (ValueError):
+            tracker.predict (t0)
+
+    def test_circle_polyline (self):
+        ''' Check the circle outline generator (geodetic points, adaptive sampling, wrapping) '''
+        c = Circle (LatLonGeocentric (23.4, -170.2), 62.3)
+        segments = c.get_polyline (steps_per_degree=1)
+        for lat, lon in segments [0][::30]:
+            # Every point should be on the circle
+            gc = LatLonGeodetic (lat, lon).get_latlon ()
+            assert abs (rad_to_deg (angle_b_points (gc, c.get_latlon ())) - 62.3) < 10**-6
+        assert len (segments [0][0]) == 2
+        # Fewer points when zoomed out
+        assert sum (len (s) for s in c.get_polyline (zoom=2)) <\
+               sum (len (s) for s in c.get_polyline (zoom=11))
+        # A circle around the north pole is split at the edges
+        segments = Circle (LatLonGeocentric (10, 0), 89).get_polyline ()
+        assert len (segments) == 1
+        assert abs (segments [0][0][1]) == 180
+        assert abs (segments [0][-1][1]) == 180
+
+    def test_simplify_polyline (self):
+        ''' Check polyline simplification and coordinate quantization '''
+        line = [[i / 100, 2 * i / 100] for i in range (1000)]
+        assert simplify_polyline (line, 10**-6) == [line [0], line [-1]]
+        circle = Circle (LatLonGeocentric (10, 20), 5).get_polyline (steps_per_degree=10) [0]
+        simplified = simplify_polyline (circle, 0.01)
+        assert 10 < len (simplified) < len (circle)
+        assert simplified [0] == circle [0] and simplified [-1] == circle [-1]
+        # Less detail far away from the center of the view
+        far = simplify_polyline (circle, 0.01, center=[60, 20], view_radius=1)
+        assert len (far) < len (simplified)
+        # Latitude deviations are stretched by 1/cos(lat) on the map
+        for lat, kept in ((0, False), (70, True)):
+            bump = [[lat + (0.006 if i == 5 else 0), i / 10] for i in range (11)]
+            assert (bump [5] in simplify_polyline (bump, 0.01)) == kept
+        assert quantize_coordinates ([[1.123456, 2.0], [1.123457, 2.0], [3, 4]], 5) ==\
+               [[1.12346, 2.0], [3, 4]]
+
+    def test_connectivity_monitor (self):
+        ''' Check the cached state and refresh of the connectivity monitor '''
+        states = [False]
+        monitor = ConnectivityMonitor (probe=lambda : states [0], min_interval=60)
+        assert monitor.is_online () is None
+        monitor.start ()
+        assert monitor.wait_for_state (timeout=5) is False
+        states [0] = True
+        monitor.refresh ()
+        for _ in range (50):
+            if monitor.is_online ():
+                break
+            time.sleep (0.1)
+        assert monitor.is_online () is True
+        monitor.stop ()
+
+    def test_map_grid (self):
+        ''' Check the grid lines used for maps '''
+        parallels, meridians, minute_lines = get_map_grid ()
+        assert len (parallels) == 181 and len (meridians) == 361 and len (minute_lines) == 0
+        parallels, meridians, minute_lines = get_map_grid (LatLonGeodetic (59.5, 18.25))
+        assert len (parallels) == 0 and len (meridians) == 0 and len (minute_lines) == 42
+        assert [[59.5, 18.25 - 1/6], [59.5, 18.25 + 1/6]] in minute_lines
+        assert get_map_grid_tooltip ([[59.5, 18.25 - 1/6], [59.5, 18.25 + 1/6]], True) ==\
+            "N 59° 30'"
+        assert get_map_grid_tooltip ([[59.5 - 1/6, -18.25], [59.5 + 1/6, -18.25]], True) ==\
+            "W 18° 15'"
+        assert get_map_grid_tooltip ([[-90, -17], [90, -17]]) == "-17°"
+        assert get_map_grid_tooltip ([[59, -180], [59, 180]]) == "59°"
+        # One GeoJSON layer per level, (lon, lat) order
+        geojson = get_map_grid_geojson (minute_lines, True, lon_adjustment=360)
+        assert len (geojson ["features"]) == 42
+        assert {"type" : "Feature",
+                "geometry" : {"type" : "LineString",
+                              "coordinates" : [[378.08333, 59.5], [378.41667, 59.5]]},
+                "properties" : {"label" : "N 59° 30'"}} in geojson ["features"]
+
+    @unittest.skipUnless (MATPLOTLIB_INITIALIZED, "matplotlib is not installed")
+    def test_raster_plot (self):
+        ''' Check the headless plot renderer (PNG and SVG) '''
+        pos = LatLonGeocentric (59.1, 18.2)
+        sights = [synthetic_sight (LatLonGeocentric (lat, lon), pos, "2024-06-20 06:00:00+00:00")
+                  for lat, lon in ((23, 60), (23, -20), (-10, 10))]
+        fix = SightCollection (sights).get_intersections\
+            (return_geodetic=True, estimated_position=LatLonGeodetic (59, 18))[0]
+        with tempfile.TemporaryDirectory () as d:
+            jobs = [FixPlot.from_sights (os.path.join (d, "fix" + ext), sights, fix)
+                    for ext in (".png", ".svg")]
+            self.assertEqual (render_fix_plots (jobs, processes=2), [j.file_name for j in jobs])
+            with open (jobs [0].file_name, "rb") as f:
+                assert f.read (8) == b"\x89PNG\r\n\x1a\n"
+            with open (jobs [1].file_name, "r", encoding="utf-8") as f:
+                assert "<svg" in f.read ()
+
+    def test_tile_store (self):
+        ''' Check the MBTiles tile store, the directory converter and the tile HTTP headers '''
+        with tempfile.TemporaryDirectory () as d:
+            for z, x, y in [(0, 0, 0), (1, 0, 0), (1, 1, 0), (2, 3, 1)]:
+                os.makedirs (os.path.join (d, "tiles", str (z), str (x)), exist_ok=True)
+                with open (os.path.join (d, "tiles", str (z), str (x), str (y) + ".png"),\
+                           "wb") as f:
+                    f.write (bytes ([z, x, y]))
+            file_name = os.path.join (d, "tiles.mbtiles")
+            assert convert_tile_directory (os.path.join (d, "tiles"), file_name) == 4
+            with sqlite3.connect (file_name) as c:
+                # MBTiles uses TMS rows
+                assert c.execute ("SELECT tile_row FROM tiles WHERE zoom_level = 2").fetchone ()\
+                       == (2,)
+            store = MBTilesStore (file_name, cache_size=2)
+            assert store.get_metadata ("maxzoom") == "2"
+            self.assertEqual (store.get_tile (2, 3, 1) [0], bytes ([2, 3, 1]))
+            assert store.get_tile (2, 3, 2) is None
+            store.get_tile (0, 0, 0)
+            store.get_tile (1, 1, 0)
+            assert store.has_tile (2, 3, 1)
+
+            set_tile_store (store)
+            server = http.server.ThreadingHTTPServer (("127.0.0.1", 0), MyHandler)
+            threading.Thread (target=server.serve_forever, daemon=True).start ()
+            try:
+                url = "http://127.0.0.1:" + str (server.server_address [1]) + "/tiles/1/1/0.png"
+                with urlopen (url, timeout=5) as response:
+                    assert response.read () == bytes ([1, 1, 0])
+                    etag = response.headers ["ETag"]
+                    assert "max-age" in response.headers ["Cache-Control"]
+                with self.assertRaises (HTTPError) as cm:
+                    urlopen (Request (url, headers={"If-None-Match" : etag}), timeout=5)
+                assert cm.exception.code == 304
+            finally:
+                server.shutdown ()
+                server.server_close ()
+                set_tile_store (None)
+                store.close ()
+
+    def test_http_server (self):
+        ''' Check the map HTTP server (parallel keep-alive connections, gzip, allow-list) '''
+        with tempfile.TemporaryDirectory () as d:
+            page = "<html>" + "map " * 10000 + "</html>"
+            with open (os.path.join (d, "map.html"), "w", encoding="utf-8") as f:
+                f.write (page)
+            with open (os.path.join (d, "secret.py"), "w", encoding="utf-8") as f:
+                f.write ("")
+            server = MyTCPServer (("127.0.0.1", 0), partial (MyHandler, directory=d))
+            threading.Thread (target=server.serve_forever, daemon=True).start ()
+            try:
+                # An idle connection does not block other connections
+                idle = http.client.HTTPConnection ("127.0.0.1", server.server_address [1],\
+                                                   timeout=5)
+                idle.connect ()
+                c = http.client.HTTPConnection ("127.0.0.1", server.server_address [1], timeout=5)
+                c.request ("GET", "/map.html", headers={"Accept-Encoding" : "gzip"})
+                r = c.getresponse ()
+                assert r.getheader ("Content-Encoding") == "gzip"
+                assert gzip.decompress (r.read ()).decode () == page
+                # Same connection (keep-alive)
+                c.request ("GET", "/map.html")
+                r = c.getresponse ()
+                assert r.getheader ("Content-Encoding") is None and r.read ().decode () == page
+                c.request ("GET", "/secret.py")
+                r = c.getresponse ()
+                r.read ()
+                assert r.status == 404
+                c.close ()
+                idle.close ()
+            finally:
+                server.shutdown ()
+                server.server_close ()
+
+    def test_published_documents (self):
+        ''' Check that maps are served from memory, and that old versions are evicted '''
+        server = MyTCPServer (("127.0.0.1", 0), MyHandler)
+        threading.Thread (target=server.serve_forever, daemon=True).start ()
+        try:
+            c = http.client.HTTPConnection ("127.0.0.1", server.server_address [1], timeout=5)
+            urls = [publish_map (FoliumMap ([59, 18], tiles=None)) for _ in range (4)]
+            c.request ("GET", urls [-1])
+            r = c.getresponse ()
+            assert r.status == 200 and "L.map" in r.read ().decode ()
+            c.request ("GET", urls [0])
+            r = c.getresponse ()
+            r.read ()
+            assert r.status == 404
+            c.close ()
+        finally:
+            server.shutdown ()
+            server.server_close ()
+
+    def test_prerendered_map (self):
+        ''' Check that map documents rendered on a worker thread can be published later '''
+        the_map = FoliumMap ([59, 18], tiles=None)
+        worker = threading.Thread (target=lambda: setattr (the_map, "documents",
+                                                           render_map_documents (the_map)))
+        worker.start ()
+        worker.join ()
+        assert list (the_map.documents.keys ()) == ["map.html"]
+        url = publish_documents (the_map.documents)
+        assert publish_map (the_map) != url + "map.html"
+        assert url.startswith ("/doc/") and url.endswith ("/")
+
+    def test_startup_profile (self):
+        ''' Check that pandas and folium are not imported with starfix, and the profiler '''
+        out = subprocess.run ([sys.executable, "-c",
+                               "import sys, starfix; " +\
+                               "print ('pandas' in sys.modules, 'folium' in sys.modules)"],
+                              cwd=Path (__file__).parent.parent, capture_output=True,
+                              text=True, check=True).stdout
+        assert out.strip () == "False False"
+        profiler = StartupProfiler ()
+        profiler.start ()
+        try:
+            sys.modules.pop ("colorsys", None)
+#pylint: disable=C0415
+#pylint: disable=W0611
+            import colorsys
+#pylint: enable=C0415
+#pylint: enable=W0611
+        finally:
+            profiler.stop ()
+        profiler.mark ("Imports")
+        assert [i [0] for i in profiler.get_imports ()] == ["colorsys"]
+        assert [p [0] for p in profiler.get_phases ()] == ["Imports"]
+        assert "Imports" in profiler.report (min_ms=0)
+
+    def test_json_persister (self):
+        ''' Check that rapid changes are coalesced into one (atomic) write '''
+        with tempfile.TemporaryDirectory () as d:
+            file_name = os.path.join (d, "state.json")
+            persister = JsonPersister (file_name, delay=0.2)
+            state = {"Format" : "celeste.1"}
+            for i in range (20):
+                state ["DrpLat"] = str (i)
+                persister.save (state)
+            assert persister.get_write_count () == 0
+            time.sleep (0.6)
+            assert persister.get_write_count () == 1
+            with open (file_name, "r", encoding="utf-8") as f:
+                assert json.load (f) ["DrpLat"] == "19"
+            persister.save (state)
+            persister.flush ()
+            # Unchanged content is not written again
+            assert persister.get_write_count () == 1
+            state ["DrpLon"] = "18"
+            persister.save (state)
+            persister.close ()
+            assert persister.get_write_count () == 2
+            assert os.listdir (d) == ["state.json"]
+
+    def test_resource_sampler (self):
+        ''' Check the resource sampler (ring buffer, allocation sites and HTTP access) '''
+        sampler = ResourceSampler (interval=0.01, capacity=5, trace_allocations=True,
+                                   extra=lambda: {"answer" : 42})
+        sampler.start ()
+        try:
+            # The baseline of the allocation sites
+            sampler.sample ()
+            leak = [bytearray (1000) for _ in range (1000)]
+            time.sleep (0.3)
+        finally:
+            sampler.stop ()
+        samples = sampler.get_samples ()
+        assert len (samples) == 5 and leak is not None
+        assert samples [-1].objects > 0 and samples [-1].extra ["answer"] == 42
+        assert samples [-1].top_sites [0][2] >= 900
+        server = MyTCPServer (("127.0.0.1", 0), MyHandler)
+        threading.Thread (target=server.serve_forever, daemon=True).start ()
+        try:
+            sampler.serve ("/status/test.json")
+            with urlopen ("http://127.0.0.1:" + str (server.server_address [1]) +
+                          "/status/test.json", timeout=5) as r:
+                assert len (json.loads (r.read ()) ["samples"]) == 5
+        finally:
+            set_dynamic_document ("/status/test.json", None)
+            server.shutdown ()
+            server.server_close ()
+
+    def test_fix_history (self):
+        ''' Check the fix history (track, fixes near a position across the date line, export) '''
+        with tempfile.TemporaryDirectory () as d:
+            history = FixHistory (os.path.join (d, "fixes.sqlite"))
+            t0 = datetime (2025, 6, 1, tzinfo=timezone.utc)
+            for i in range (200):
+                history.record (LatLonGeodetic (20, 179.5 + i * 0.01), t0 + timedelta (hours=i),
+                                fitness=1.0, sigma_nm=0.5, duration=0.1, iterations=3,
+                                inputs={"Use1" : "True"})
+            history.record (None, message="Failed")
+            assert history.count_fixes () == 201
+            track = list (history.get_track (t0 + timedelta (hours=10), t0 + timedelta (hours=19),
+                                             batch_size=3))
+            assert [r.id for r in track] == list (range (11, 21))
+            assert track [0].inputs == {"Use1" : "True"} and track [0].success
+            # 0.01 degrees of longitude is about 0.56 nm at 20N
+            near = history.get_fixes_near (LatLonGeodetic (20, -180), 2)
+            assert [r.id for r, _ in near][:1] == [51] and len (near) == 7
+            assert all (n1 <= n2 for (_, n1), (_, n2) in zip (near, near [1:]))
+            assert len (history.get_fixes_near (LatLonGeodetic (20, 0), 9000)) == 200
+            export_track (history, os.path.join (d, "track.gpx"))
+            export_track (history, os.path.join (d, "track.geojson"), end=t0)
+            with open (os.path.join (d, "track.gpx"), "r", encoding="utf-8") as f:
+                assert f.read ().count ("<trkpt") == 200
+            with open (os.path.join (d, "track.geojson"), "r", encoding="utf-8") as f:
+                assert len (json.load (f) ["features"]) == 1
+            history.close ()
+
+    def test_tile_prefetch (self):
+        ''' Check the tile prefetcher (against a local tile server), including resume '''
+        requested = []
+
+        class TileHandler (http.server.BaseHTTPRequestHandler):
+            ''' Local stand-in for a tile server '''
+            def do_GET (self):
+                ''' Return the path as tile data (404 for zoom level 3) '''
+                requested.append (self.path)
+                if self.path.startswith ("/3/"):
+                    self.send_error (404)
+                    return
+                self.send_response (200)
+                self.send_header ("Content-Length", str (len (self.path)))
+                self.end_headers ()
+                self.wfile.write (self.path.encode ())
+            def log_message (self, *_):
+                pass
+
+        # Scandinavia, crossing a tile boundary (66.5 N) at zoom level 2
+        tiles = list (tiles_for_bbox (60, 10, 70, 30, 0, 3))
+        assert (2, 2, 0) in tiles and (3, 4, 2) in tiles and len (tiles) == 6
+        # Crossing the date line
+        assert tiles_for_route ([(50, 179), (50, -179)], 10, 1, 1) == {(1, 0, 0), (1, 1, 0)}
+        # The short way across the date line (not around the world)
+        assert len (tiles_for_route ([(50, 179), (50, -179)], 10, 8, 8)) <= \
+               len (tiles_for_route ([(50, 10), (50, 12)], 10, 8, 8)) <= 8
+
+        server = http.server.ThreadingHTTPServer (("127.0.0.1", 0), TileHandler)
+        threading.Thread (target=server.serve_forever, daemon=True).start ()
+        url = "http://127.0.0.1:" + str (server.server_address [1]) + "/{z}/{x}/{y}"
+        try:
+            with tempfile.TemporaryDirectory () as d:
+                file_name = os.path.join (d, "tiles.mbtiles")
+                stats = prefetch_tiles (file_name, tiles, url, workers=3, rate_per_second=1000)
+                assert stats ["downloaded"] == 4 and stats ["missing"] == 2
+                store = MBTilesStore (file_name)
+                assert store.get_tile (2, 2, 1) [0] == b"/2/2/1"
+                store.close ()
+                requested.clear ()
+                stats = prefetch_tiles (file_name, tiles, url, rate_per_second=1000)
+                assert stats ["skipped"] == 4 and len (requested) == 2
+        finally:
+            server.shutdown ()
+            server.server_close ()
+
+    def test_nmea_server (self):
+        ''' Check the event loop NMEA server (many clients on one thread, push on update) '''
+        # The position is pushed at once, without waiting for the interval
+        server = SelectorNMEAServer (host="127.0.0.1", port=0, interval=60)
+        threads = threading.active_count ()
+        server.start ()
+        try:
+            clients = [socket.create_connection (("127.0.0.1", server.port), timeout=5)
+                       for _ in range (50)]
+            assert threading.active_count () <= threads + 1
+            server.update_position (59.5, -18.25)
+            for c in clients:
+                data = b""
+                while b"$GPRMC" not in data:
+                    data += c.recv (1024)
+                assert b"$GPGGA" in data and b",5930.000,N,01815.000,W," in data
+            for c in clients [:10]:
+                c.close ()
+            deadline = time.time () + 5
+            while len (server.clients) > 40 and time.time () < deadline:
+                time.sleep (0.05)
+            assert len (server.clients) == 40
+            for c in clients [10:]:
+                c.close ()
+        finally:
+            server.stop ()
+        assert threading.active_count () <= threads
+
+    def test_nmea_udp (self):
+        ''' Check the UDP NMEA output (sent to a single local listener) '''
+        listener = socket.socket (socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind (("127.0.0.1", 0))
+        listener.settimeout (5)
+        server = create_nmea_server ("udp", port=listener.getsockname () [1], host="127.0.0.1")
+        server.start ()
+        try:
+            server.update_position (-33.5, 151.25)
+            data = listener.recv (1024)
+            assert data.startswith (b"$GPGGA") and b",3330.000,S,15115.000,E," in data
+        finally:
+            server.stop ()
+            listener.close ()
+        # A host name (the listener uses the same address family as the server)
+        family, address = resolve_udp_address ("localhost", 0)
+        listener = socket.socket (family, socket.SOCK_DGRAM)
+        listener.bind (address)
+        listener.settimeout (5)
+        server = create_nmea_server ("udp", port=listener.getsockname () [1], host="localhost")
+        server.start ()
+        try:
+            server.update_position (59.5, -18.25)
+            assert b",5930.000,N,01815.000,W," in listener.recv (1024)
+        finally:
+            server.stop ()
+            listener.close ()
+        # A name that cannot be resolved is taken as IPv4
+        assert resolve_udp_address ("nmea.invalid", 10110) ==\
+            (socket.AF_INET, ("nmea.invalid", 10110))
+        with self.assertRaises (ValueError):
+            create_nmea_server ("serial")
+
+    def test_plot_server_lifecycle (self):
+        ''' Check the plot server manager (position updates and idle shutdown) '''
+        manager = PlotServerManager ()
+        manager.port, manager.idle_timeout = 0, 0.5
+        try:
+            manager.start ()
+            manager.update_position (10.5, 20.25)
+            deadline = time.time () + 5
+            while manager.server is None and time.time () < deadline:
+                time.sleep (0.01)
+            with socket.create_connection (("127.0.0.1", manager.server.port), timeout=5) as c:
+                assert b",1030.000,N,02015.000,E," in c.recv (1024)
+            # Stopped when idle
+            while manager.get_status () ["server_thread_alive"] and time.time () < deadline:
+                time.sleep (0.05)
+            assert not manager.get_status () ["server_thread_alive"]
+            assert not manager.is_running and manager.server is None
+        finally:
+            manager.stop ()
+            manager.port, manager.idle_timeout = 10110, 20.0
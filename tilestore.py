@@ -0,0 +1,181 @@
+''' Offline map tiles stored in a single MBTiles (SQLite) file.
+    One file is much faster to package (APK) and access than thousands of small
+    tile files. Recently used tiles are kept in memory (LRU).
+    The tiles directory (tiles/{z}/{x}/{y}.png) can be converted with
+        python tilestore.py tiles tiles.mbtiles
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+import os
+import sys
+import sqlite3
+import threading
+from hashlib import sha1
+from collections import OrderedDict
+from types import NoneType
+
+TILE_CONTENT_TYPES = {"png" : "image/png", "jpg" : "image/jpeg",
+                      "jpeg" : "image/jpeg", "webp" : "image/webp"}
+
+class MBTilesStore:
+    ''' Read (and write) access to an MBTiles file. Safe to use from several threads.
+        Tiles are addressed with XYZ coordinates (as in tile URLs),
+        the MBTiles file itself uses TMS rows (flipped y). '''
+
+    def __init__ (self, file_name : str, cache_size : int = 512, read_only : bool = True):
+        ''' Parameters:
+                file_name   : the MBTiles file
+                cache_size  : number of tiles kept in memory
+                read_only   : set to False for creating/updating the file
+        '''
+        if read_only and not os.path.exists (file_name):
+            raise ValueError ("Tile store <" + file_name + "> not found")
+        self.__file_name = file_name
+        self.__cache_size = cache_size
+        self.__cache = OrderedDict [tuple [int, int, int], tuple [bytes, str]] ()
+        self.__lock = threading.Lock ()
+        if read_only:
+            uri = _sqlite_uri (file_name) + "?mode=ro"
+            self.__connection = sqlite3.connect (uri, uri=True, check_same_thread=False)
+        else:
+            self.__connection = sqlite3.connect (file_name, check_same_thread=False)
+            self.__connection.executescript (
+                "CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);" +\
+                "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER," +\
+                " tile_row INTEGER, tile_data BLOB);" +\
+                "CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles" +\
+                " (zoom_level, tile_column, tile_row);" +\
+                "CREATE UNIQUE INDEX IF NOT EXISTS metadata_index ON metadata (name);")
+        tile_format = self.get_metadata ("format")
+        self.__content_type = TILE_CONTENT_TYPES.get (tile_format or "png", "image/png")
+
+    def get_file_name (self) -> str:
+        ''' Returns the name of the MBTiles file '''
+        return self.__file_name
+
+    def get_content_type (self) -> str:
+        ''' Returns the MIME type of the tiles '''
+        return self.__content_type
+
+    def get_metadata (self, name : str) -> str | NoneType:
+        ''' Returns a metadata value (such as name, format, minzoom, maxzoom) '''
+        with self.__lock:
+            row = self.__connection.execute\
+                ("SELECT value FROM metadata WHERE name = ?", (name,)).fetchone ()
+        return row [0] if row is not None else None
+
+    def set_metadata (self, name : str, value : str | int | float):
+        ''' Set a metadata value '''
+        with self.__lock:
+            with self.__connection:
+                self.__connection.execute\
+                    ("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                     (name, str (value)))
+        if name == "format":
+            self.__content_type = TILE_CONTENT_TYPES.get (str (value), "image/png")
+
+    def get_tile (self, z : int, x : int, y : int) -> tuple [bytes, str] | NoneType:
+        ''' Returns the tile data and its ETag, or None if the tile is missing '''
+        key = (z, x, y)
+        with self.__lock:
+            tile = self.__cache.get (key)
+            if tile is not None:
+                self.__cache.move_to_end (key)
+                return tile
+            row = self.__connection.execute\
+                ("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ?" +\
+                 " AND tile_row = ?", (z, x, (1 << z) - 1 - y)).fetchone ()
+            if row is None:
+                return None
+            data = bytes (row [0])
+            tile = data, '"' + sha1 (data).hexdigest () [:20] + '"'
+            self.__cache [key] = tile
+            if len (self.__cache) > self.__cache_size:
+                self.__cache.popitem (last=False)
+            return tile
+
+    def has_tile (self, z : int, x : int, y : int) -> bool:
+        ''' Check if a tile is in the store '''
+        with self.__lock:
+            if (z, x, y) in self.__cache:
+                return True
+            row = self.__connection.execute\
+                ("SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ?" +\
+                 " AND tile_row = ?", (z, x, (1 << z) - 1 - y)).fetchone ()
+        return row is not None
+
+    def put_tiles (self, tiles : list [tuple [int, int, int, bytes]]):
+        ''' Add (or replace) tiles, given as (z, x, y, data), in one transaction '''
+        with self.__lock:
+            with self.__connection:
+                self.__connection.executemany\
+                    ("INSERT OR REPLACE INTO tiles" +\
+                     " (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                     [(z, x, (1 << z) - 1 - y, sqlite3.Binary (data)) for z, x, y, data in tiles])
+            for z, x, y, _ in tiles:
+                self.__cache.pop ((z, x, y), None)
+
+    def put_tile (self, z : int, x : int, y : int, data : bytes):
+        ''' Add (or replace) a tile '''
+        self.put_tiles ([(z, x, y, data)])
+
+    def count_tiles (self) -> int:
+        ''' Returns the number of tiles in the store '''
+        with self.__lock:
+            return self.__connection.execute ("SELECT COUNT(*) FROM tiles").fetchone () [0]
+
+    def close (self):
+        ''' Close the file '''
+        with self.__lock:
+            self.__cache.clear ()
+            self.__connection.close ()
+
+def _sqlite_uri (file_name : str) -> str:
+    ''' Returns a file URI for an SQLite file name '''
+    return "file:" + os.path.abspath (file_name).replace ("?", "%3f").replace ("#", "%23")
+
+def convert_tile_directory (directory : str, file_name : str, name : str = "Offline tiles",
+                            attribution : str = "", batch_size : int = 500) -> int:
+    ''' Convert a tile directory ({z}/{x}/{y}.png) into an MBTiles file.
+        Returns the number of converted tiles. '''
+    store = MBTilesStore (file_name, read_only=False)
+    batch = list [tuple [int, int, int, bytes]] ()
+    count = 0
+    tile_format = None
+    zooms = set [int] ()
+    for root, _, files in os.walk (directory):
+        parts = os.path.relpath (root, directory).split (os.sep)
+        if len (parts) != 2 or not all (p.isdigit () for p in parts):
+            continue
+        z, x = int (parts [0]), int (parts [1])
+        for f in files:
+            y, ext = os.path.splitext (f)
+            ext = ext.lstrip (".").lower ()
+            if not y.isdigit () or ext not in TILE_CONTENT_TYPES:
+                continue
+            tile_format = ext if tile_format is None else tile_format
+            with open (os.path.join (root, f), "rb") as tile_file:
+                batch.append ((z, x, int (y), tile_file.read ()))
+            zooms.add (z)
+            if len (batch) >= batch_size:
+                store.put_tiles (batch)
+                count += len (batch)
+                batch = []
+    store.put_tiles (batch)
+    count += len (batch)
+    store.set_metadata ("name", name)
+    store.set_metadata ("type", "baselayer")
+    store.set_metadata ("format", tile_format or "png")
+    store.set_metadata ("attribution", attribution)
+    if len (zooms) > 0:
+        store.set_metadata ("minzoom", min (zooms))
+        store.set_metadata ("maxzoom", max (zooms))
+    store.close ()
+    return count
+
+if __name__ == '__main__':
+    if len (sys.argv) == 3:
+        print ("Converted " + str (convert_tile_directory (sys.argv [1], sys.argv [2])) + " tiles")
+    else:
+        print ("Usage: python tilestore.py <tile directory> <mbtiles file>")
@@ -0,0 +1,196 @@
+''' Recursive position tracker (extended Kalman filter).
+    Fuses single sights (altitude measurements) with course/speed dead reckoning,
+    with constant work per update. Useful for live positions, e.g. for the plot server.
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+from math import sqrt, cos, sin, atan2
+from datetime import datetime
+from collections.abc import Callable
+
+from starfix import Sight, LatLon, LatLonGeocentric, LatLonGeodetic, ObserverFrame,\
+     calculate_time_hours, deg_to_rad, rad_to_deg, mod_lon, mod_course, takeout_course,\
+     distance_matrix
+
+################################################
+# Small matrix helpers (row-major nested lists)
+################################################
+
+def __mat_mult (m1 : list [list [float]], m2 : list [list [float]]) -> list [list [float]]:
+    ''' Product of two matrices '''
+    m2_t = list (zip (*m2))
+    return [[sum (a * b for a, b in zip (row, col)) for col in m2_t] for row in m1]
+
+def __mat_transpose (m : list [list [float]]) -> list [list [float]]:
+    ''' Transpose of a matrix '''
+    return [list (row) for row in zip (*m)]
+
+def identity_matrix (n : int) -> list [list [float]]:
+    ''' Identity matrix of size n '''
+    return [[1.0 if i == j else 0.0 for j in range (n)] for i in range (n)]
+
+def propagate_covariance (p : list [list [float]], f : list [list [float]],
+                          q : list [list [float]]) -> list [list [float]]:
+    ''' Return F P F^T + Q '''
+    fpf = __mat_mult (__mat_mult (f, p), __mat_transpose (f))
+    return [[fpf[i][j] + q[i][j] for j in range (len (p))] for i in range (len (p))]
+
+def scalar_update (p : list [list [float]], h : list [float], r : float)\
+        -> tuple [list [float], float, list [list [float]]]:
+    ''' Kalman update for a scalar measurement with Jacobian h and variance r.
+        Returns (gain, innovation variance, updated covariance) '''
+    n = len (p)
+    ph = [sum (p[i][j] * h[j] for j in range (n)) for i in range (n)]
+    s = sum (h[i] * ph[i] for i in range (n)) + r
+    k = [v / s for v in ph]
+    # Joseph form, to keep the covariance symmetric and positive definite
+    i_kh = [[(1.0 if i == j else 0.0) - k[i] * h[j] for j in range (n)] for i in range (n)]
+    new_p = __mat_mult (__mat_mult (i_kh, p), __mat_transpose (i_kh))
+    new_p = [[new_p[i][j] + k[i] * k[j] * r for j in range (n)] for i in range (n)]
+    return k, s, new_p
+
+################################################
+# The tracker
+################################################
+
+#pylint: disable=R0902
+class PositionTracker:
+    ''' Extended Kalman filter tracking the position of a vessel.
+        The state is the position (as north/east offsets, in nautical miles, from the
+        current position estimate), optionally extended with the velocity (north/east, knots).
+        Without velocity states the course and speed are taken as given (dead reckoning). '''
+
+#pylint: disable=R0913
+#pylint: disable=R0917
+    def __init__ (self, start_time : datetime, estimated_position : LatLonGeodetic,
+                  course_degrees : int | float, speed_knots : int | float,
+                  position_sigma_nm : float = 5.0,
+                  sight_sigma_nm : float = 1.0,
+                  dr_sigma_nm_per_hour : float = 1.0,
+                  estimate_velocity : bool = False,
+                  velocity_sigma_knots : float = 1.0,
+                  velocity_sigma_knots_per_hour : float = 0.5):
+        ''' Parameters:
+                start_time : Timestamp of the estimated position
+                estimated_position : The estimated (initial) position
+                course_degrees, speed_knots : The course and speed (dead reckoning)
+                position_sigma_nm : Standard deviation of the estimated position
+                sight_sigma_nm : Standard deviation of a sight (circle of equal altitude)
+                dr_sigma_nm_per_hour : Standard deviation of dead reckoning (random walk)
+                estimate_velocity : If set, course and speed are also estimated
+                velocity_sigma_knots : Standard deviation of the given speed (north/east)
+                velocity_sigma_knots_per_hour : Random walk of the velocity
+        '''
+        self.__time = start_time
+        self.__position = estimated_position.get_latlon()
+        self.__course_degrees = course_degrees
+        self.__speed_knots = speed_knots
+        self.__sight_sigma_nm = sight_sigma_nm
+        self.__dr_sigma_nm_per_hour = dr_sigma_nm_per_hour
+        self.__estimate_velocity = estimate_velocity
+        self.__velocity_sigma_knots_per_hour = velocity_sigma_knots_per_hour
+        self.__listeners = list [Callable] ()
+        n = 4 if estimate_velocity else 2
+        self.__covariance = identity_matrix (n)
+        for i in range (2):
+            self.__covariance [i][i] = position_sigma_nm**2
+        for i in range (2, n):
+            self.__covariance [i][i] = velocity_sigma_knots**2
+#pylint: enable=R0913
+#pylint: enable=R0917
+
+    def add_listener (self, listener : Callable [[datetime, LatLonGeocentric], None]):
+        ''' Add a function to be called (with time and position) after each update '''
+        self.__listeners.append (listener)
+
+    def get_time (self) -> datetime:
+        ''' Returns the timestamp of the current state '''
+        return self.__time
+
+    def get_course_speed (self) -> tuple [float, float]:
+        ''' Returns the current course (degrees) and speed (knots) '''
+        return self.__course_degrees, self.__speed_knots
+
+    def set_course_speed (self, course_degrees : int | float, speed_knots : int | float,
+                          time : datetime | None = None):
+        ''' Change course and speed (after moving the state to time, if given) '''
+        if time is not None:
+            self.predict (time)
+        self.__course_degrees = course_degrees
+        self.__speed_knots = speed_knots
+
+    def get_position (self, time : datetime | None = None,
+                      return_geodetic : bool = True) -> LatLon:
+        ''' Returns the current position, or the position extrapolated (dead reckoning)
+            to a later time. The state of the tracker is not changed. '''
+        position = self.__position
+        if time is not None:
+            position = takeout_course (position, self.__course_degrees, self.__speed_knots,
+                                       calculate_time_hours (self.__time, time))
+        if return_geodetic:
+            return LatLonGeodetic (ll = position)
+        return position
+
+    def get_covariance (self) -> list [list [float]]:
+        ''' Returns the covariance matrix of the state
+            (north and east in nautical miles, and optionally velocity in knots) '''
+        return [row [:] for row in self.__covariance]
+
+    def get_sigma_nm (self) -> float:
+        ''' Returns the (root mean square) position uncertainty in nautical miles '''
+        return sqrt (self.__covariance [0][0] + self.__covariance [1][1])
+
+    def predict (self, time : datetime):
+        ''' Move the state forward to time, using course and speed '''
+        dt = calculate_time_hours (self.__time, time)
+        if dt < 0:
+            raise ValueError ("Cannot move the tracker backwards in time")
+        if dt == 0:
+            return
+        self.__position = takeout_course (self.__position, self.__course_degrees,
+                                          self.__speed_knots, dt)
+        self.__position = LatLonGeocentric (self.__position.get_lat(),
+                                            mod_lon (self.__position.get_lon()))
+        q_pos = self.__dr_sigma_nm_per_hour**2 * dt
+        if self.__estimate_velocity:
+            f = identity_matrix (4)
+            f [0][2] = dt
+            f [1][3] = dt
+            q_vel = self.__velocity_sigma_knots_per_hour**2 * dt
+            q = [[q_pos, 0, 0, 0], [0, q_pos, 0, 0], [0, 0, q_vel, 0], [0, 0, 0, q_vel]]
+        else:
+            f = identity_matrix (2)
+            q = [[q_pos, 0], [0, q_pos]]
+        self.__covariance = propagate_covariance (self.__covariance, f, q)
+        self.__time = time
+
+    def update (self, sight : Sight) -> float:
+        ''' Update the state with a sight, after moving the state to the time of the sight.
+            Returns : The innovation (measured minus predicted), in nautical miles '''
+        self.predict (sight.get_time())
+        gp = sight.get_gp()
+        azimuth = deg_to_rad (ObserverFrame (self.__position).get_azimuth (gp))
+        distance = distance_matrix ([self.__position], [gp], nautical_miles=True)[0][0]
+        innovation = sight.get_angle (geodetic=False) * 60 - distance
+        # Moving towards the GP reduces the distance
+        h = [-cos (azimuth), -sin (azimuth)]
+        if self.__estimate_velocity:
+            h += [0.0, 0.0]
+        k, _, self.__covariance = scalar_update (self.__covariance, h,
+                                                 self.__sight_sigma_nm**2)
+        dn = k [0] * innovation
+        de = k [1] * innovation
+        lat = self.__position.get_lat() + dn / 60
+        lon = self.__position.get_lon() + de / (60 * cos (deg_to_rad (self.__position.get_lat())))
+        self.__position = LatLonGeocentric (lat, mod_lon (lon))
+        if self.__estimate_velocity:
+            course = deg_to_rad (self.__course_degrees)
+            vn = self.__speed_knots * cos (course) + k [2] * innovation
+            ve = self.__speed_knots * sin (course) + k [3] * innovation
+            self.__course_degrees = mod_course (rad_to_deg (atan2 (ve, vn)))
+            self.__speed_knots = sqrt (vn**2 + ve**2)
+        for listener in self.__listeners:
+            listener (self.__time, self.__position)
+        return innovation
+#pylint: enable=R0902
@@ -0,0 +1,333 @@
+''' Voyage-level position solver.
+    A whole passage (a time-ordered list of sights, and course/speed segments
+    for dead reckoning) is solved as one least-squares problem.
+    © August Linnman, 2025, email: august@linnman.net
+    MIT License (see LICENSE file)
+'''
+
+from math import sqrt, cos, sin, atan2, pi
+from datetime import datetime
+from types import NoneType
+
+from starfix import Sight, LatLon, LatLonGeocentric, LatLonGeodetic, ObserverFrame,\
+     IntersectError, calculate_time_hours, deg_to_rad, rad_to_deg, mod_lon,\
+     distance_matrix
+
+################################################
+# Small 2x2 matrix helpers (row-major nested lists)
+################################################
+
+def __mat_add (m1 : list [list [float]], m2 : list [list [float]]) -> list [list [float]]:
+    ''' Sum of two 2x2 matrices '''
+    return [[m1[0][0] + m2[0][0], m1[0][1] + m2[0][1]],
+            [m1[1][0] + m2[1][0], m1[1][1] + m2[1][1]]]
+
+def __mat_sub (m1 : list [list [float]], m2 : list [list [float]]) -> list [list [float]]:
+    ''' Difference of two 2x2 matrices '''
+    return [[m1[0][0] - m2[0][0], m1[0][1] - m2[0][1]],
+            [m1[1][0] - m2[1][0], m1[1][1] - m2[1][1]]]
+
+def __mat_mult (m1 : list [list [float]], m2 : list [list [float]]) -> list [list [float]]:
+    ''' Product of two 2x2 matrices '''
+    return [[m1[0][0]*m2[0][0] + m1[0][1]*m2[1][0], m1[0][0]*m2[0][1] + m1[0][1]*m2[1][1]],
+            [m1[1][0]*m2[0][0] + m1[1][1]*m2[1][0], m1[1][0]*m2[0][1] + m1[1][1]*m2[1][1]]]
+
+def __mat_transpose (m : list [list [float]]) -> list [list [float]]:
+    ''' Transpose of a 2x2 matrix '''
+    return [[m[0][0], m[1][0]], [m[0][1], m[1][1]]]
+
+def __mat_vec (m : list [list [float]], v : list [float]) -> list [float]:
+    ''' Product of a 2x2 matrix and a 2-vector '''
+    return [m[0][0]*v[0] + m[0][1]*v[1], m[1][0]*v[0] + m[1][1]*v[1]]
+
+def __mat_inverse (m : list [list [float]]) -> list [list [float]]:
+    ''' Inverse of a 2x2 matrix '''
+    det = m[0][0]*m[1][1] - m[0][1]*m[1][0]
+    if det == 0:
+        raise IntersectError ("Singular voyage equation system")
+    return [[m[1][1]/det, -m[0][1]/det], [-m[1][0]/det, m[0][0]/det]]
+
+#pylint: disable=R0914
+def solve_block_tridiagonal (diag : list [list [list [float]]],
+                             lower : list [list [list [float]]],
+                             rhs : list [list [float]],
+                             covariance : bool = True)\
+        -> tuple [list [list [float]], list [list [list [float]]] | NoneType]:
+    ''' Solve a symmetric block-tridiagonal system with 2x2 blocks in linear time.
+        Parameters:
+            diag  : The diagonal blocks A(k,k) (n items)
+            lower : The sub-diagonal blocks A(k+1,k) (n-1 items)
+            rhs   : The right hand side (n 2-vectors)
+            covariance : If set, also return the diagonal blocks of the inverse
+        Returns : (solution, diagonal blocks of the inverse or None) '''
+    n = len (diag)
+    assert len (lower) == n - 1
+    assert len (rhs) == n
+    # Forward elimination (Schur complements)
+    s_inv = []
+    y = []
+    for k in range (n):
+        s_k = diag [k]
+        y_k = rhs [k]
+        if k > 0:
+            b = lower [k-1]
+            bs = __mat_mult (b, s_inv [k-1])
+            s_k = __mat_sub (s_k, __mat_mult (bs, __mat_transpose (b)))
+            y_k = [y_k[0] - __mat_vec (bs, y [k-1])[0], y_k[1] - __mat_vec (bs, y [k-1])[1]]
+        s_inv.append (__mat_inverse (s_k))
+        y.append (y_k)
+    # Back substitution
+    x = [[0.0, 0.0]] * n
+    x [n-1] = __mat_vec (s_inv [n-1], y [n-1])
+    for k in range (n-2, -1, -1):
+        bt_x = __mat_vec (__mat_transpose (lower [k]), x [k+1])
+        x [k] = __mat_vec (s_inv [k], [y[k][0] - bt_x[0], y[k][1] - bt_x[1]])
+    if not covariance:
+        return x, None
+    # Backward sweep for the diagonal blocks of the inverse
+    cov = [[[0.0, 0.0], [0.0, 0.0]]] * n
+    cov [n-1] = s_inv [n-1]
+    for k in range (n-2, -1, -1):
+        g = __mat_mult (s_inv [k], __mat_transpose (lower [k]))
+        cov [k] = __mat_add (s_inv [k],
+                             __mat_mult (__mat_mult (g, cov [k+1]), __mat_transpose (g)))
+    return x, cov
+#pylint: enable=R0914
+
+################################################
+# Course segments
+################################################
+
+class CourseSegment:
+    ''' A course and speed (dead reckoning) valid from a point in time,
+        until the start of the next segment '''
+
+    def __init__ (self, start_time : datetime, course_degrees : int | float,
+                  speed_knots : int | float):
+        self.start_time     = start_time
+        self.course_degrees = course_degrees
+        self.speed_knots    = speed_knots
+
+    def __str__ (self) -> str:
+        return f"{self.start_time} : {self.course_degrees}° {self.speed_knots} kn"
+
+################################################
+# Voyage solutions
+################################################
+
+class VoyageEpoch:
+    ''' The estimated position at one point in time (epoch) of a voyage '''
+
+    def __init__ (self, time : datetime, position : LatLon, covariance : list [list [float]],
+                  sights : list [Sight]):
+        self.__time       = time
+        self.__position   = position
+        self.__covariance = covariance
+        self.__sights     = sights
+
+    def get_time (self) -> datetime:
+        ''' Returns the timestamp of this epoch '''
+        return self.__time
+
+    def get_position (self) -> LatLon:
+        ''' Returns the estimated position of this epoch '''
+        return self.__position
+
+    def get_sights (self) -> list [Sight]:
+        ''' Returns the sights taken at this epoch '''
+        return self.__sights
+
+    def get_covariance (self) -> list [list [float]]:
+        ''' Returns the 2x2 covariance matrix (north, east) in square nautical miles '''
+        return self.__covariance
+
+    def get_error_ellipse (self) -> tuple [float, float, float]:
+        ''' Returns the 1-sigma error ellipse as
+            (semi-major axis (nm), semi-minor axis (nm), orientation of major axis (degrees)) '''
+        (a, b), (_, c) = self.__covariance
+        half_trace = (a + c) / 2
+        root = sqrt (((a - c) / 2)**2 + b**2)
+        major = sqrt (max (half_trace + root, 0))
+        minor = sqrt (max (half_trace - root, 0))
+        orientation = rad_to_deg (atan2 (2*b, a - c) / 2) % 180
+        return major, minor, orientation
+
+    def __str__ (self) -> str:
+        major, minor, orientation = self.get_error_ellipse ()
+        return f"{self.__time} : {self.__position} " +\
+               f"(±{major:.2f}/{minor:.2f} nm, {orientation:.0f}°)"
+
+################################################
+# Voyage solver
+################################################
+
+class Voyage:
+    ''' A voyage, with sights taken at different times, and course/speed segments.
+        All positions (one per distinct sight time) are estimated together,
+        coupling the circles of equal altitude and the dead reckoning between sights.
+        The normal equations are block-tridiagonal, so the solution time grows
+        linearly with the number of sights. '''
+
+#pylint: disable=R0913
+#pylint: disable=R0917
+    def __init__ (self,
+                  sights : list [Sight],
+                  segments : list [CourseSegment],
+                  estimated_starting_point : LatLonGeodetic,
+                  sight_sigma_nm : float = 1.0,
+                  dr_sigma_nm_per_hour : float = 1.0,
+                  start_sigma_nm : float = 60.0):
+        ''' Parameters:
+                sights : The sights of the voyage (need not be ordered)
+                segments : The course/speed segments of the voyage
+                estimated_starting_point : Estimated position at the time of the first sight
+                sight_sigma_nm : Standard deviation of a sight (circle of equal altitude)
+                dr_sigma_nm_per_hour : Standard deviation of dead reckoning (random walk)
+                start_sigma_nm : Standard deviation of the estimated starting point
+        '''
+        if len (sights) == 0:
+            raise ValueError ("A voyage needs at least one sight")
+        if len (segments) == 0:
+            raise ValueError ("A voyage needs at least one course segment")
+        self.__segments = sorted (segments, key = lambda s : s.start_time)
+        self.__estimated_starting_point = estimated_starting_point.get_latlon()
+        self.__sight_sigma_nm = sight_sigma_nm
+        self.__dr_sigma_nm_per_hour = dr_sigma_nm_per_hour
+        self.__start_sigma_nm = start_sigma_nm
+        # Group the sights into epochs (distinct timestamps)
+        self.__epoch_times = []
+        self.__epoch_sights = []
+        for s in sorted (sights, key = lambda s : s.get_time()):
+            if len (self.__epoch_times) > 0 and self.__epoch_times [-1] == s.get_time():
+                self.__epoch_sights [-1].append (s)
+            else:
+                self.__epoch_times.append (s.get_time())
+                self.__epoch_sights.append ([s])
+#pylint: enable=R0913
+#pylint: enable=R0917
+
+    def __dead_reckoning (self, latlon : LatLonGeocentric, t1 : datetime, t2 : datetime)\
+          -> tuple [LatLonGeocentric, float]:
+        ''' Dead reckoning from t1 to t2, over the course segments (see takeout_course).
+            Returns the position, and the derivative of the longitude with
+            respect to the starting latitude. '''
+        lat = latlon.get_lat()
+        lon = latlon.get_lon()
+        d_lon_d_lat = 0.0
+        segs = self.__segments
+        t = t1
+        for i, seg in enumerate (segs):
+            seg_end = t2 if i == len (segs) - 1 else min (t2, segs [i+1].start_time)
+            if seg_end <= t:
+                continue
+            distance_degrees = seg.speed_knots * calculate_time_hours (t, seg_end) / 60
+            phi = deg_to_rad (lat)
+            diff_lon = sin (deg_to_rad (seg.course_degrees)) * distance_degrees
+            d_lon_d_lat += diff_lon * sin (phi) / (cos (phi)**2) * pi / 180
+            lat += cos (deg_to_rad (seg.course_degrees)) * distance_degrees
+            lon += diff_lon / cos (phi)
+            t = seg_end
+            if t >= t2:
+                break
+        return LatLonGeocentric (lat, mod_lon (lon)), d_lon_d_lat
+
+    @staticmethod
+    def __offset_nm (p_from : LatLon, p_to : LatLon) -> list [float]:
+        ''' Local (north, east) offset in nautical miles from p_from to p_to '''
+        diff_lon = (p_to.get_lon() - p_from.get_lon() + 180) % 360 - 180
+        return [60 * (p_to.get_lat() - p_from.get_lat()),
+                60 * diff_lon * cos (deg_to_rad (p_to.get_lat()))]
+
+#pylint: disable=R0914
+#pylint: disable=R0915
+    def solve (self, return_geodetic : bool = True, iter_limit : int = 20,
+               limit_nm : float = 0.0001) -> list [VoyageEpoch]:
+        ''' Solve the voyage with Gauss-Newton iterations.
+            Returns : One VoyageEpoch (position and covariance) per distinct sight time '''
+        n = len (self.__epoch_times)
+        # Initial track from dead reckoning
+        positions = [self.__estimated_starting_point]
+        for k in range (1, n):
+            positions.append (self.__dead_reckoning (positions [k-1], self.__epoch_times [k-1],
+                                                     self.__epoch_times [k])[0])
+        gps = [[s.get_gp() for s in sights] for sights in self.__epoch_sights]
+        radii = [[s.get_angle (geodetic=False) * 60 for s in sights]
+                 for sights in self.__epoch_sights]
+        w_sight = 1 / self.__sight_sigma_nm**2
+        w_start = 1 / self.__start_sigma_nm**2
+
+        cov = None
+        iter_count = 0
+        while True:
+            if iter_count >= iter_limit:
+                raise IntersectError ("Cannot solve the voyage")
+            iter_count += 1
+            diag = [[[0.0, 0.0], [0.0, 0.0]] for _ in range (n)]
+            lower = []
+            rhs = [[0.0, 0.0] for _ in range (n)]
+
+            # Prior (estimated starting point)
+            r = self.__offset_nm (self.__estimated_starting_point, positions [0])
+            diag [0][0][0] += w_start
+            diag [0][1][1] += w_start
+            rhs [0] = [-w_start * r[0], -w_start * r[1]]
+
+            for k in range (n):
+                # Circles of equal altitude. Moving towards the GP reduces the distance.
+                frame = ObserverFrame (positions [k])
+                distances = distance_matrix ([positions [k]], gps [k], nautical_miles=True)[0]
+                for az, d, radius in zip (frame.get_azimuths (gps [k]), distances, radii [k]):
+                    j = [-cos (deg_to_rad (az)), -sin (deg_to_rad (az))]
+                    r_s = d - radius
+                    for a in range (2):
+                        rhs [k][a] -= w_sight * j[a] * r_s
+                        for b in range (2):
+                            diag [k][a][b] += w_sight * j[a] * j[b]
+                if k == n - 1:
+                    break
+                # Dead reckoning to the next epoch
+                dt = calculate_time_hours (self.__epoch_times [k], self.__epoch_times [k+1])
+                w_dr = 1 / (self.__dr_sigma_nm_per_hour**2 * max (dt, 1/3600))
+                dr_pos, d_lon_d_lat = self.__dead_reckoning\
+                    (positions [k], self.__epoch_times [k], self.__epoch_times [k+1])
+                r = self.__offset_nm (dr_pos, positions [k+1])
+                cos_next = cos (deg_to_rad (positions [k+1].get_lat()))
+                cos_this = cos (deg_to_rad (positions [k].get_lat()))
+                # Jacobian of the residual with respect to (north, east) of epoch k
+                # (the Jacobian with respect to epoch k+1 is the identity)
+                j_k = [[-1.0, 0.0], [-cos_next * d_lon_d_lat, -cos_next / cos_this]]
+                j_k_t = [[j_k[0][0], j_k[1][0]], [j_k[0][1], j_k[1][1]]]
+                for a in range (2):
+                    rhs [k][a]   -= w_dr * (j_k_t[a][0] * r[0] + j_k_t[a][1] * r[1])
+                    rhs [k+1][a] -= w_dr * r[a]
+                    for b in range (2):
+                        diag [k][a][b] += w_dr * (j_k_t[a][0] * j_k[0][b] +\
+                                                  j_k_t[a][1] * j_k[1][b])
+                diag [k+1][0][0] += w_dr
+                diag [k+1][1][1] += w_dr
+                lower.append ([[w_dr * j_k[0][0], w_dr * j_k[0][1]],
+                               [w_dr * j_k[1][0], w_dr * j_k[1][1]]])
+
+            steps, cov = solve_block_tridiagonal (diag, lower, rhs, covariance=True)
+            max_step = 0.0
+            for k in range (n):
+                dn, de = steps [k]
+                lat = positions [k].get_lat() + dn / 60
+                lon = positions [k].get_lon() +\
+                      de / (60 * cos (deg_to_rad (positions [k].get_lat())))
+                positions [k] = LatLonGeocentric (lat, mod_lon (lon))
+                max_step = max (max_step, abs (dn), abs (de))
+            if max_step < limit_nm:
+                break
+
+        assert cov is not None
+        retval = []
+        for k in range (n):
+            position = positions [k]
+            if return_geodetic:
+                position = LatLonGeodetic (ll = position)
+            retval.append (VoyageEpoch (self.__epoch_times [k], position, cov [k],
+                                        self.__epoch_sights [k]))
+        return retval
+#pylint: enable=R0914
+#pylint: enable=R0915